@@ -1,11 +1,25 @@
+import os
 from flask import Flask, request, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from auth import register_user, login_user, token_required, set_password, reset_request
-from utils.db import init_db, fetch_knowledge_base
-from utils.jwt_utils import decode_access_token
-from web_crawler import save_summary_to_db, crawl_major_pages, get_summaries, get_summary_by_website_id, chatbot
+from utils.db import init_db, fetch_knowledge_base, get_pool_stats, get_export_pool_stats
+from utils.bm25 import index_cache_stats
+from utils.faq import faq_match_stats
+from utils.response_cache import response_cache_stats
+from utils.conversation_log import conversation_writer_stats
+from utils.context_cache import context_cache_stats
+from utils.jwt_utils import decode_access_token, token_cache_stats
+from utils.passwords import password_stats
+from web_crawler import get_summaries, get_summary_by_website_id, chatbot, chatbot_stream, add_training_data_route
+from crawl_jobs import enqueue_crawl_job, get_crawl_job_status, start_in_process_workers
+from config import Config
 
 
 app = Flask(__name__)
+# Behind nginx, request.remote_addr is the proxy; take the client from
+# X-Forwarded-For, trusting only as many hops as there are proxies in front.
+if Config.TRUSTED_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.TRUSTED_PROXY_HOPS, x_proto=Config.TRUSTED_PROXY_HOPS)
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -40,14 +54,20 @@ def crawl(user_id):
     if not base_url:
         return jsonify({'error': 'base_url is required'}), 400
 
+    # The crawl runs on a worker; poll GET /crawl/<job_id> for its status
     try:
-        summaries = crawl_major_pages(base_url, max_pages)
-        save_summary_to_db(base_url, summaries, user_id)
-        return jsonify({'message': 'Crawling completed', 'data': summaries})
+        job_id = enqueue_crawl_job(user_id, base_url, max_pages)
+        return jsonify({'message': 'Crawl queued', 'job_id': job_id}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/crawl/<int:job_id>', methods=['GET'])
+@token_required
+def crawl_status(user_id, job_id):
+    return get_crawl_job_status(user_id, job_id)
+
+
 @app.route('/summaries', methods=['GET'])
 @token_required
 def get_summaries_route(user_id):
@@ -97,27 +117,58 @@ def generate_snippet(user_id, website_id):
         // Clear input
         inputField.value = '';
 
-        // Send message to the Flask server
-        fetch('/chat', {{
+        var botMessage = document.createElement('div');
+        botMessage.textContent = "Bot: ";
+        messagesContainer.appendChild(botMessage);
+
+        // Send message to the Flask server and show the answer as it streams in
+        fetch('/chat/stream', {{
             method: 'POST',
             headers: {{
-                'Content-Type': 'application/json'
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
             }},
             body: JSON.stringify({{
                 message: message, 
                 website_id: {website_id}
             }})
         }})
-        .then(response => response.json())
-        .then(data => {{
-            var botMessage = document.createElement('div');
-            botMessage.textContent = "Bot: " + (data.response || data.error || "No response");
-            messagesContainer.appendChild(botMessage);
+        .then(response => {{
+            if (!response.ok || !response.body) {{
+                return response.json().then(data => {{
+                    botMessage.textContent = "Bot: " + (data.response || data.error || "No response");
+                }});
+            }}
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = '';
+            function handleEvent(block) {{
+                var event = 'message', data = '';
+                block.split('\\n').forEach(line => {{
+                    if (line.startsWith('event: ')) event = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }});
+                if (!data) return;
+                var payload = JSON.parse(data);
+                if (event === 'token') botMessage.textContent += payload.token;
+                else if (event === 'done') botMessage.textContent = "Bot: " + payload.response;
+                else if (event === 'error') botMessage.textContent += " [" + payload.error + "]";
+                messagesContainer.scrollTop = messagesContainer.scrollHeight;
+            }}
+            function read() {{
+                return reader.read().then(result => {{
+                    if (result.done) return;
+                    buffer += decoder.decode(result.value, {{stream: true}});
+                    var blocks = buffer.split('\\n\\n');
+                    buffer = blocks.pop();
+                    blocks.forEach(handleEvent);
+                    return read();
+                }});
+            }}
+            return read();
         }})
         .catch(error => {{
-            var botMessage = document.createElement('div');
             botMessage.textContent = "Bot: Error connecting to the server.";
-            messagesContainer.appendChild(botMessage);
         }});
     }}
     </script>
@@ -125,12 +176,23 @@ def generate_snippet(user_id, website_id):
     """
     return jsonify({'snippet': snippet})
 
+@app.route('/training_data/<int:website_id>', methods=['POST'])
+@token_required
+def training_data_route(user_id, website_id):
+    return add_training_data_route(user_id, website_id)
+
 @app.route('/chat', methods=['POST'])
 @token_required
 def chatbot_route(user_id):
     response = chatbot(user_id)
     return response
 
+@app.route('/chat/stream', methods=['POST'])
+@token_required
+def chatbot_stream_route(user_id):
+    # Same as /chat, answered as Server-Sent Events while it is generated
+    return chatbot_stream(user_id)
+
 
 
 
@@ -150,8 +212,37 @@ def dashboard(user_id):
     return jsonify({"message": f"Welcome to your dashboard, User {user_id}!"})
 
 
+@app.route('/health/db', methods=['GET'])
+def db_health():
+    # Connection pool counters for this worker process
+    return jsonify(get_pool_stats())
+
+
+@app.route('/stats', methods=['GET'])
+def worker_stats():
+    # Cache and matcher counters for this worker process
+    return jsonify({
+        'db_pool': get_pool_stats(),
+        'db_export_pool': get_export_pool_stats(),
+        'bm25_index_cache': index_cache_stats(),
+        'faq_matcher': faq_match_stats(),
+        'response_cache': response_cache_stats(),
+        'conversation_writer': conversation_writer_stats(),
+        'website_context_cache': context_cache_stats(),
+        'verified_tokens': token_cache_stats(),
+        'passwords': password_stats(),
+    })
+
+
 
 if __name__ == '__main__':
+    # Development server only. In production run `python serve.py`, which keeps
+    # slow chat requests on their own worker threads (see serve.py).
     init_db()
     fetch_knowledge_base()
+    # Dev mode: run crawl workers alongside the web server (only in the reloader's
+    # serving child). `python serve.py` does not start them unless asked to
+    # (--crawl-workers); run `python crawl_jobs.py` instead.
+    if Config.CRAWL_WORKERS_IN_PROCESS and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_in_process_workers()
     app.run(debug=True)
\ No newline at end of file
@@ -1,32 +1,53 @@
 from flask import request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
 from utils.db import get_db_connection
-from utils.jwt_utils import generate_access_token, decode_access_token
+from utils.jwt_utils import generate_access_token, decode_access_token, revoke_user_tokens
+from utils.passwords import HashingBusy, admit_password_attempt, get_hasher
 from functools import wraps
 import datetime
+import math
 import secrets
 
+
+def _too_many_attempts(username=None):
+    """A 429 response if this client (or username) is out of password attempts, else None."""
+    retry_after = admit_password_attempt(request.remote_addr, username)
+    if not retry_after:
+        return None
+    response = jsonify({"error": "Too many attempts, please try again later"})
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response, 429
+
+
+def _hashing_busy():
+    response = jsonify({"error": "Server busy, please try again"})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 def register_user():
     data = request.get_json()
-    password_hash = generate_password_hash(data['password'])
+    rejected = _too_many_attempts()
+    if rejected:
+        return rejected
+    try:
+        password_hash = get_hasher().hash(data['password'])
+    except HashingBusy:
+        return _hashing_busy()
 
-    conn  =get_db_connection()
-    cursor = conn.cursor()
     try:
-        cursor.execute('''
-            INSERT INTO users (first_name, last_name, username, email, country_code, mobile_number,
-                               company_name, city, state, country, medicare_bot_usage, package, 
-                               email_verified, password_hash, account_status)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (data['first_name'], data['last_name'], data['username'], data['email'], 
-              data['country_code'], data['mobile_number'], data['company_name'], 
-              data['city'], data['state'], data['country'], data['medicare_bot_usage'], 
-              data['package'], data.get('email_verified', False), password_hash, 'active'))
-        conn.commit()
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO users (first_name, last_name, username, email, country_code, mobile_number,
+                                   company_name, city, state, country, medicare_bot_usage, package, 
+                                   email_verified, password_hash, account_status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (data['first_name'], data['last_name'], data['username'], data['email'], 
+                  data['country_code'], data['mobile_number'], data['company_name'], 
+                  data['city'], data['state'], data['country'], data['medicare_bot_usage'], 
+                  data['package'], data.get('email_verified', False), password_hash, 'active'))
     except Exception as e:
         return jsonify({"error": str(e)}), 400
-    finally:
-        conn.close()
     return jsonify({"success": True, "message": "User registered successfully"})
 
 
@@ -35,20 +56,45 @@ def login_user():
     username = data['username']
     password = data['password']
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username= %s',(username,))
-    user = cursor.fetchone()
-    conn.close()
+    rejected = _too_many_attempts(username)
+    if rejected:
+        return rejected
 
-    if user and check_password_hash(user[14], password):
-        user_id = user[0]
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, password_hash FROM users WHERE username = %s', (username,))
+        user = cursor.fetchone()
+
+    hasher = get_hasher()
+    try:
+        # Unknown usernames are checked against a dummy hash, so they take as long as real ones
+        verified = hasher.verify(user[1] if user else None, password)
+    except HashingBusy:
+        return _hashing_busy()
+
+    if verified:
+        user_id, password_hash = user
+        if hasher.needs_rehash(password_hash):
+            _upgrade_password_hash(user_id, password_hash, password)
         token = generate_access_token(user_id)
         print(token)
         return jsonify({'message':'Login successful', 'token' : token})
     return jsonify({"error": "Invalid credentials"}), 401
 
 
+def _upgrade_password_hash(user_id, old_hash, password):
+    """Re-hash a password made with outdated parameters; the login succeeds either way."""
+    try:
+        new_hash = get_hasher().hash(password)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # Leave it alone if the password was reset in the meantime
+            cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s',
+                           (new_hash, user_id, old_hash))
+    except Exception as e:
+        print(f"Error upgrading password hash for user {user_id}: {e}")
+
+
 def token_required(f):
     """Decorator function to protect routes with JWT token"""
     @wraps(f)
@@ -79,27 +125,25 @@ def reset_request():
     email = data.get('email')
 
     # Fetch user from the database using email
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
-    user = cursor.fetchone()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM users WHERE email = %s', (email,))
+        user = cursor.fetchone()
 
-    if not user:
-        return jsonify({"message": "User not found"}), 404
+        if not user:
+            return jsonify({"message": "User not found"}), 404
 
-    user_id = user[0]
+        user_id = user[0]
 
-    # Generate a secure token
-    token = secrets.token_urlsafe(32)
-    expiration = datetime.datetime.now() + datetime.timedelta(hours=1)  # Token valid for 1 hour
+        # Generate a secure token
+        token = secrets.token_urlsafe(32)
+        expiration = datetime.datetime.now() + datetime.timedelta(hours=1)  # Token valid for 1 hour
 
-    # Store the token in the database
-    cursor.execute('''
-        INSERT INTO password_reset_tokens (user_id, token, expiration)
-        VALUES (%s, %s, %s)
-    ''', (user_id, token, expiration))
-    conn.commit()
-    conn.close()
+        # Store the token in the database
+        cursor.execute('''
+            INSERT INTO password_reset_tokens (user_id, token, expiration)
+            VALUES (%s, %s, %s)
+        ''', (user_id, token, expiration))
 
     # Send the reset link to the user's email (mocking the email sending here)
     reset_link = f"http://localhost:5000/reset_password?token={token}"
@@ -117,29 +161,38 @@ def set_password():
     if not token or not new_password:
         return jsonify({"message": "Token and new password are required"}), 400
 
-    # Validate the token
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id, expiration FROM password_reset_tokens WHERE token = %s', (token,))
-    token_data = cursor.fetchone()
-
-    if not token_data:
-        return jsonify({"message": "Invalid or expired token"}), 400
+    rejected = _too_many_attempts()
+    if rejected:
+        return rejected
 
-    user_id, expiration = token_data
-    if datetime.datetime.now() > expiration:
-        return jsonify({"message": "Token has expired"}), 400
+    # Validate the token
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT user_id, expiration FROM password_reset_tokens WHERE token = %s', (token,))
+        token_data = cursor.fetchone()
 
-    # Hash the new password
-    hashed_password = generate_password_hash(new_password)
+        if not token_data:
+            return jsonify({"message": "Invalid or expired token"}), 400
 
-    # Update the user's password
-    cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s', (hashed_password, user_id))
-    conn.commit()
+        user_id, expiration = token_data
+        if datetime.datetime.now() > expiration:
+            return jsonify({"message": "Token has expired"}), 400
 
-    # Delete the used token
-    cursor.execute('DELETE FROM password_reset_tokens WHERE token = %s', (token,))
-    conn.commit()
-    conn.close()
+    # Hash the new password without holding a connection
+    try:
+        hashed_password = get_hasher().hash(new_password)
+    except HashingBusy:
+        return _hashing_busy()
+
+    # Use up the token and update the user's password in one transaction
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM password_reset_tokens WHERE token = %s RETURNING user_id', (token,))
+        if not cursor.fetchone():
+            # Already used by a concurrent request
+            return jsonify({"message": "Invalid or expired token"}), 400
+        cursor.execute('UPDATE users SET password_hash = %s WHERE id = %s', (hashed_password, user_id))
+        # Sessions opened with the old password stop working
+        revoke_user_tokens(cursor, user_id)
 
     return jsonify({"message": "Password has been reset successfully."})
@@ -0,0 +1,120 @@
+"""
+Pages/sec and peak memory of HTML text and link extraction.
+
+Compares the crawler's previous path (BeautifulSoup with html.parser, then
+clean_text and find_all over the tree) with each installed engine of
+utils.html_extract. Every engine runs in a fresh subprocess so its peak RSS
+is measured in isolation. Pass a directory of saved .html pages, or let the
+script generate a synthetic corpus of small, medium and very large pages.
+
+    python benchmarks/bench_html_extract.py --corpus ~/saved_pages
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils import html_extract  # noqa: E402
+
+
+WORDS = ('medicare plan coverage doctor visit hospital claim benefit premium enrollment provider '
+         'patient prescription drug appointment insurance deductible copay network referral').split()
+
+
+def write_synthetic_corpus(directory, count, seed=0):
+    rng = random.Random(seed)
+    nav = ''.join(f'<li><a href="/section-{number}">Section {number}</a></li>' for number in range(40))
+    for index in range(count):
+        paragraphs = rng.choice((10, 50, 200, 2000))  # ~3 KB to ~1.5 MB
+        body = ''.join(
+            f'<div class="card"><h3>Item {number}</h3><p>{" ".join(rng.choice(WORDS) for _ in range(60))} '
+            f'<a href="/item/{number}?ref=list">details</a></p></div>'
+            for number in range(paragraphs)
+        )
+        html = (f'<!doctype html><html><head><title>Page {index}</title><script>{"var x = 1;" * 200}</script>'
+                f'<style>{".c {{color: red}}" * 200}</style></head><body><nav><ul>{nav}</ul></nav>'
+                f'<main>{body}</main><footer>Call 555-0100</footer></body></html>')
+        with open(os.path.join(directory, f'page-{index}.html'), 'w', encoding='utf-8') as fp:
+            fp.write(html)
+
+
+def load_corpus(directory):
+    bodies = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as fp:
+                bodies.append(fp.read())
+    return bodies
+
+
+def extract_beautifulsoup(body):
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(body.decode('utf-8', errors='replace'), 'html.parser')
+    hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+    for element in soup(['script', 'style', 'meta', 'link']):
+        element.decompose()
+    text = soup.get_text(separator=' ', strip=True)
+    return ' '.join(text.split()), hrefs
+
+
+def worker(engine, directory, repeat):
+    bodies = load_corpus(directory)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if engine == 'beautifulsoup':
+        extract = extract_beautifulsoup
+    else:
+        def extract(body):
+            return html_extract.extract_page(body, 'text/html; charset=utf-8', engine=engine)
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for body in bodies:
+            extract(body)
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'pages_per_sec': len(bodies) * repeat / elapsed,
+        'peak_mb': (peak_kb - baseline_kb) / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', help='directory of saved .html pages (default: synthetic)')
+    parser.add_argument('--pages', type=int, default=40, help='synthetic corpus size')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.worker, args.corpus, args.repeat)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.corpus
+        if not directory:
+            directory = tmp
+            write_synthetic_corpus(directory, args.pages)
+        bodies = load_corpus(directory)
+        print(f"{len(bodies)} pages, {sum(map(len, bodies)) / 1024 / 1024:.1f} MB, "
+              f"cap {html_extract.Config.CRAWL_MAX_PAGE_BYTES / 1024 / 1024:.1f} MB per page")
+
+        engines = ['beautifulsoup'] + [name for name, extract in html_extract.ENGINES.items() if extract]
+        for engine in engines:
+            output = subprocess.run(
+                [sys.executable, __file__, '--worker', engine, '--corpus', directory, '--repeat', str(args.repeat)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output)
+            print(f"  {engine:14s} {result['pages_per_sec']:8.1f} pages/s   peak +{result['peak_mb']:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
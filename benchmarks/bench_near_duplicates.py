@@ -0,0 +1,103 @@
+"""
+Unique-content pages crawled per max_pages, with and without near-duplicate
+detection, on a synthetic local site.
+
+Every article on the site is also served as a print view, a locale variant and
+two tag pages that differ in a few words, and the home page links to those
+variants before it links to the next article, as many CMSs do.
+
+    python benchmarks/bench_near_duplicates.py --articles 40 --max-pages 10,20,40
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import Config  # noqa: E402
+import web_crawler  # noqa: E402
+from utils import summarization, summary_cache  # noqa: E402
+from utils.summarization import FakeLLMBackend  # noqa: E402
+
+
+WORDS = ('medicare plan coverage doctor visit hospital claim benefit premium enrollment provider '
+         'patient prescription drug appointment insurance deductible copay network referral').split()
+VARIANTS = ('print', 'de', 'tag-a', 'tag-b')
+
+
+def build_site(articles, seed=0):
+    """Return {path: (content group, text, links)}."""
+    rng = random.Random(seed)
+    site = {}
+    home_links = []
+    for number in range(articles):
+        body = ' '.join(rng.choice(WORDS) for _ in range(300))
+        path = f'/article-{number}'
+        next_link = [f'/article-{number + 1}'] if number + 1 < articles else []
+        site[path] = (number, f'Article {number} {body}', next_link)
+        for variant in VARIANTS:
+            site[f'{path}/{variant}'] = (number, f'Article {number} {variant} view {body} updated', next_link)
+            home_links.append(f'{path}/{variant}')
+        home_links.append(path)
+    site['/'] = (-1, 'Welcome to our medicare resource site', home_links)
+    return site
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in site:
+                self.send_error(404)
+                return
+            _, text, links = site[self.path]
+            anchors = ''.join(f'<a href="{href}">link</a>' for href in links)
+            body = f'<html><body><p>{text}</p>{anchors}</body></html>'.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--articles', type=int, default=40)
+    parser.add_argument('--max-pages', default='10,20,40')
+    args = parser.parse_args()
+
+    site = build_site(args.articles)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(site))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}/'
+    print(f"{len(site)} pages, {args.articles} distinct articles")
+
+    with mock.patch.object(summarization, 'get_backend', return_value=FakeLLMBackend(latency=0, seconds_per_token=0)), \
+            mock.patch.object(Config, 'SUMMARY_CACHE_SHARED', False), \
+            mock.patch('web_crawler.print', create=True, new=lambda *args, **kwargs: None):
+        for max_pages in [int(value) for value in args.max_pages.split(',')]:
+            for threshold in (0, Config.NEAR_DUPLICATE_THRESHOLD):
+                summary_cache._local.clear()
+                stats = {}
+                with mock.patch.object(Config, 'NEAR_DUPLICATE_THRESHOLD', threshold):
+                    started = time.perf_counter()
+                    results = web_crawler.crawl_major_pages(base_url, max_pages=max_pages, stats=stats)
+                    elapsed = time.perf_counter() - started
+                groups = {site[page['url'][len(base_url) - 1:]][0] for page in results} - {-1}
+                label = 'detection on ' if threshold else 'detection off'
+                print(f"max_pages {max_pages:4d}  {label}: {len(groups):4d} unique articles in "
+                      f"{len(results):4d} pages ({stats['near_duplicates']} near-duplicates skipped, "
+                      f"{stats['llm_requests']} LLM requests, {elapsed:.2f}s)")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Load test: /login latency while /chat is saturated, offline.
+
+Starts serve.py's server twice on a free port: once with chat sharing the
+API threads (--chat-threads 0, like a plain threaded server) and once with
+a separate chat lane. Chat clients keep every chat slot busy with slow
+answers from the fake LLM backend while a probe client measures /login.
+Login's database work is simulated with a fixed delay so no database is
+needed; pass --live with credentials to hit the real /login instead.
+
+    python benchmarks/bench_serving.py --seconds 10 --chat-latency 2
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from unittest import mock
+
+import requests
+from flask import jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as app_module  # noqa: E402
+import serve  # noqa: E402
+import web_crawler  # noqa: E402
+from utils.jwt_utils import generate_access_token  # noqa: E402
+from utils.llm import FakeLLMBackend  # noqa: E402
+
+
+CONTEXT = [{"role": "user", "content": "User asked: " + ' '.join(f'word{number}' for number in range(60))}]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure_logins(url, seconds, login_body, stop):
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline and not stop.is_set():
+        started = time.perf_counter()
+        requests.post(url + '/login', json=login_body)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.02)
+    return latencies
+
+
+def chat_client(url, headers, stop, counts):
+    while not stop.is_set():
+        response = requests.post(url + '/chat', json={'message': 'hello', 'website_id': 1}, headers=headers)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            time.sleep(float(response.headers.get('Retry-After', 1)))
+
+
+def run(label, args, chat_threads, login_body):
+    server = serve.make_server('127.0.0.1', 0, api_threads=args.api_threads,
+                               chat_threads=chat_threads, chat_queue=args.chat_queue)
+    url = f'http://127.0.0.1:{server.port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+    stop = threading.Event()
+    try:
+        idle = measure_logins(url, args.seconds / 2, login_body, stop)
+
+        counts = {}
+        clients = [threading.Thread(target=chat_client, args=(url, headers, stop, counts), daemon=True)
+                   for _ in range(args.chat_clients)]
+        for client in clients:
+            client.start()
+        time.sleep(args.chat_latency / 2)
+        saturated = measure_logins(url, args.seconds, login_body, threading.Event())
+    finally:
+        stop.set()
+        server.shutdown()
+        server.server_close()
+
+    for name, latencies in (('idle', idle), ('chat saturated', saturated)):
+        print(f"  {label:<22} {name:<15} /login p50 {statistics.median(latencies) * 1000:7.1f} ms  "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  ({len(latencies)} requests)")
+    print(f"  {label:<22} chat responses by status: {dict(sorted(counts.items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10, help='login measurement time under load')
+    parser.add_argument('--chat-latency', type=float, default=2, help='fake LLM seconds per answer')
+    parser.add_argument('--chat-clients', type=int, default=48)
+    parser.add_argument('--api-threads', type=int, default=16)
+    parser.add_argument('--chat-threads', type=int, default=32)
+    parser.add_argument('--chat-queue', type=int, default=8)
+    parser.add_argument('--login-delay', type=float, default=0.005, help='simulated login database time')
+    parser.add_argument('--live', action='store_true', help='call the real /login (needs the database)')
+    parser.add_argument('--username', default='demo')
+    parser.add_argument('--password', default='demo')
+    args = parser.parse_args()
+
+    def simulated_login():
+        time.sleep(args.login_delay)
+        return jsonify({"token": generate_access_token(1)})
+
+    patches = [
+        mock.patch.object(web_crawler, 'get_chat_backend',
+                          return_value=FakeLLMBackend(latency=args.chat_latency, seconds_per_token=0)),
+        mock.patch.object(web_crawler, '_prepare_chat', return_value=(None, CONTEXT, 1)),
+        mock.patch.object(web_crawler, '_save_chat_turn'),
+    ]
+    if not args.live:
+        patches.append(mock.patch.object(app_module, 'login_user', simulated_login))
+    for patcher in patches:
+        patcher.start()
+
+    print(f"{args.chat_clients} chat clients, {args.chat_latency}s per answer, "
+          f"{args.api_threads} API threads")
+    login_body = {'username': args.username, 'password': args.password}
+    run('shared threads', args, 0, login_body)
+    run(f'chat lane ({args.chat_threads}+{args.chat_queue})', args, args.chat_threads, login_body)
+
+
+if __name__ == '__main__':
+    main()
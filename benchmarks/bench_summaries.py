@@ -0,0 +1,148 @@
+"""
+Peak RSS of GET /summaries against the number of websites a user has.
+
+Compares the old handler (fetchall() of SELECT * and one jsonify() of every
+row) with the streamed one (server-side cursor, rows written out as they
+arrive). Rows come from an in-memory stand-in for Postgres that produces
+them lazily, the way a named cursor does; the old handler's fetchall()
+still materializes them all. Every measurement runs in a fresh process so
+ru_maxrss is that request's peak.
+
+    python benchmarks/bench_summaries.py --sites 100 500 2000 --summary-kb 20
+"""
+import argparse
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+class LazyCursor:
+    """Generates knowledge_base rows on demand instead of reading them from Postgres."""
+
+    def __init__(self, sites, summary_bytes):
+        self.sites = sites
+        self.summary_bytes = summary_bytes
+        self._rows = iter(())
+
+    def execute(self, sql, params=None):
+        match = re.search(r'SELECT (.*?) FROM', sql, re.S)
+        if not match:  # SET TRANSACTION
+            return
+        columns = [column.strip() for column in match.group(1).split(',')]
+        if columns == ['*']:
+            columns = ['id', 'website_url', 'summary', 'user_id', 'content_version']
+        after_id = params[1] if params and len(params) > 1 else 0
+        website_ids = range(after_id + 1, self.sites + 1)
+        if columns == ['id', 'content_version']:  # the ETag query reads plain tuples
+            self._rows = ((website_id, 1) for website_id in website_ids)
+        else:
+            self._rows = ({column: self._value(column, website_id) for column in columns}
+                          for website_id in website_ids)
+
+    def _value(self, column, website_id):
+        if column == 'summary':
+            return (f'Site {website_id} summary. ' * (self.summary_bytes // 16 + 1))[:self.summary_bytes]
+        if column == 'website_url':
+            return f'https://site{website_id}.example'
+        return website_id if column == 'id' else 1
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def fetchmany(self, size):
+        return [row for _, row in zip(range(size), self._rows)]
+
+
+class LazyConnection:
+
+    def __init__(self, sites, summary_bytes):
+        self.sites = sites
+        self.summary_bytes = summary_bytes
+
+    def cursor(self, name=None, cursor_factory=None):
+        return LazyCursor(self.sites, self.summary_bytes)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def measure(mode, sites, summary_bytes, query):
+    """Serve one /summaries request in this process and print its peak RSS and body size."""
+    from unittest import mock
+
+    from flask import jsonify
+
+    import web_crawler
+    from app import app
+    from utils.jwt_utils import generate_access_token
+
+    def old_get_summaries(user_id):
+        with web_crawler.get_export_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM knowledge_base WHERE user_id = %s', (user_id,))
+            rows = cursor.fetchall()
+        return jsonify(rows), 200
+
+    connection = LazyConnection(sites, summary_bytes)
+    patches = [mock.patch.object(web_crawler, 'get_export_connection', return_value=connection)]
+    if mode == 'old':
+        patches.append(mock.patch('app.get_summaries', old_get_summaries))
+    for patcher in patches:
+        patcher.start()
+
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    response = client.get('/summaries' + query, headers=headers, buffered=False)
+    size = sum(len(chunk) for chunk in response.iter_encoded())
+    response.close()
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'peak_kb': peak, 'growth_kb': peak - baseline, 'bytes': size, 'seconds': elapsed}))
+
+
+def run(mode, sites, summary_bytes, query=''):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', mode,
+                             '--sites', str(sites), '--summary-kb', str(summary_bytes / 1024), '--query', query],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--summary-kb', type=float, default=20)
+    parser.add_argument('--measure', choices=['old', 'streamed'], help=argparse.SUPPRESS)
+    parser.add_argument('--query', default='', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    summary_bytes = int(args.summary_kb * 1024)
+
+    if args.measure:
+        measure(args.measure, args.sites[0], summary_bytes, args.query)
+        return
+
+    print(f"{args.summary_kb:g} KiB summaries; peak RSS growth while serving one request")
+    print(f"  {'sites':>6} {'body MiB':>9} {'fetchall+jsonify':>17} {'streamed':>9} {'ids+urls':>9}")
+    for sites in args.sites:
+        old = run('old', sites, summary_bytes)
+        streamed = run('streamed', sites, summary_bytes)
+        slim = run('streamed', sites, summary_bytes, '?fields=website_url')
+        print(f"  {sites:>6} {old['bytes'] / 2 ** 20:>9.1f} {old['growth_kb'] / 1024:>13.1f} MiB "
+              f"{streamed['growth_kb'] / 1024:>5.1f} MiB {slim['growth_kb'] / 1024:>5.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
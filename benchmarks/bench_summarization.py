@@ -0,0 +1,76 @@
+"""
+Throughput and cost per crawled page of the summarization stage, offline.
+
+Runs utils.summarization against the fake LLM backend on a synthetic crawl
+with a realistic mix of page sizes, once the old way (one request per page,
+no packing) and once with the batched pipeline, and reports pages/s,
+requests, tokens and estimated cost per page.
+
+    python benchmarks/bench_summarization.py --pages 200 --latency 0.4
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from config import Config  # noqa: E402
+from utils.summarization import BatchSummarizer, FakeLLMBackend, TokenRateLimiter  # noqa: E402
+
+
+WORDS = ('medicare plan coverage doctor visit hospital claim benefit premium '
+         'enrollment provider patient prescription drug appointment insurance').split()
+
+
+def synthetic_pages(count, seed=0):
+    """Mostly short pages (contact, about, FAQ), some long ones and a few huge ones."""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        roll = rng.random()
+        words = rng.randint(50, 300) if roll < 0.7 else rng.randint(600, 2000) if roll < 0.95 else rng.randint(4000, 8000)
+        pages.append(' '.join(rng.choice(WORDS) for _ in range(words)))
+    return pages
+
+
+def run(pages, batch_size, args):
+    Config.SUMMARY_BATCH_SIZE = batch_size
+    backend = FakeLLMBackend(latency=args.latency, seconds_per_token=args.seconds_per_token)
+    limiter = TokenRateLimiter(args.tpm, args.concurrency)
+    started = time.perf_counter()
+    with BatchSummarizer(max_tokens=100, backend=backend, limiter=limiter, concurrency=args.concurrency) as summarizer:
+        futures = [summarizer.submit(page) for page in pages]
+        summarizer.flush()
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    stats = summarizer.stats
+    print(f"  batch size {batch_size}: {len(pages) / elapsed:7.1f} pages/s  "
+          f"{stats['requests']:4d} requests  "
+          f"{(stats['prompt_tokens'] + stats['completion_tokens']) / len(pages):7.0f} tokens/page  "
+          f"${summarizer.cost_estimate() / len(pages):.6f}/page  "
+          f"({stats['batched_pages']} packed, {stats['split_pages']} split)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.4, help='fake seconds per request')
+    parser.add_argument('--seconds-per-token', type=float, default=0.005, help='fake generation time')
+    parser.add_argument('--concurrency', type=int, default=Config.CRAWL_SUMMARY_CONCURRENCY)
+    parser.add_argument('--tpm', type=int, default=Config.LLM_TOKENS_PER_MINUTE, help='tokens per minute budget')
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages)
+    print(f"{len(pages)} pages, {sum(len(page) for page in pages) // 4} input tokens, "
+          f"concurrency {args.concurrency}, {args.tpm} tokens/min")
+    batch_size = Config.SUMMARY_BATCH_SIZE
+    run(pages, 1, args)
+    run(pages, batch_size, args)
+
+
+if __name__ == '__main__':
+    main()
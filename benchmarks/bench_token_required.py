@@ -0,0 +1,63 @@
+"""
+Per-request overhead of the token_required decorator.
+
+Calls a trivial protected view in a Flask request context, the way the chat
+widget hits /chat over and over with the same token, with the
+verified-token cache off (full HS256 verification every time) and on.
+
+    python benchmarks/bench_token_required.py --requests 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from flask import Flask  # noqa: E402
+
+from auth import token_required  # noqa: E402
+from config import Config  # noqa: E402
+from utils import jwt_utils  # noqa: E402
+from utils.jwt_utils import generate_access_token  # noqa: E402
+
+
+def run(label, requests, cached):
+    Config.JWT_CACHE_ENABLED = cached
+    jwt_utils._verified.clear()
+    app = Flask(__name__)
+    view = token_required(lambda user_id: user_id)
+    headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+
+    with app.test_request_context('/chat', headers=headers):
+        # Baseline: the same call without the decorator, to isolate its cost.
+        started = time.perf_counter()
+        for _ in range(requests):
+            (lambda user_id: user_id)('1')
+        baseline = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(requests):
+            view()
+        elapsed = time.perf_counter() - started
+
+    overhead = (elapsed - baseline) / requests * 1e6
+    print(f"  {label:<18} {overhead:7.2f} us/request  ({requests / elapsed:9.0f} requests/s)")
+    return overhead
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    enabled = Config.JWT_CACHE_ENABLED
+    print(f"{args.requests} requests with the same token")
+    before = run('jwt.decode', args.requests, False)
+    after = run('verified cache', args.requests, True)
+    print(f"  {before / after:.1f}x less decorator overhead")
+    Config.JWT_CACHE_ENABLED = enabled
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Query latency and resident memory of utils.vector_index at growing sizes.
+
+For each size a synthetic index of random unit vectors is written to a temp
+directory, then queried from a fresh subprocess twice: once memory-mapped (how
+workers use it) and once fully loaded into RAM, for comparison.
+
+    python benchmarks/bench_vector_index.py --sizes 10000,100000,1000000
+
+Measured at dim 256 on one CPU core (p50 query latency, private RSS):
+
+        chunks   mmap                  in RAM
+         10000    0.8 ms    1.7 MB      0.6 ms   11.5 MB
+        100000   16.0 ms    2.4 MB     16.0 ms  100.1 MB
+       1000000  155.1 ms    9.3 MB    164.9 ms  985.8 MB
+
+At a million chunks the 977 MB file stays shared through the page cache
+instead of being copied into every worker, but a brute-force scan costs
+about 150 ms per query; beyond that size an approximate index is needed.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utils.vector_index import VectorIndex  # noqa: E402
+
+
+def rss_mb():
+    """Resident memory split into private (anonymous) and file-backed MB."""
+    values = {}
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(('RssAnon:', 'RssFile:')):
+                name, kb = line.split()[:2]
+                values[name.rstrip(':')] = int(kb) / 1024
+    return values.get('RssAnon', float('nan')), values.get('RssFile', float('nan'))
+
+
+def write_synthetic_index(directory, size, dim, block=100_000):
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(0)
+    vectors = np.lib.format.open_memmap(os.path.join(directory, 'vectors.npy'), mode='w+',
+                                        dtype=np.float32, shape=(size, dim))
+    for start in range(0, size, block):
+        rows = rng.standard_normal((min(block, size - start), dim), dtype=np.float32)
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+        vectors[start:start + len(rows)] = rows
+    vectors.flush()
+    del vectors
+    np.save(os.path.join(directory, 'ids.npy'), np.arange(size, dtype=np.int64))
+
+
+def run_child(directory, mode, queries, k):
+    index = VectorIndex(directory)
+    before = rss_mb()
+    ids, vectors = index.load()
+    if mode == 'ram':
+        vectors = np.array(vectors)
+    rng = np.random.default_rng(1)
+    query_vectors = rng.standard_normal((queries, vectors.shape[1]), dtype=np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    index.search(query_vectors[0], k=k, ids=ids, vectors=vectors)  # warm the page cache
+    latencies = []
+    for query_vector in query_vectors:
+        started = time.perf_counter()
+        index.search(query_vector, k=k, ids=ids, vectors=vectors)
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    print(json.dumps({
+        'p50_ms': latencies[len(latencies) // 2],
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'private_mb': rss_mb()[0] - before[0],
+        'shared_mb': rss_mb()[1] - before[1],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000')
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--child', nargs=2, metavar=('DIRECTORY', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.queries, args.k)
+        return
+
+    print(f"{'chunks':>10} {'mode':>5} {'p50 ms':>9} {'p99 ms':>9} {'private MB':>11} {'shared MB':>10} {'file MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(value) for value in args.sizes.split(',')):
+            directory = os.path.join(tmp, str(size))
+            write_synthetic_index(directory, size, args.dim)
+            file_mb = os.path.getsize(os.path.join(directory, 'vectors.npy')) / 2 ** 20
+            for mode in ('mmap', 'ram'):
+                output = subprocess.run(
+                    [sys.executable, __file__, '--child', directory, mode,
+                     '--queries', str(args.queries), '--k', str(args.k)],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output)
+                print(f"{size:>10} {mode:>5} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                      f"{result['private_mb']:>11.1f} {result['shared_mb']:>10.1f} {file_mb:>9.1f}")
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,4 +7,141 @@ class Config:
     DB_PASSWORD = os.getenv('DB_PASSWORD', '1234')
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', '123')
     JWT_EXPIRATION_SECONDS = 180000
-    
\ No newline at end of file
+    JWT_CACHE_ENABLED = os.getenv('JWT_CACHE_ENABLED', 'true').lower() == 'true'
+    JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', 10000))  # verified tokens per worker
+    JWT_REVOCATION_CHECK_INTERVAL = float(os.getenv('JWT_REVOCATION_CHECK_INTERVAL', 30))  # seconds
+
+    # Password hashing and login admission control (utils.passwords)
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')  # older hashes are upgraded on login
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))  # hashing processes per worker
+    PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 16))  # pending hashes before 503
+    LOGIN_ATTEMPTS_PER_IP = int(os.getenv('LOGIN_ATTEMPTS_PER_IP', 30))  # per window, then 429
+    LOGIN_ATTEMPTS_PER_USERNAME = int(os.getenv('LOGIN_ATTEMPTS_PER_USERNAME', 10))
+    LOGIN_ATTEMPT_WINDOW = float(os.getenv('LOGIN_ATTEMPT_WINDOW', 60))  # seconds
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', 0))  # 1 behind nginx; limits key on X-Forwarded-For
+
+    # Connection pool (utils.db)
+    DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 0))
+    DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+    DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv('DB_POOL_HEALTHCHECK_INTERVAL', 30))
+    DB_EXPORT_POOL_SIZE = int(os.getenv('DB_EXPORT_POOL_SIZE', 4))  # held by streamed /summaries responses
+    DB_EXPORT_POOL_TIMEOUT = float(os.getenv('DB_EXPORT_POOL_TIMEOUT', 1))  # then 503
+
+    # Crawler (web_crawler.crawl_major_pages)
+    CRAWL_CONCURRENCY = int(os.getenv('CRAWL_CONCURRENCY', 8))
+    CRAWL_PER_HOST_LIMIT = int(os.getenv('CRAWL_PER_HOST_LIMIT', 4))
+    CRAWL_PER_HOST_DELAY = float(os.getenv('CRAWL_PER_HOST_DELAY', 0))
+    CRAWL_SUMMARY_CONCURRENCY = int(os.getenv('CRAWL_SUMMARY_CONCURRENCY', 4))
+    CRAWL_REQUEST_TIMEOUT = float(os.getenv('CRAWL_REQUEST_TIMEOUT', 10))
+    CRAWL_MAX_PAGE_BYTES = int(os.getenv('CRAWL_MAX_PAGE_BYTES', 2 * 1024 * 1024))  # rest of a page is ignored
+    HTML_PARSER = os.getenv('HTML_PARSER', 'auto')  # auto, selectolax, lxml or html.parser (utils.html_extract)
+
+    # Crawl job workers (crawl_jobs.py)
+    CRAWL_WORKERS = int(os.getenv('CRAWL_WORKERS', 2))
+    CRAWL_WORKERS_IN_PROCESS = os.getenv('CRAWL_WORKERS_IN_PROCESS', 'true').lower() == 'true'  # app.py dev server only
+    CRAWL_JOB_POLL_INTERVAL = float(os.getenv('CRAWL_JOB_POLL_INTERVAL', 2))
+    CRAWL_JOB_STALE_SECONDS = int(os.getenv('CRAWL_JOB_STALE_SECONDS', 600))
+    CRAWL_JOB_HEARTBEAT_INTERVAL = float(os.getenv('CRAWL_JOB_HEARTBEAT_INTERVAL', 30))  # well under STALE_SECONDS
+    CRAWL_JOB_MAX_ATTEMPTS = int(os.getenv('CRAWL_JOB_MAX_ATTEMPTS', 3))
+
+    # Knowledge chunks and chat retrieval (utils.knowledge)
+    KNOWLEDGE_CHUNK_SIZE = int(os.getenv('KNOWLEDGE_CHUNK_SIZE', 800))
+    KNOWLEDGE_CHUNK_OVERLAP = int(os.getenv('KNOWLEDGE_CHUNK_OVERLAP', 100))
+    KNOWLEDGE_TOP_K = int(os.getenv('KNOWLEDGE_TOP_K', 4))
+    BM25_CACHE_SIZE = int(os.getenv('BM25_CACHE_SIZE', 64))  # websites per worker
+
+    # Semantic retrieval (utils.vector_index)
+    KNOWLEDGE_RETRIEVER = os.getenv('KNOWLEDGE_RETRIEVER', 'hybrid')  # bm25, vector or hybrid
+    EMBEDDER = os.getenv('EMBEDDER', 'hashing')  # or 'module:ClassName'
+    EMBEDDING_DIM = int(os.getenv('EMBEDDING_DIM', 256))
+    VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR', 'data/vector_index')
+    VECTOR_INDEX_CACHE_SIZE = int(os.getenv('VECTOR_INDEX_CACHE_SIZE', 64))  # websites per worker
+
+    # Curated answer matching (utils.faq)
+    FAQ_MATCH_THRESHOLD = float(os.getenv('FAQ_MATCH_THRESHOLD', 0.6))  # trigram Jaccard similarity
+    FAQ_INDEX_CACHE_SIZE = int(os.getenv('FAQ_INDEX_CACHE_SIZE', 256))  # websites per worker
+
+    # Per-website chat context cache (utils.context_cache)
+    CONTEXT_CACHE_ENABLED = os.getenv('CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+    CONTEXT_CACHE_BYTES = int(os.getenv('CONTEXT_CACHE_BYTES', 64 * 1024 * 1024))  # per worker
+    CONTEXT_CACHE_LISTEN_TIMEOUT = float(os.getenv('CONTEXT_CACHE_LISTEN_TIMEOUT', 30))  # keepalive interval
+    CONTEXT_CACHE_RECONNECT_DELAY = float(os.getenv('CONTEXT_CACHE_RECONNECT_DELAY', 5))
+
+    # Chat response cache (utils.response_cache)
+    RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 10000))  # entries per worker
+
+    # Page summarization (utils.summarization)
+    SUMMARY_BACKEND = os.getenv('SUMMARY_BACKEND', 'openai')  # openai or fake
+    SUMMARY_BATCH_SIZE = int(os.getenv('SUMMARY_BATCH_SIZE', 5))  # pages packed per request
+    SUMMARY_BATCH_PAGE_TOKENS = int(os.getenv('SUMMARY_BATCH_PAGE_TOKENS', 600))  # larger pages go alone
+    SUMMARY_BATCH_WAIT = float(os.getenv('SUMMARY_BATCH_WAIT', 0.5))  # seconds a partial batch waits
+    SUMMARY_MAX_INPUT_TOKENS = int(os.getenv('SUMMARY_MAX_INPUT_TOKENS', 3000))  # larger pages are split
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))  # per process
+    LLM_TOKENS_PER_MINUTE = int(os.getenv('LLM_TOKENS_PER_MINUTE', 90000))  # per process
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+    LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', 1))
+    LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', 30))
+    LLM_COST_PER_1K_PROMPT_TOKENS = float(os.getenv('LLM_COST_PER_1K_PROMPT_TOKENS', 0.0005))
+    LLM_COST_PER_1K_COMPLETION_TOKENS = float(os.getenv('LLM_COST_PER_1K_COMPLETION_TOKENS', 0.0015))
+    FAKE_LLM_LATENCY = float(os.getenv('FAKE_LLM_LATENCY', 0.4))  # seconds per request
+    FAKE_LLM_SECONDS_PER_TOKEN = float(os.getenv('FAKE_LLM_SECONDS_PER_TOKEN', 0.005))
+
+    # Content-addressed summary cache (utils.summary_cache)
+    SUMMARY_CACHE_SHARED = os.getenv('SUMMARY_CACHE_SHARED', 'true').lower() == 'true'  # Postgres tier
+    SUMMARY_CACHE_SIZE = int(os.getenv('SUMMARY_CACHE_SIZE', 20000))  # entries per worker
+
+    # Near-duplicate pages (utils.near_duplicates)
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))  # MinHash Jaccard, 0 disables
+    NEAR_DUPLICATE_MIN_WORDS = int(os.getenv('NEAR_DUPLICATE_MIN_WORDS', 50))  # shorter pages are never dropped
+    NEAR_DUPLICATE_SHINGLE_SIZE = int(os.getenv('NEAR_DUPLICATE_SHINGLE_SIZE', 3))  # words per shingle
+    NEAR_DUPLICATE_NUM_PERM = int(os.getenv('NEAR_DUPLICATE_NUM_PERM', 128))
+    NEAR_DUPLICATE_BANDS = int(os.getenv('NEAR_DUPLICATE_BANDS', 32))
+    CRAWL_MAX_FETCH_FACTOR = int(os.getenv('CRAWL_MAX_FETCH_FACTOR', 3))  # fetch cap = max_pages * factor
+
+    # Boilerplate stripping (utils.boilerplate)
+    BOILERPLATE_MIN_PAGES = int(os.getenv('BOILERPLATE_MIN_PAGES', 3))  # a line on this many pages is boilerplate
+    BOILERPLATE_WARMUP_PAGES = int(os.getenv('BOILERPLATE_WARMUP_PAGES', 5))  # pages seen before summarizing
+
+    # Summaries listing (web_crawler.get_summaries)
+    SUMMARIES_MAX_LIMIT = int(os.getenv('SUMMARIES_MAX_LIMIT', 1000))  # largest page; no limit = stream everything
+    SUMMARIES_FETCH_SIZE = int(os.getenv('SUMMARIES_FETCH_SIZE', 50))  # rows per server-side cursor round trip
+    SUMMARIES_CACHE_CONTROL = os.getenv('SUMMARIES_CACHE_CONTROL', 'private, no-cache')  # revalidate with ETags
+
+    # Chatbot answers (web_crawler.chatbot)
+    CHAT_BACKEND = os.getenv('CHAT_BACKEND', 'openai')  # openai or fake (utils.llm)
+    CHAT_MAX_TOKENS = int(os.getenv('CHAT_MAX_TOKENS', 150))
+
+    # Chat prompt token budget (utils.prompt_builder)
+    PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', 3000))  # prompt tokens per chat request
+    PROMPT_PRIORITY = os.getenv('PROMPT_PRIORITY', 'knowledge,training,history')  # who gets leftover budget first
+    PROMPT_KNOWLEDGE_SHARE = float(os.getenv('PROMPT_KNOWLEDGE_SHARE', 0.5))  # reserved fractions of the budget
+    PROMPT_TRAINING_SHARE = float(os.getenv('PROMPT_TRAINING_SHARE', 0.3))
+    PROMPT_HISTORY_SHARE = float(os.getenv('PROMPT_HISTORY_SHARE', 0.2))
+    PROMPT_TOKENIZER_MODEL = os.getenv('PROMPT_TOKENIZER_MODEL', 'gpt-3.5-turbo')
+    PROMPT_TOKEN_CACHE_SIZE = int(os.getenv('PROMPT_TOKEN_CACHE_SIZE', 50000))  # cached token counts per worker
+    PROMPT_LOG_TOKENS = os.getenv('PROMPT_LOG_TOKENS', 'true').lower() == 'true'
+
+    # Write-behind conversation history (utils.conversation_log)
+    CONVERSATION_BATCH_SIZE = int(os.getenv('CONVERSATION_BATCH_SIZE', 100))
+    CONVERSATION_FLUSH_INTERVAL = float(os.getenv('CONVERSATION_FLUSH_INTERVAL', 0.5))  # seconds
+    CONVERSATION_QUEUE_SIZE = int(os.getenv('CONVERSATION_QUEUE_SIZE', 5000))
+    CONVERSATION_ENQUEUE_TIMEOUT = float(os.getenv('CONVERSATION_ENQUEUE_TIMEOUT', 1))  # then write inline
+    CONVERSATION_WRITE_RETRIES = int(os.getenv('CONVERSATION_WRITE_RETRIES', 2))
+    CONVERSATION_RETENTION_DAYS = int(os.getenv('CONVERSATION_RETENTION_DAYS', 90))  # older turns are archived; 0 = keep
+    CONVERSATION_ARCHIVE_BATCH = int(os.getenv('CONVERSATION_ARCHIVE_BATCH', 5000))
+    CONVERSATION_ARCHIVE_INTERVAL = float(os.getenv('CONVERSATION_ARCHIVE_INTERVAL', 3600))  # seconds between runs
+
+    # Production server (serve.py)
+    SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+    SERVER_PORT = int(os.getenv('SERVER_PORT', 5000))
+    SERVER_PROCESSES = int(os.getenv('SERVER_PROCESSES', 1))
+    SERVER_API_THREADS = int(os.getenv('SERVER_API_THREADS', 16))
+    SERVER_CHAT_THREADS = int(os.getenv('SERVER_CHAT_THREADS', 32))  # 0 = chat shares the API threads
+    SERVER_CHAT_QUEUE = int(os.getenv('SERVER_CHAT_QUEUE', 32))  # waiting chats before 503
+    SERVER_CHAT_PATHS = os.getenv('SERVER_CHAT_PATHS', '/chat')  # comma-separated path prefixes
+    SERVER_READ_TIMEOUT = float(os.getenv('SERVER_READ_TIMEOUT', 30))
+    SERVER_CLASSIFY_TIMEOUT = float(os.getenv('SERVER_CLASSIFY_TIMEOUT', 1))  # wait for a request line, then chat lane
+    SERVER_CRAWL_WORKERS = os.getenv('SERVER_CRAWL_WORKERS', 'false').lower() == 'true'  # crawl workers in serve.py
@@ -0,0 +1,272 @@
+"""
+Background crawl jobs.
+
+POST /crawl stores a row in the crawl_jobs table and returns straight away;
+workers claim queued rows with SELECT ... FOR UPDATE SKIP LOCKED, so the table
+itself is the queue and no external broker is needed. Workers run as threads
+inside the web process (Config.CRAWL_WORKERS_IN_PROCESS) or standalone:
+
+    python crawl_jobs.py --workers 4
+"""
+import argparse
+import signal
+import threading
+
+from flask import jsonify
+from psycopg2.extras import Json, RealDictCursor
+
+from config import Config
+from utils.conversation_log import archive_conversations
+from utils.db import get_db_connection
+from web_crawler import crawl_major_pages, load_crawl_state, save_summary_to_db
+
+
+# Wakes idle in-process workers as soon as a job is enqueued; out-of-process
+# workers fall back to polling every Config.CRAWL_JOB_POLL_INTERVAL seconds.
+_jobs_available = threading.Condition()
+
+
+def enqueue_crawl_job(user_id, base_url, max_pages):
+    """
+    Queue a crawl for the workers.
+
+    Returns:
+    - The ID of the new crawl_jobs row.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO crawl_jobs (user_id, base_url, max_pages)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        ''', (user_id, base_url, max_pages))
+        job_id = cursor.fetchone()[0]
+
+    with _jobs_available:
+        _jobs_available.notify()
+    return job_id
+
+
+def get_crawl_job_status(user_id, job_id):
+    """
+    Report the state of a crawl job owned by the authenticated user.
+
+    Parameters:
+    - user_id: The ID of the authenticated user.
+    - job_id: The ID of the crawl job.
+
+    Returns:
+    - JSON response with status, pages done, resulting website ID, error and,
+      once completed, crawl statistics such as the summary dedupe ratio.
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            cursor.execute('''
+                SELECT id, base_url, max_pages, status, pages_done, website_id, error,
+                       attempts, created_at, started_at, finished_at, stats
+                FROM crawl_jobs
+                WHERE id = %s AND user_id = %s
+            ''', (job_id, user_id))
+            job = cursor.fetchone()
+
+        if not job:
+            return jsonify({'message': 'Crawl job not found.'}), 404
+
+        return jsonify(job), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def claim_next_job():
+    """
+    Atomically take the oldest runnable job, or return None.
+
+    Jobs left 'running' by a worker that stopped heartbeating are retried until
+    Config.CRAWL_JOB_MAX_ATTEMPTS is reached, then marked failed.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute('''
+            UPDATE crawl_jobs
+            SET status = 'failed', error = 'Worker stopped responding', finished_at = NOW()
+            WHERE status = 'running'
+              AND heartbeat_at < NOW() - make_interval(secs => %s)
+              AND attempts >= %s
+        ''', (Config.CRAWL_JOB_STALE_SECONDS, Config.CRAWL_JOB_MAX_ATTEMPTS))
+        cursor.execute('''
+            UPDATE crawl_jobs
+            SET status = 'running', attempts = attempts + 1, pages_done = 0, error = NULL,
+                started_at = NOW(), heartbeat_at = NOW()
+            WHERE id = (
+                SELECT id FROM crawl_jobs
+                WHERE status = 'queued'
+                   OR (status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s))
+                ORDER BY id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, base_url, max_pages, attempts
+        ''', (Config.CRAWL_JOB_STALE_SECONDS,))
+        return cursor.fetchone()
+
+
+def _update_job(job, sql, params=()):
+    """
+    Run an UPDATE ending in `WHERE id = %s AND attempts = %s` for this attempt
+    of the job. Returns False if the job was reclaimed by another worker since.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params + (job['id'], job['attempts']))
+        return cursor.rowcount > 0
+
+
+def _heartbeat(job, stopped):
+    """Keep the job's heartbeat fresh while it runs, so no other worker reclaims it."""
+    while not stopped.wait(Config.CRAWL_JOB_HEARTBEAT_INTERVAL):
+        try:
+            if not _update_job(job, '''
+                UPDATE crawl_jobs SET heartbeat_at = NOW() WHERE id = %s AND attempts = %s
+            '''):
+                print(f"Crawl job {job['id']} was reclaimed by another worker")
+                return
+        except Exception as e:
+            print(f"Error recording heartbeat of crawl job {job['id']}: {e}")
+
+
+def run_job(job):
+    """Crawl, summarize and save one claimed job, recording progress and outcome."""
+    job_id = job['id']
+
+    def progress(pages_done):
+        _update_job(job, '''
+            UPDATE crawl_jobs SET pages_done = %s, heartbeat_at = NOW() WHERE id = %s AND attempts = %s
+        ''', (pages_done,))
+
+    # Heartbeats come from a timer, not from progress: the final summaries,
+    # the map-reduce and the save can take longer than CRAWL_JOB_STALE_SECONDS.
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, stopped), name=f'crawl-job-{job_id}-heartbeat',
+                                 daemon=True)
+    heartbeat.start()
+    try:
+        page_state = load_crawl_state(job['base_url'], job['user_id'])
+        stats = {}
+        summaries = crawl_major_pages(job['base_url'], job['max_pages'], progress=progress,
+                                      page_state=page_state, stats=stats)
+        website_id = save_summary_to_db(job['base_url'], summaries, job['user_id'])
+        if website_id is None:
+            raise RuntimeError('Saving the crawled summaries failed')
+    except Exception as e:
+        print(f"Crawl job {job_id} failed: {e}")
+        _update_job(job, '''
+            UPDATE crawl_jobs SET status = 'failed', error = %s, finished_at = NOW() WHERE id = %s AND attempts = %s
+        ''', (str(e),))
+        return
+    finally:
+        stopped.set()
+        heartbeat.join()
+
+    # A worker whose job was reclaimed must not overwrite the newer attempt.
+    if not _update_job(job, '''
+        UPDATE crawl_jobs SET status = 'completed', website_id = %s, stats = %s, finished_at = NOW()
+        WHERE id = %s AND attempts = %s
+    ''', (website_id, Json(stats))):
+        print(f"Crawl job {job_id} finished after being reclaimed; keeping the newer attempt's status")
+
+
+class CrawlWorkerPool:
+    """
+    A fixed set of worker threads that claim and run crawl jobs until stopped,
+    plus one thread archiving old chat history every
+    Config.CONVERSATION_ARCHIVE_INTERVAL seconds.
+    """
+
+    def __init__(self, workers=None, poll_interval=None):
+        self.workers = workers or Config.CRAWL_WORKERS
+        self.poll_interval = poll_interval or Config.CRAWL_JOB_POLL_INTERVAL
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'crawl-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._archive, name='conversation-archiver', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop claiming new jobs and wait for running ones to finish."""
+        self._stop.set()
+        with _jobs_available:
+            _jobs_available.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = claim_next_job()
+            except Exception as e:
+                print(f"Error claiming crawl job: {e}")
+                job = None
+
+            if job:
+                try:
+                    run_job(job)
+                except Exception as e:
+                    # Recording the outcome failed (e.g. the database is down). The job
+                    # stays 'running' and is reclaimed once its heartbeat goes stale.
+                    print(f"Error running crawl job {job['id']}: {e}")
+                    self._stop.wait(self.poll_interval)
+                continue
+
+            with _jobs_available:
+                if not self._stop.is_set():
+                    _jobs_available.wait(self.poll_interval)
+
+    def _archive(self):
+        while not self._stop.wait(Config.CONVERSATION_ARCHIVE_INTERVAL):
+            try:
+                archived = archive_conversations()
+                if archived:
+                    print(f"Archived {archived} conversation turns")
+            except Exception as e:
+                print(f"Error archiving conversation history: {e}")
+
+
+_in_process_pool = None
+
+
+def start_in_process_workers():
+    """Start crawl workers inside the current (web) process, once."""
+    global _in_process_pool
+    if _in_process_pool is None:
+        _in_process_pool = CrawlWorkerPool().start()
+    return _in_process_pool
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run crawl job workers.')
+    parser.add_argument('--workers', type=int, default=Config.CRAWL_WORKERS)
+    args = parser.parse_args()
+
+    pool = CrawlWorkerPool(workers=args.workers).start()
+    print(f"Started {pool.workers} crawl workers")
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    stopped.wait()
+
+    print("Stopping crawl workers, waiting for running jobs...")
+    pool.stop()
+
+
+if __name__ == '__main__':
+    main()
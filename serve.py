@@ -0,0 +1,273 @@
+"""
+Production entry point for the API (use instead of `python app.py`).
+
+Requests are served from two separate bounded thread pools ("lanes"):
+LLM-bound chat requests (Config.SERVER_CHAT_PATHS) run on the chat lane,
+everything else (login, summaries, CRUD) on the API lane, so a burst of slow
+chats can never take the threads that logins need. When the chat lane and
+its queue are full, further chats get an immediate 503 with Retry-After.
+
+A connection is only handed to a lane once its request line has arrived:
+one classifier thread waits for the request lines of all new connections.
+Clients that have not sent theirs within Config.SERVER_CLASSIFY_TIMEOUT go
+to the chat lane, so slow or idle clients never hold the API lane's threads.
+
+    python serve.py --processes 2 --api-threads 16 --chat-threads 32
+
+Each process has its own lanes and database pool; processes share the
+listening socket. Run crawl workers separately (`python crawl_jobs.py`), or
+pass --crawl-workers (Config.SERVER_CRAWL_WORKERS) to run them in the first
+process only; CRAWL_WORKERS_IN_PROCESS only applies to the development server
+(`python app.py`). SIGTERM/SIGINT stop accepting connections,
+let in-flight requests finish, write queued chat history and close the
+database pool.
+"""
+import argparse
+import json
+import os
+import queue
+import selectors
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from app import app
+from config import Config
+from crawl_jobs import start_in_process_workers
+from utils.conversation_log import close_writer
+from utils.db import close_pool, init_db
+from utils.passwords import close_hasher
+
+
+class OneRequestHandler(WSGIRequestHandler):
+    # One request per connection, so every request is routed to its lane.
+    # Reverse proxies such as nginx talk HTTP/1.0 to upstreams by default.
+    protocol_version = 'HTTP/1.0'
+
+
+class LaneWSGIServer(BaseWSGIServer):
+    """
+    WSGI server with a chat lane and an API lane of worker threads.
+
+    Parameters:
+    - api_threads: Threads for all non-chat requests.
+    - chat_threads: Threads for chat requests; 0 serves chat on the API lane.
+    - chat_queue: Chat requests allowed to wait for a chat thread before
+      new ones are rejected with 503.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, wsgi_app, api_threads=None, chat_threads=None, chat_queue=None):
+        super().__init__(host, port, wsgi_app, handler=OneRequestHandler)
+        api_threads = api_threads or Config.SERVER_API_THREADS
+        chat_threads = Config.SERVER_CHAT_THREADS if chat_threads is None else chat_threads
+        chat_queue = Config.SERVER_CHAT_QUEUE if chat_queue is None else chat_queue
+        self.chat_paths = tuple(path.strip() for path in Config.SERVER_CHAT_PATHS.split(',') if path.strip())
+        self.api_pool = ThreadPoolExecutor(max_workers=api_threads, thread_name_prefix='api')
+        self.chat_pool = ThreadPoolExecutor(max_workers=chat_threads, thread_name_prefix='chat') if chat_threads else None
+        self.chat_slots = threading.BoundedSemaphore(chat_threads + chat_queue) if chat_threads else None
+        # New connections travel from the accepting thread to the classifier.
+        self._unclassified = queue.SimpleQueue()
+        self._wakeup = self._wakeup_sender = None
+        self._classifier = None
+        self._closing = False
+
+    def serve_forever(self, poll_interval=0.5):
+        # Started here rather than in __init__: threads do not survive the fork in
+        # main(), and each process needs its own wakeup socket.
+        if self.chat_pool is not None and self._classifier is None:
+            self._wakeup, self._wakeup_sender = socket.socketpair()
+            self._classifier = threading.Thread(target=self._classify, name='classifier', daemon=True)
+            self._classifier.start()
+        super().serve_forever(poll_interval)
+
+    def process_request(self, request, client_address):
+        # Called on the accepting thread: hand the connection off right away.
+        if self.chat_pool is None:
+            self.api_pool.submit(self._handle, request, client_address)
+            return
+        self._unclassified.put((request, client_address))
+        self._wakeup_sender.send(b'\0')
+
+    def _request_path(self, request):
+        """
+        Peek at the request line without blocking.
+
+        Returns:
+        - The request path, '' for a request line without one, or None while
+          the request line is incomplete.
+
+        Raises:
+        - EOFError if the client closed the connection.
+        """
+        try:
+            head = request.recv(2048, socket.MSG_PEEK)
+        except BlockingIOError:
+            return None
+        if not head:
+            raise EOFError
+        if b'\n' not in head and len(head) < 2048:
+            return None
+        parts = head.split(b' ', 2)
+        return parts[1].decode('latin-1') if len(parts) > 1 else ''
+
+    def _classify(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wakeup, selectors.EVENT_READ)
+        deadlines = {}  # connection -> (client_address, time to give up waiting for its request line)
+        while not self._closing:
+            timeout = max(0.0, min(deadline for _, deadline in deadlines.values()) - time.monotonic()) \
+                if deadlines else None
+            for key, _ in selector.select(timeout):
+                if key.fileobj is self._wakeup:
+                    self._wakeup.recv(4096)
+                    while True:
+                        try:
+                            request, client_address = self._unclassified.get_nowait()
+                        except queue.Empty:
+                            break
+                        request.setblocking(False)
+                        selector.register(request, selectors.EVENT_READ)
+                        deadlines[request] = (client_address, time.monotonic() + Config.SERVER_CLASSIFY_TIMEOUT)
+                    continue
+
+                request = key.fileobj
+                try:
+                    path = self._request_path(request)
+                except (EOFError, OSError):
+                    selector.unregister(request)
+                    del deadlines[request]
+                    self.shutdown_request(request)
+                    continue
+                if path is not None:
+                    selector.unregister(request)
+                    self._route(request, deadlines.pop(request)[0], path)
+
+            now = time.monotonic()
+            for request, (client_address, deadline) in list(deadlines.items()):
+                if deadline <= now:
+                    # Still no request line: let a slow client wait on the chat lane, not the API lane.
+                    selector.unregister(request)
+                    del deadlines[request]
+                    self._route(request, client_address, None)
+
+        while not self._unclassified.empty():
+            deadlines[self._unclassified.get()[0]] = None
+        for request in deadlines:
+            self.shutdown_request(request)
+        selector.close()
+
+    def _route(self, request, client_address, path):
+        request.settimeout(Config.SERVER_READ_TIMEOUT)
+        if path is not None and not path.startswith(self.chat_paths):
+            self.api_pool.submit(self._handle, request, client_address)
+        elif self.chat_slots.acquire(blocking=False):
+            self.chat_pool.submit(self._handle_chat, request, client_address)
+        else:
+            self._reject(request)
+
+    def _handle_chat(self, request, client_address):
+        try:
+            self._handle(request, client_address)
+        finally:
+            self.chat_slots.release()
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _reject(self, request):
+        body = json.dumps({'error': 'The chatbot is busy, please retry shortly.'}).encode()
+        try:
+            request.sendall(
+                b'HTTP/1.0 503 Service Unavailable\r\nRetry-After: 1\r\nContent-Type: application/json\r\n'
+                b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body
+            )
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        if not self._closing:  # werkzeug's serve_forever closes the server too
+            self._closing = True
+            if self._classifier is not None:
+                self._wakeup_sender.send(b'\0')
+                self._classifier.join()
+                self._wakeup.close()
+                self._wakeup_sender.close()
+        # Finish in-flight requests before the process exits.
+        for pool in (self.api_pool, self.chat_pool):
+            if pool is not None:
+                pool.shutdown(wait=True)
+
+
+def make_server(host=None, port=None, **lanes):
+    return LaneWSGIServer(host or Config.SERVER_HOST, Config.SERVER_PORT if port is None else port, app, **lanes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the API with separate chat and API worker lanes.')
+    parser.add_argument('--host', default=Config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=Config.SERVER_PORT)
+    parser.add_argument('--processes', type=int, default=Config.SERVER_PROCESSES)
+    parser.add_argument('--api-threads', type=int, default=Config.SERVER_API_THREADS)
+    parser.add_argument('--chat-threads', type=int, default=Config.SERVER_CHAT_THREADS)
+    parser.add_argument('--chat-queue', type=int, default=Config.SERVER_CHAT_QUEUE)
+    parser.add_argument('--crawl-workers', action=argparse.BooleanOptionalAction, default=Config.SERVER_CRAWL_WORKERS,
+                        help='run crawl job workers in the first process')
+    args = parser.parse_args()
+
+    init_db()
+    # Children must not inherit the pool's connections: a child dropping the
+    # inherited pool would close the parent's backend over the shared socket.
+    close_pool()
+    server = make_server(args.host, args.port, api_threads=args.api_threads,
+                         chat_threads=args.chat_threads, chat_queue=args.chat_queue)
+
+    children = []
+    for _ in range(args.processes - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = None
+            break
+        children.append(pid)
+
+    # Only one process runs crawl workers; forked children serve requests only.
+    if args.crawl_workers and children is not None:
+        start_in_process_workers()
+
+    def stop(signum, frame):
+        for pid in children or ():
+            os.kill(pid, signal.SIGTERM)
+        # shutdown() waits for serve_forever, so it cannot run on this thread.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Serving on http://{args.host}:{server.port} (pid {os.getpid()}, "
+          f"{args.api_threads} API threads, {args.chat_threads} chat threads)")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        close_writer()
+        close_hasher()
+        close_pool()
+        for pid in children or ():
+            os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    main()
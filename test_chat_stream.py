@@ -0,0 +1,96 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+from werkzeug.serving import make_server
+
+import web_crawler
+from app import app
+from utils.jwt_utils import generate_access_token
+from utils.llm import FakeLLMBackend
+
+
+CONTEXT = [{"role": "user", "content": "User asked: " + ' '.join(f'word{number}' for number in range(30))}]
+
+
+def parse_events(lines):
+    events, event = [], None
+    for line in lines:
+        if line.startswith('event: '):
+            event = line[len('event: '):]
+        elif line.startswith('data: '):
+            events.append((event, json.loads(line[len('data: '):])))
+    return events
+
+
+class ChatStreamTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = make_server('127.0.0.1', 0, app, threaded=True)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.backend = FakeLLMBackend(latency=0.05, seconds_per_token=0.01)
+        self.saved = mock.Mock()
+        for patcher in (
+            mock.patch.object(web_crawler, 'get_chat_backend', return_value=self.backend),
+            mock.patch.object(web_crawler, '_prepare_chat', return_value=(None, CONTEXT, 7)),
+            mock.patch.object(web_crawler, '_save_chat_turn', self.saved),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+
+    def post(self, path, **headers):
+        return requests.post(self.url + path, json={'message': 'hello', 'website_id': 3},
+                             headers=dict(self.headers, **headers), stream=True)
+
+    def test_tokens_arrive_before_generation_finishes(self):
+        started = time.perf_counter()
+        response = self.post('/chat/stream')
+        lines = response.iter_lines(decode_unicode=True)
+        first_line = next(lines)
+        time_to_first_byte = time.perf_counter() - started
+        events = parse_events([first_line] + list(lines))
+        total = time.perf_counter() - started
+
+        self.assertEqual(response.headers['Content-Type'], 'text/event-stream; charset=utf-8')
+        self.assertLess(time_to_first_byte, total / 2)
+        tokens = [data['token'] for event, data in events if event == 'token']
+        self.assertGreater(len(tokens), 10)
+        self.assertEqual(events[-1], ('done', {'response': ''.join(tokens)}))
+        self.saved.assert_called_once_with(3, 7, 'hello', ''.join(tokens))
+
+    def test_accept_header_streams_from_chat(self):
+        response = self.post('/chat', Accept='text/event-stream')
+        events = parse_events(response.iter_lines(decode_unicode=True))
+        self.assertEqual(events[-1][0], 'done')
+
+    def test_cached_answer_is_streamed_at_once(self):
+        with mock.patch.object(web_crawler, '_prepare_chat', return_value=('Curated answer', None, 7)):
+            events = parse_events(self.post('/chat/stream').iter_lines(decode_unicode=True))
+        self.assertEqual(events, [('token', {'token': 'Curated answer'}), ('done', {'response': 'Curated answer'})])
+        self.saved.assert_not_called()
+
+    def test_failed_stream_is_not_saved(self):
+        def broken(context, max_tokens):
+            yield 'Partial'
+            raise RuntimeError('connection reset')
+
+        with mock.patch.object(self.backend, 'stream', broken):
+            events = parse_events(self.post('/chat/stream').iter_lines(decode_unicode=True))
+        self.assertEqual([event for event, _ in events], ['token', 'error'])
+        self.saved.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
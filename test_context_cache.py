@@ -0,0 +1,148 @@
+import socket
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from config import Config
+from utils import context_cache
+from utils.context_cache import ContextCache
+
+
+class FakeCursor:
+    """Answers the context queries for any website; `on_training` runs mid-load."""
+
+    def __init__(self, summary='Summary', on_training=None):
+        self.summary = summary
+        self.on_training = on_training
+        self.queries = 0
+        self._result = None
+
+    def execute(self, sql, params=None):
+        self.queries += 1
+        if 'FROM knowledge_base' in sql:
+            self._result = [(3, self.summary)] if params[0] != 404 else []
+        else:
+            if self.on_training:
+                self.on_training()
+            self._result = [(1, 'Do you accept Medicaid?', 'Yes')]
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return self._result
+
+
+class FakeListenConnection:
+    """A LISTEN connection whose notifications are sent through a socketpair."""
+
+    def __init__(self):
+        self._reader, self.writer = socket.socketpair()
+        self.notifies = []
+        self.autocommit = False
+        self.closed = False
+
+    def cursor(self):
+        return SimpleNamespace(execute=lambda sql: None)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def notify(self, website_id):
+        self.writer.send(str(website_id).encode())
+
+    def poll(self):
+        payload = self._reader.recv(64).decode()
+        self.notifies.append(SimpleNamespace(channel='website_context', payload=payload))
+
+    def close(self):
+        self.closed = True
+        self._reader.close()
+        self.writer.close()
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class ContextCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(context_cache, 'load_website_index', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def listening_cache(self, **kwargs):
+        cache = ContextCache(**kwargs)
+        cache.listening = True  # as if the listener thread were connected
+        return cache
+
+    def test_context_is_served_from_cache_until_invalidated(self):
+        cache = self.listening_cache()
+        cursor = FakeCursor()
+        context = cache.get(cursor, 1)
+        self.assertEqual((context.content_version, context.summary), (3, 'Summary'))
+        self.assertEqual(context.training_data, [('Do you accept Medicaid?', 'Yes')])
+        self.assertEqual(context.answers.exact('do you accept medicaid'), 'Yes')
+
+        queries = cursor.queries
+        self.assertIs(cache.get(cursor, 1), context)
+        self.assertEqual(cursor.queries, queries)
+
+        cache.invalidate(1)
+        self.assertIsNot(cache.get(cursor, 1), context)
+        self.assertEqual(cache.stats()['hit_rate'], 1 / 3)
+
+    def test_missing_website(self):
+        self.assertIsNone(self.listening_cache().get(FakeCursor(), 404))
+
+    def test_nothing_is_cached_without_a_listener(self):
+        cache = ContextCache()
+        cursor = FakeCursor()
+        cache.get(cursor, 1)
+        queries = cursor.queries
+        cache.get(cursor, 1)
+        self.assertGreater(cursor.queries, queries)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_load_racing_an_invalidation_is_not_cached(self):
+        cache = self.listening_cache()
+        cache.get(FakeCursor(on_training=lambda: cache.invalidate(1)), 1)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_resident_bytes_are_bounded(self):
+        cache = self.listening_cache(maxbytes=50000)
+        cursor = FakeCursor(summary='x' * 20000)
+        for website_id in range(5):
+            cache.get(cursor, website_id)
+        stats = cache.stats()
+        self.assertLessEqual(stats['resident_bytes'], 50000)
+        self.assertEqual(stats['entries'], 2)
+        self.assertIsNotNone(cache._cache.get(4))
+        self.assertIsNone(cache._cache.get(0))
+
+    def test_notifications_invalidate_entries(self):
+        connection = FakeListenConnection()
+        cache = ContextCache()
+        self.addCleanup(cache.stop)
+        with mock.patch.object(context_cache.psycopg2, 'connect', return_value=connection), \
+                mock.patch.object(context_cache, 'get_pool', return_value=SimpleNamespace(dsn_kwargs={})), \
+                mock.patch.object(Config, 'CONTEXT_CACHE_LISTEN_TIMEOUT', 0.05):
+            cache.start()
+            self.assertTrue(wait_for(lambda: cache.listening))
+            cursor = FakeCursor()
+            cache.get(cursor, 1)
+            cache.get(cursor, 2)
+
+            connection.notify(1)
+            self.assertTrue(wait_for(lambda: cache.stats()['entries'] == 1))
+            self.assertIsNone(cache._cache.get(1))
+            self.assertIsNotNone(cache._cache.get(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+from config import Config
+from utils import conversation_log
+from utils.conversation_log import ConversationWriter
+
+
+class FakeCursor:
+    def __init__(self, rows=(), on_execute=None):
+        self.rows = list(rows)
+        self.on_execute = on_execute
+
+    def execute(self, sql, params=None):
+        if self.on_execute:
+            self.on_execute()
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeDatabase:
+    """Records the rows of every batch; `gate` holds writes until it is set."""
+
+    def __init__(self):
+        self.batches = []
+        self.last_id = 100
+        self.gate = threading.Event()
+        self.gate.set()
+
+    @contextmanager
+    def connection(self):
+        self.gate.wait()
+
+        class Connection:
+            def cursor(self):
+                return FakeCursor()
+        yield Connection()
+
+    def execute_values(self, cursor, sql, rows, **kwargs):
+        self.batches.append(list(rows))
+        ids = [(self.last_id + number,) for number in range(1, len(rows) + 1)]
+        self.last_id += len(rows)
+        return ids
+
+
+class ConversationWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.database = FakeDatabase()
+        for patcher in (
+            mock.patch.object(conversation_log, 'get_db_connection', self.database.connection),
+            mock.patch.object(conversation_log, 'execute_values', self.database.execute_values),
+            mock.patch.object(conversation_log, 'store_responses'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def writer(self, **kwargs):
+        writer = ConversationWriter(**kwargs)
+        self.addCleanup(writer.close, 5)
+        self.addCleanup(self.database.gate.set)
+        return writer
+
+    def test_turns_are_written_in_batches(self):
+        writer = self.writer(batch_size=3, flush_interval=10)
+        for number in range(7):
+            writer.append(1, f'question {number}', f'answer {number}')
+        self.assertTrue(writer.flush(5))
+
+        self.assertEqual([len(batch) for batch in self.database.batches], [3, 3, 1])
+        self.assertEqual(self.database.batches[0][0], (1, 'question 0', 'answer 0'))
+        self.assertEqual(writer.stats['batches'], 3)
+
+    def test_turns_are_written_after_the_flush_interval(self):
+        writer = self.writer(batch_size=100, flush_interval=0.05)
+        writer.append(1, 'hi', 'hello')
+        time.sleep(0.3)
+        self.assertEqual(self.database.batches, [[(1, 'hi', 'hello')]])
+
+    def test_unwritten_turns_are_visible(self):
+        self.database.gate.clear()
+        writer = self.writer(batch_size=100, flush_interval=0)
+        writer.append(1, 'first', 'one')
+        writer.append(1, 'second', 'two')
+        writer.append(2, 'other site', 'three')
+        self.assertEqual(writer.recent(1), [('second', 'two'), ('first', 'one')])
+
+        self.database.gate.set()
+        writer.flush(5)
+        self.assertEqual(writer.recent(1), [])
+
+    def test_full_queue_writes_inline(self):
+        self.database.gate.clear()
+        writer = self.writer(batch_size=1, flush_interval=0, max_queue=1)
+        writer.append(1, 'taken by the writer', 'a')
+        time.sleep(0.1)
+        writer.append(1, 'queued', 'b')
+
+        with mock.patch.object(Config, 'CONVERSATION_ENQUEUE_TIMEOUT', 0.05):
+            caller = threading.Thread(target=writer.append, args=(1, 'overflow', 'c'))
+            caller.start()
+            time.sleep(0.2)
+            self.assertTrue(caller.is_alive())  # held back until the database accepts writes
+            self.database.gate.set()
+            caller.join(5)
+
+        writer.flush(5)
+        self.assertEqual(writer.stats['direct_writes'], 1)
+        self.assertEqual(sorted(batch[0][1] for batch in self.database.batches),
+                         ['overflow', 'queued', 'taken by the writer'])
+
+    def test_close_writes_queued_turns(self):
+        writer = ConversationWriter(batch_size=100, flush_interval=10)
+        writer.append(1, 'bye', 'goodbye')
+        writer.close(5)
+        self.assertEqual(self.database.batches, [[(1, 'bye', 'goodbye')]])
+
+    def test_recent_history_merges_unwritten_turns(self):
+        self.database.gate.clear()
+        writer = self.writer(batch_size=100, flush_interval=0)
+        writer.append(1, 'queued', 'n')
+        writer.append(1, 'newer', 'w')
+        cursor = FakeCursor([(3, 'old', 'o'), (2, 'older', 'p'), (1, 'oldest', 'q')])
+
+        with mock.patch.object(conversation_log, 'get_writer', return_value=writer):
+            history = conversation_log.recent_history(cursor, 1, 4)
+        self.assertEqual(history, [('newer', 'w'), ('queued', 'n'), ('old', 'o'), ('older', 'p')])
+
+    def test_turn_written_between_the_reads_appears_once(self):
+        writer = self.writer(batch_size=100, flush_interval=10)
+        writer.append(1, 'hi', 'Hello!')
+
+        def write_now():
+            # The writer commits the queued turn after recent_history read the queue
+            writer.flush(5)
+            cursor.rows.insert(0, (self.database.last_id, 'hi', 'Hello!'))
+
+        cursor = FakeCursor([(7, 'old', 'o')], on_execute=write_now)
+        with mock.patch.object(conversation_log, 'get_writer', return_value=writer):
+            history = conversation_log.recent_history(cursor, 1, 4)
+        self.assertEqual(history, [('hi', 'Hello!'), ('old', 'o')])
+
+    def test_repeated_turns_are_kept(self):
+        self.database.gate.clear()
+        writer = self.writer(batch_size=100, flush_interval=0)
+        writer.append(1, 'hi', 'Hello!')
+        cursor = FakeCursor([(8, 'hi', 'Hello!'), (7, 'old', 'o')])
+
+        with mock.patch.object(conversation_log, 'get_writer', return_value=writer):
+            history = conversation_log.recent_history(cursor, 1, 4)
+        self.assertEqual(history, [('hi', 'Hello!'), ('hi', 'Hello!'), ('old', 'o')])
+
+
+class ArchiveCursor:
+    """Moves up to LIMIT of the `old` turns per statement, like the archiving CTE."""
+
+    def __init__(self, database):
+        self.database = database
+        self.rowcount = 0
+
+    def execute(self, sql, params):
+        days, limit = params
+        self.database.statements.append(params)
+        self.rowcount = min(limit, self.database.old)
+        self.database.old -= self.rowcount
+
+
+class ArchiveConversationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.old = 5
+        self.statements = []
+        self.transactions = 0
+
+        @contextmanager
+        def connection():
+            self.transactions += 1
+            yield mock.Mock(cursor=lambda: ArchiveCursor(self))
+
+        patcher = mock.patch.object(conversation_log, 'get_db_connection', connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_moves_old_turns_in_batches(self):
+        self.assertEqual(conversation_log.archive_conversations(days=30, batch_size=2), 5)
+        self.assertEqual(self.statements, [(30, 2)] * 3)
+        self.assertEqual(self.transactions, 3)  # one transaction per batch
+        self.assertEqual(conversation_log.archive_conversations(days=30, batch_size=2), 0)
+
+    def test_defaults_come_from_config(self):
+        with mock.patch.object(Config, 'CONVERSATION_RETENTION_DAYS', 7), \
+                mock.patch.object(Config, 'CONVERSATION_ARCHIVE_BATCH', 10):
+            self.assertEqual(conversation_log.archive_conversations(), 5)
+        self.assertEqual(self.statements, [(7, 10)])
+
+    def test_zero_retention_keeps_everything(self):
+        self.assertEqual(conversation_log.archive_conversations(days=0), 0)
+        self.assertEqual(self.transactions, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,286 @@
+import threading
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+import crawl_jobs
+from app import app
+from config import Config
+from utils.jwt_utils import generate_access_token
+
+
+class FakeJobTable:
+    """
+    An in-memory crawl_jobs table that understands the statements crawl_jobs.py
+    runs. `now` stands in for NOW(); rows in `locked` are held by another
+    transaction, so FOR UPDATE SKIP LOCKED passes over them.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.locked = set()
+        self.now = 1000.0
+        self.statements = []
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        table = self
+
+        class Connection:
+            def cursor(self, cursor_factory=None):
+                return FakeCursor(table)
+        yield Connection()
+
+    def stale(self, job):
+        return job['status'] == 'running' and job['heartbeat_at'] < self.now - Config.CRAWL_JOB_STALE_SECONDS
+
+    def count(self, prefix):
+        return sum(sql.startswith(prefix) for sql, _ in self.statements)
+
+
+class FakeCursor:
+
+    def __init__(self, table):
+        self.table = table
+        self.rowcount = 0
+        self._row = None
+
+    def execute(self, sql, params=()):
+        sql = ' '.join(sql.split())
+        table = self.table
+        with table.lock:
+            table.statements.append((sql, params))
+            if sql.startswith('INSERT INTO crawl_jobs'):
+                job_id = len(table.jobs) + 1
+                table.jobs[job_id] = {'id': job_id, 'user_id': params[0], 'base_url': params[1],
+                                      'max_pages': params[2], 'status': 'queued', 'attempts': 0, 'pages_done': 0,
+                                      'heartbeat_at': None, 'website_id': None, 'error': None, 'stats': None}
+                self._row = (job_id,)
+            elif sql.startswith('SELECT id, base_url'):
+                job = table.jobs.get(params[0])
+                self._row = dict(job) if job and job['user_id'] == params[1] else None
+            elif "error = 'Worker stopped responding'" in sql:
+                for job in table.jobs.values():
+                    if table.stale(job) and job['attempts'] >= params[1]:
+                        job.update(status='failed', error='Worker stopped responding')
+            elif sql.startswith("UPDATE crawl_jobs SET status = 'running'"):
+                assert 'FOR UPDATE SKIP LOCKED' in sql
+                runnable = [job for job_id, job in sorted(table.jobs.items())
+                            if job_id not in table.locked and (job['status'] == 'queued' or table.stale(job))]
+                self._row = None
+                if runnable:
+                    job = runnable[0]
+                    job.update(status='running', attempts=job['attempts'] + 1, pages_done=0, error=None,
+                               heartbeat_at=table.now)
+                    self._row = {key: job[key] for key in ('id', 'user_id', 'base_url', 'max_pages', 'attempts')}
+            elif sql.startswith('UPDATE crawl_jobs SET') and sql.endswith('WHERE id = %s AND attempts = %s'):
+                *values, job_id, attempts = params
+                job = table.jobs[job_id]
+                self.rowcount = int(job['attempts'] == attempts)
+                if not self.rowcount:
+                    return
+                if 'heartbeat_at = NOW()' in sql:
+                    job['heartbeat_at'] = table.now
+                if 'pages_done = %s' in sql:
+                    job['pages_done'] = values[0]
+                elif "status = 'failed'" in sql:
+                    job.update(status='failed', error=values[0])
+                elif "status = 'completed'" in sql:
+                    job.update(status='completed', website_id=values[0], stats=values[1].adapted)
+            else:
+                raise AssertionError(f'Unexpected statement: {sql}')
+
+    def fetchone(self):
+        return self._row
+
+
+class CrawlJobTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FakeJobTable()
+        for patcher in (
+            mock.patch.object(crawl_jobs, 'get_db_connection', self.table.connection),
+            mock.patch.object(crawl_jobs, 'load_crawl_state', return_value={}),
+            mock.patch.object(crawl_jobs, 'save_summary_to_db', return_value=42),
+            mock.patch.object(Config, 'CRAWL_JOB_HEARTBEAT_INTERVAL', 60),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def crawl(self, pages=2, error=None, during=None):
+        """Stand-in for crawl_major_pages: reports progress per page, then runs `during` or raises."""
+        def crawl_major_pages(base_url, max_pages, progress, page_state, stats):
+            for page in range(1, pages + 1):
+                progress(page)
+            if during:
+                during()
+            if error:
+                raise error
+            stats['pages'] = pages
+            return ['summary'] * pages
+        patcher = mock.patch.object(crawl_jobs, 'crawl_major_pages', crawl_major_pages)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_enqueue_and_poll_status(self):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {generate_access_token(7)}'}
+        response = client.post('/crawl', json={'base_url': 'https://example.org', 'max_pages': 3}, headers=headers)
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+        self.assertEqual(self.table.jobs[job_id]['status'], 'queued')
+
+        response = client.get(f'/crawl/{job_id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['status'], 'queued')
+
+        self.crawl()
+        crawl_jobs.run_job(crawl_jobs.claim_next_job())
+        status = client.get(f'/crawl/{job_id}', headers=headers).get_json()
+        self.assertEqual((status['status'], status['website_id'], status['pages_done']), ('completed', 42, 2))
+        self.assertEqual(status['stats'], {'pages': 2})
+
+        # Another user's job is not visible
+        other = {'Authorization': f'Bearer {generate_access_token(8)}'}
+        self.assertEqual(client.get(f'/crawl/{job_id}', headers=other).status_code, 404)
+
+    def test_enqueue_wakes_an_idle_worker(self):
+        woken = threading.Event()
+
+        def wait():
+            with crawl_jobs._jobs_available:
+                waiting.set()
+                if crawl_jobs._jobs_available.wait(10):
+                    woken.set()
+
+        waiting = threading.Event()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        waiting.wait(5)
+        crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 1)
+        thread.join(10)
+        self.assertTrue(woken.is_set())
+
+    def test_claim_takes_the_oldest_unlocked_job_once(self):
+        first, second, third = (crawl_jobs.enqueue_crawl_job(1, f'https://site{n}.example', 1) for n in range(3))
+        self.table.locked.add(first)
+
+        self.assertEqual(crawl_jobs.claim_next_job()['id'], second)
+        self.assertEqual(crawl_jobs.claim_next_job()['id'], third)
+        self.assertIsNone(crawl_jobs.claim_next_job())
+        self.assertEqual(self.table.jobs[first]['status'], 'queued')
+
+        self.table.locked.clear()
+        job = crawl_jobs.claim_next_job()
+        self.assertEqual((job['id'], job['attempts']), (first, 1))
+
+    def test_failure_is_recorded(self):
+        self.crawl(error=ValueError('site unreachable'))
+        job_id = crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 2)
+        crawl_jobs.run_job(crawl_jobs.claim_next_job())
+        job = self.table.jobs[job_id]
+        self.assertEqual((job['status'], job['error']), ('failed', 'site unreachable'))
+
+    def test_failed_save_is_recorded(self):
+        self.crawl()
+        job_id = crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 2)
+        with mock.patch.object(crawl_jobs, 'save_summary_to_db', return_value=None):
+            crawl_jobs.run_job(crawl_jobs.claim_next_job())
+        self.assertEqual(self.table.jobs[job_id]['status'], 'failed')
+
+    def test_stale_job_is_reclaimed_then_given_up(self):
+        job_id = crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 2)
+        for attempt in range(1, Config.CRAWL_JOB_MAX_ATTEMPTS + 1):
+            job = crawl_jobs.claim_next_job()
+            self.assertEqual((job['id'], job['attempts']), (job_id, attempt))
+            # Still heartbeating recently: nobody else may take it.
+            self.table.now += Config.CRAWL_JOB_STALE_SECONDS - 1
+            self.assertIsNone(crawl_jobs.claim_next_job())
+            self.table.now += 2
+
+        # The last attempt goes stale too: it is failed instead of retried.
+        self.table.now += Config.CRAWL_JOB_STALE_SECONDS + 1
+        self.assertIsNone(crawl_jobs.claim_next_job())
+        self.assertEqual(self.table.jobs[job_id]['status'], 'failed')
+        self.assertEqual(self.table.jobs[job_id]['error'], 'Worker stopped responding')
+
+    def test_reclaimed_worker_cannot_overwrite_the_newer_attempt(self):
+        job_id = crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 2)
+        first = crawl_jobs.claim_next_job()
+
+        def reclaim():
+            # The first worker stalls long enough for another worker to take the job over.
+            self.table.now += Config.CRAWL_JOB_STALE_SECONDS + 1
+            self.assertEqual(crawl_jobs.claim_next_job()['attempts'], 2)
+
+        self.crawl(error=RuntimeError('connection reset'), during=reclaim)
+        crawl_jobs.run_job(first)
+        job = self.table.jobs[job_id]
+        self.assertEqual((job['status'], job['attempts'], job['error']), ('running', 2, None))
+
+        self.crawl(pages=1)
+        crawl_jobs.run_job(dict(first, attempts=2))
+        self.assertEqual((job['status'], job['website_id']), ('completed', 42))
+
+    def test_heartbeat_runs_for_the_whole_job(self):
+        job_id = crawl_jobs.enqueue_crawl_job(1, 'https://example.org', 1)
+        job = crawl_jobs.claim_next_job()
+        heartbeat = 'UPDATE crawl_jobs SET heartbeat_at = NOW()'
+
+        def slow_save(*args):
+            # No progress is reported while saving, for three times the stale timeout;
+            # only the timer keeps the job from being reclaimed.
+            for _ in range(3):
+                beats = self.table.count(heartbeat)
+                for _ in range(1000):
+                    if self.table.count(heartbeat) > beats:
+                        break
+                    threading.Event().wait(0.01)
+                self.table.now += Config.CRAWL_JOB_STALE_SECONDS - 1
+                self.assertIsNone(crawl_jobs.claim_next_job())
+            return 42
+
+        self.crawl(pages=1)
+        with mock.patch.object(Config, 'CRAWL_JOB_HEARTBEAT_INTERVAL', 0.01), \
+                mock.patch.object(crawl_jobs, 'save_summary_to_db', slow_save):
+            crawl_jobs.run_job(job)
+
+        self.assertEqual(self.table.jobs[job_id]['status'], 'completed')
+        self.assertGreaterEqual(self.table.count(heartbeat), 3)
+        # The timer stops with the job.
+        beats = self.table.count(heartbeat)
+        threading.Event().wait(0.05)
+        self.assertEqual(self.table.count(heartbeat), beats)
+
+    def test_worker_survives_a_database_error(self):
+        self.crawl(pages=1)
+        first = crawl_jobs.enqueue_crawl_job(1, 'https://one.example', 1)
+        second = crawl_jobs.enqueue_crawl_job(1, 'https://two.example', 1)
+        update_job = crawl_jobs._update_job
+        failures = []
+
+        def flaky_update_job(job, sql, params=()):
+            if "status = 'completed'" in sql and not failures:
+                failures.append(job['id'])
+                raise RuntimeError('connection pool exhausted')
+            return update_job(job, sql, params)
+
+        pool = crawl_jobs.CrawlWorkerPool(workers=1, poll_interval=0.01)
+        with mock.patch.object(crawl_jobs, '_update_job', flaky_update_job), \
+                mock.patch.object(Config, 'CONVERSATION_ARCHIVE_INTERVAL', 60):
+            pool.start()
+            self.addCleanup(pool.stop, 5)
+            for _ in range(500):
+                if self.table.jobs[second]['status'] == 'completed':
+                    break
+                threading.Event().wait(0.01)
+
+        self.assertEqual(failures, [first])
+        self.assertEqual(self.table.jobs[first]['status'], 'running')  # reclaimed once stale
+        self.assertEqual(self.table.jobs[second]['status'], 'completed')
+        self.assertTrue(pool._threads[0].is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import threading
+import unittest
+
+from psycopg2 import extensions
+
+from utils.db import ConnectionPool, PoolTimeout
+
+
+class FakeInfo:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.conn.pings += 1
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.info = FakeInfo()
+        self.pings = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+class FakePool(ConnectionPool):
+    def _connect(self):
+        conn = FakeConnection()
+        with self._cond:
+            self._counters['created'] += 1
+        return conn
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def test_connections_are_reused(self):
+        pool = FakePool({}, max_size=2, healthcheck_interval=60)
+        with pool.connection() as conn:
+            first = conn._conn
+        with pool.connection() as conn:
+            self.assertIs(conn._conn, first)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['checkouts'], 2)
+
+    def test_close_returns_connection(self):
+        pool = FakePool({}, max_size=1, timeout=0.05)
+        conn = pool.connection()
+        conn.close()
+        conn.close()  # idempotent
+        self.assertEqual(pool.stats()['in_use'], 0)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_context_manager_commits_or_rolls_back(self):
+        pool = FakePool({}, max_size=1)
+        with pool.connection() as conn:
+            raw = conn._conn
+        self.assertEqual(raw.commits, 1)
+        with self.assertRaises(RuntimeError):
+            with pool.connection():
+                raise RuntimeError('boom')
+        self.assertEqual(raw.rollbacks, 1)
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = FakePool({}, max_size=1, timeout=0.05)
+        held = pool.connection()
+        with self.assertRaises(PoolTimeout):
+            pool.connection()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+        held.close()
+
+    def test_waiter_is_woken_on_release(self):
+        pool = FakePool({}, max_size=1, timeout=2)
+        held = pool.connection()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.connection()))
+        waiter.start()
+        held.close()
+        waiter.join(2)
+        self.assertEqual(len(got), 1)
+        got[0].close()
+
+    def test_broken_connection_is_replaced(self):
+        pool = FakePool({}, max_size=1, healthcheck_interval=0)
+        with pool.connection() as conn:
+            raw = conn._conn
+        raw.closed = 1
+        with pool.connection() as conn:
+            self.assertIsNot(conn._conn, raw)
+        self.assertEqual(pool.stats()['discarded'], 1)
+
+    def test_stale_idle_connection_is_pinged(self):
+        pool = FakePool({}, max_size=1, healthcheck_interval=0)
+        with pool.connection() as conn:
+            raw = conn._conn
+        with pool.connection():
+            pass
+        self.assertEqual(raw.pings, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
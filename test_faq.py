@@ -0,0 +1,135 @@
+import time
+import unittest
+from unittest import mock
+
+from app import app
+from utils import faq
+from utils.faq import CuratedAnswers, TrigramIndex, clean_question
+from utils.jwt_utils import generate_access_token
+
+
+class TrigramIndexTestCase(unittest.TestCase):
+
+    questions = {
+        1: 'What plans do you cover?',
+        2: 'What are your office hours?',
+        3: 'How do I enroll in Medicare Part D?',
+        4: 'Do you accept Medicaid?',
+    }
+
+    def setUp(self):
+        self.index = TrigramIndex()
+        for row_id, question in self.questions.items():
+            self.index.add(row_id, question)
+
+    def test_clean_question(self):
+        self.assertEqual(clean_question('  What plans do you COVER?? '), 'what plans do you cover')
+
+    def test_close_variants_match(self):
+        self.assertEqual(self.index.best_match('what plans do u cover', 0.6)[0], 1)
+        self.assertEqual(self.index.best_match('what are ur office hours', 0.6)[0], 2)
+        self.assertEqual(self.index.best_match('How do I enrol in medicare part d', 0.6)[0], 3)
+
+    def test_exact_question_scores_one(self):
+        self.assertEqual(self.index.best_match('do you accept medicaid', 0.6), (4, 1.0))
+
+    def test_unrelated_message_misses(self):
+        self.assertIsNone(self.index.best_match('Can I bring my dog to the appointment?', 0.6))
+        self.assertIsNone(self.index.best_match('???', 0.6))
+
+    def test_incremental_add(self):
+        self.assertIsNone(self.index.best_match('Where is your office located?', 0.6))
+        self.index.add(5, 'Where is your office located?')
+        self.assertEqual(self.index.best_match('where is the office located', 0.6)[0], 5)
+        self.assertEqual(len(self.index), 5)
+
+    def test_lookup_is_fast(self):
+        index = TrigramIndex()
+        for row_id in range(1, 2001):
+            index.add(row_id, f'Question number {row_id} about plan option {row_id * 7}')
+        started = time.perf_counter()
+        for _ in range(100):
+            index.best_match('what are your office hours on weekends', 0.6)
+        self.assertLess((time.perf_counter() - started) / 100, 0.005)
+
+
+class CuratedAnswersTestCase(unittest.TestCase):
+
+    def test_exact_and_fuzzy_matches(self):
+        answers = CuratedAnswers([(2, 'What are your office hours?', 'Nine to five'),
+                                  (1, 'Do you accept Medicaid?', 'Yes')])
+        self.assertEqual(answers.exact('  do you accept MEDICAID '), 'Yes')
+        self.assertIsNone(answers.exact('what are ur office hours'))
+        self.assertEqual(answers.fuzzy('what are ur office hours', 0.6), 'Nine to five')
+        self.assertIsNone(answers.fuzzy('Can I bring my dog?', 0.6))
+
+
+
+class TrainingTable:
+    """Answers _website_index's queries from a dict of rows and a content_version."""
+
+    def __init__(self, rows):
+        self.rows = dict(rows)
+        self.version = 1
+        self.scans = 0
+        self._result = None
+
+    def execute(self, sql, params=None):
+        if 'FROM knowledge_base' in sql:
+            self._result = [(self.version,)]
+        else:
+            self.scans += 1
+            self._result = list(self.rows.items())
+
+    def fetchone(self):
+        return self._result[0]
+
+    def fetchall(self):
+        return self._result
+
+
+class WebsiteIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(faq, '_indexes', faq.LRUCache(10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.table = TrainingTable({1: 'What are your office hours?', 2: 'Do you accept Medicaid?'})
+
+    def best_match(self, message):
+        match = faq._website_index(self.table, 7).best_match(message, 0.6)
+        return match and match[0]
+
+    def test_index_is_reused_while_the_version_is_unchanged(self):
+        self.assertEqual(self.best_match('do you accept medicaid'), 2)
+        self.assertEqual(self.best_match('what are your office hours'), 1)
+        self.assertEqual(self.table.scans, 1)
+
+    def test_question_edited_in_place_is_reindexed(self):
+        self.assertEqual(self.best_match('do you accept medicaid'), 2)
+        # Same row count and max id; the trigger bumps the version.
+        self.table.rows[2] = 'Where is your office located?'
+        self.table.version += 1
+        self.assertIsNone(self.best_match('do you accept medicaid'))
+        self.assertEqual(self.best_match('where is the office located'), 2)
+
+
+class TrainingDataRouteTestCase(unittest.TestCase):
+
+    def post(self, **kwargs):
+        client = app.test_client()
+        headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+        return client.post('/training_data/3', headers=headers, **kwargs)
+
+    def test_malformed_bodies_are_rejected(self):
+        for kwargs in ({'data': 'not json', 'content_type': 'application/json'}, {'data': 'question=x'},
+                       {'json': ['question', 'answer']}, {'json': {'pairs': 'What?'}},
+                       {'json': {'pairs': ['What?']}}, {'json': {'pairs': [{'question': 'What?'}]}},
+                       {'json': {'question': 'What?', 'answer': 5}}, {'json': {'question': ' ', 'answer': 'x'}}):
+            with self.subTest(kwargs), mock.patch('web_crawler.get_db_connection') as get_db_connection:
+                self.assertEqual(self.post(**kwargs).status_code, 400)
+                get_db_connection.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from bs4 import BeautifulSoup
+
+from utils import html_extract
+from utils.html_extract import decode_html, extract_page
+
+
+PAGES = [
+    b"<!doctype html><html><head><title>Plans &amp; pricing</title><script>var a = '<p>x</p>';</script>"
+    b"<meta charset=utf-8><link rel=stylesheet href=x.css><style>p { color: red }</style></head>"
+    b"<body><!-- nav -->Skip to content<nav><a href='/'>Home</a><a href=\"/plans?id=2#top\">Plans</a></nav>"
+    b"<p>Part B covers <b>doctor\nvisits</b> and&nbsp;outpatient care.</p><a href>Top</a>"
+    b"<ul><li>Premium<li>Deductible</ul>Caf\xc3\xa9 footer</body></html>",
+    b"<p>Fragment without html or body <a href='contact'>Contact</a></p> trailing text",
+    b"",
+]
+
+
+def reference(body):
+    """What the crawler extracted with BeautifulSoup before the single-pass engines."""
+    soup = BeautifulSoup(body.decode('utf-8'), 'html.parser')
+    hrefs = [link['href'] for link in soup.find_all('a', href=True)]
+    for element in soup(['script', 'style', 'meta', 'link']):
+        element.decompose()
+    text = soup.get_text(separator='\n', strip=True)
+    return [' '.join(line.split()) for line in text.splitlines() if line.strip()], hrefs
+
+
+class ExtractPageTestCase(unittest.TestCase):
+
+    def test_engines_match_beautifulsoup(self):
+        for engine, extract in html_extract.ENGINES.items():
+            if extract is None:
+                continue
+            for body in PAGES:
+                with self.subTest(engine=engine, body=body[:30]):
+                    lines, hrefs = extract_page(body, 'text/html; charset=utf-8', engine=engine)
+                    reference_lines, reference_hrefs = reference(body)
+                    # The same characters in the same order; only the whitespace follows the blocks now
+                    self.assertEqual(''.join(''.join(lines).split()), ''.join(''.join(reference_lines).split()))
+                    self.assertEqual(hrefs, reference_hrefs)
+
+    def test_one_line_per_block(self):
+        body = (b'<title>Plans</title><nav><ul><li><a href="/">Home</a><li><b>Plans</b></ul></nav>'
+                b'<div>Intro<p>Enroll in <a href="/plans">Medicare Advantage</a> before <em>March</em>.</p>'
+                b'Compare with<br>Part D.</div><ul><li>Costs for <i>Part B</i> vary</ul>'
+                b'<footer><p>Call us</p><p>555-0100</p></footer>')
+        expected = ['Plans', 'Home Plans', 'Intro', 'Enroll in Medicare Advantage before March.', 'Compare with',
+                    'Part D.', 'Costs for Part B vary', 'Call us 555-0100']
+        for engine, extract in html_extract.ENGINES.items():
+            if extract is not None:
+                with self.subTest(engine=engine):
+                    self.assertEqual(extract_page(body, 'text/html', engine=engine)[0], expected)
+
+    def test_body_is_capped(self):
+        body = b'<p>' + b'word ' * 1000 + b'</p><a href="/late">late</a>'
+        with mock.patch.object(html_extract.Config, 'CRAWL_MAX_PAGE_BYTES', 100):
+            lines, hrefs = extract_page(body, 'text/html')
+        self.assertLessEqual(len(' '.join(lines)), 100)
+        self.assertEqual(hrefs, [])
+
+    def test_decode_uses_header_then_meta_charset(self):
+        body = '<meta charset="windows-1252"><p>café</p>'.encode('cp1252')
+        self.assertIn('café', decode_html(body, 'text/html'))
+        self.assertIn('café', decode_html('<p>café</p>'.encode('latin-1'), 'text/html; charset=ISO-8859-1'))
+        self.assertIn('�', decode_html('<p>café</p>'.encode('latin-1'), 'text/html'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import time
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+import jwt
+
+from config import Config
+from utils import jwt_utils
+from utils.jwt_utils import decode_access_token, generate_access_token, revoke_user_tokens
+
+
+class UsersTable:
+    """The users.tokens_valid_after column, shared by every worker."""
+
+    def __init__(self):
+        self.valid_after = {}  # user_id -> epoch seconds
+        self.reads = 0
+
+    @contextmanager
+    def connection(self):
+        yield mock.Mock(cursor=lambda: self)
+
+    def execute(self, sql, params):
+        if sql.startswith('SELECT tokens_valid_after FROM users'):
+            self.reads += 1
+            self._row = (self.valid_after.get(params[0]),)
+        else:
+            assert sql.startswith('UPDATE users SET tokens_valid_after'), sql
+            self.valid_after[params[1]] = params[0]
+
+    def fetchone(self):
+        return self._row
+
+
+def token(user_id, issued_at):
+    return jwt.encode({'sub': str(user_id), 'iat': issued_at, 'exp': int(time.time()) + 60},
+                      Config.JWT_SECRET_KEY, algorithm='HS256')
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.users = UsersTable()
+        patcher = mock.patch.object(jwt_utils, 'get_db_connection', self.users.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        jwt_utils._verified.clear()
+        jwt_utils._valid_after.clear()
+        self.addCleanup(jwt_utils._valid_after.clear)
+
+    def test_repeated_tokens_skip_signature_verification(self):
+        token = generate_access_token(7)
+        with mock.patch.object(jwt_utils.jwt, 'decode', wraps=jwt.decode) as decode:
+            self.assertEqual([decode_access_token(token) for _ in range(3)], ['7', '7', '7'])
+        self.assertEqual(decode.call_count, 1)
+
+    def test_cached_token_expires_with_the_token(self):
+        with mock.patch.object(Config, 'JWT_EXPIRATION_SECONDS', 1):
+            token = generate_access_token(7)
+        self.assertEqual(decode_access_token(token), '7')
+        time.sleep(1.1)
+        self.assertIsNone(decode_access_token(token))
+
+    def test_invalid_tokens_are_rejected(self):
+        token = generate_access_token(7)
+        self.assertIsNone(decode_access_token(token[:-2] + ('AA' if token[-2:] != 'AA' else 'BB')))
+        self.assertIsNone(decode_access_token('not-a-token'))
+        self.assertEqual(len(jwt_utils._verified), 0)
+
+    def test_revoked_tokens_are_refused(self):
+        old_token = token(7, time.time() - 60)
+        other_user = generate_access_token(8)
+        self.assertEqual(decode_access_token(old_token), '7')
+        self.assertEqual(decode_access_token(other_user), '8')
+
+        revoke_user_tokens(self.users, 7)
+        self.assertIsNone(decode_access_token(old_token))
+        self.assertEqual(decode_access_token(other_user), '8')
+        # Issued in the same second as the reset, but after it
+        self.assertEqual(decode_access_token(generate_access_token(7)), '7')
+
+    def test_revocation_reaches_other_workers(self):
+        old_token = token(7, time.time() - 60)
+        with mock.patch.object(jwt_utils._valid_after, 'ttl', 0.05):
+            self.assertEqual(decode_access_token(old_token), '7')
+            # Another worker resets the password: this one only sees the column.
+            self.users.valid_after[7] = time.time()
+            self.assertEqual(decode_access_token(old_token), '7')  # until the cached value is re-read
+            time.sleep(0.1)
+            self.assertIsNone(decode_access_token(old_token))
+        self.assertEqual(self.users.reads, 2)
+
+    def test_revocations_expire_with_the_tokens(self):
+        self.users.valid_after[7] = time.time() - Config.JWT_EXPIRATION_SECONDS - 1
+        self.assertEqual(decode_access_token(token(7, 0)), '7')
+        self.assertEqual(jwt_utils._valid_after.get('7'), 0.0)
+
+    def test_unreadable_revocation_is_retried(self):
+        with mock.patch.object(jwt_utils, 'get_db_connection', side_effect=RuntimeError('database down')):
+            self.assertEqual(decode_access_token(generate_access_token(7)), '7')
+        self.assertIsNone(jwt_utils._valid_after.get('7'))
+
+if __name__ == '__main__':
+    unittest.main()
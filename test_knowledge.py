@@ -0,0 +1,175 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from config import Config
+from utils.bm25 import BM25Index
+from utils.knowledge import _fuse, chunk_text
+from utils.vector_index import (HashingEmbedder, VectorIndex, rebuild_dirty_website_vectors, update_website_vectors,
+                                website_vector_index)
+
+
+class ChunkTextTestCase(unittest.TestCase):
+
+    def test_offsets_point_into_text(self):
+        text = ' '.join(f'word{i}' for i in range(500))
+        chunks = chunk_text(text, chunk_size=120, overlap=30)
+        self.assertGreater(len(chunks), 1)
+        for start, end, chunk in chunks:
+            self.assertEqual(text[start:end], chunk)
+            self.assertLessEqual(len(chunk), 120)
+
+    def test_chunks_cover_text_with_overlap(self):
+        text = ' '.join(f'word{i}' for i in range(200))
+        chunks = chunk_text(text, chunk_size=100, overlap=20)
+        self.assertEqual(chunks[0][0], 0)
+        self.assertEqual(chunks[-1][1], len(text))
+        for (_, previous_end, _), (next_start, _, _) in zip(chunks, chunks[1:]):
+            self.assertLess(next_start, previous_end)
+
+    def test_short_and_empty_text(self):
+        self.assertEqual(chunk_text('', chunk_size=100, overlap=10), [])
+        self.assertEqual(chunk_text('Medicare plans', chunk_size=100, overlap=10), [(0, 14, 'Medicare plans')])
+
+    def test_oversized_word_is_kept_whole(self):
+        word = 'x' * 300
+        self.assertEqual(chunk_text(word, chunk_size=100, overlap=10), [(0, 300, word)])
+
+
+class BM25IndexTestCase(unittest.TestCase):
+
+    documents = [
+        (10, 'Medicare Advantage plans cover hospital and doctor visits.'),
+        (11, 'Our office hours are Monday to Friday, nine to five.'),
+        (12, 'Part D plans cover prescription drugs. Drug coverage varies by plan.'),
+        (13, 'Contact us by phone or email for enrollment help.'),
+    ]
+
+    def test_ranks_matching_documents(self):
+        index = BM25Index.build(self.documents)
+        results = index.search('Which plans cover prescription drugs?', k=2)
+        self.assertEqual([doc_id for doc_id, _ in results], [12, 10])
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_no_match_and_stopwords(self):
+        index = BM25Index.build(self.documents)
+        self.assertEqual(index.search('the and of'), [])
+        self.assertEqual(index.search('zebra'), [])
+
+    def test_serialization_round_trip(self):
+        index = BM25Index.build(self.documents)
+        restored = BM25Index.from_bytes(index.to_bytes())
+        self.assertEqual(list(restored.doc_ids), [10, 11, 12, 13])
+        self.assertEqual(restored.search('office hours phone'), index.search('office hours phone'))
+
+    def test_empty_index(self):
+        index = BM25Index.from_bytes(BM25Index.build([]).to_bytes())
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.search('plans'), [])
+
+
+class VectorIndexTestCase(unittest.TestCase):
+
+    texts = [
+        'Medicare Advantage plans cover hospital and doctor visits.',
+        'Our office hours are Monday to Friday, nine to five.',
+        'Part D plans cover prescription drugs.',
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.embedder = HashingEmbedder(dim=64)
+        self.index = VectorIndex(os.path.join(self.tmp.name, '1'))
+        self.index.write([1, 2, 3], self.embedder.embed(self.texts))
+
+    def query(self, text, k=3):
+        return self.index.search(self.embedder.embed([text])[0], k=k)
+
+    def test_embeddings_are_normalized(self):
+        vectors = self.embedder.embed(self.texts + [''])
+        np.testing.assert_allclose(np.linalg.norm(vectors[:3], axis=1), 1.0, rtol=1e-5)
+        self.assertFalse(vectors[3].any())
+
+    def test_search_ranks_by_similarity(self):
+        self.assertEqual(self.query('prescription drugs')[0][0], 3)
+        self.assertEqual(self.query('office hours Monday')[0][0], 2)
+
+    def test_vectors_are_memory_mapped(self):
+        _, vectors = self.index.load()
+        self.assertIsInstance(vectors, np.memmap)
+
+    def test_incremental_append_and_tombstones(self):
+        self.index.update([4], self.embedder.embed(['Dental and vision coverage options.']), removed_ids=[3])
+        ids, vectors = self.index.load()
+        self.assertEqual(list(ids), [1, 2, -1, 4])
+        self.assertEqual(vectors.shape, (4, 64))
+        self.assertEqual(self.query('dental vision')[0][0], 4)
+        self.assertNotIn(3, [chunk_id for chunk_id, _ in self.query('prescription drugs')])
+
+    def test_compacts_when_mostly_deleted(self):
+        self.index.update([], self.embedder.embed([]), removed_ids=[1, 2])
+        ids, vectors = self.index.load()
+        self.assertEqual(list(ids), [3])
+        self.assertEqual(len(vectors), 1)
+
+
+class ChunkCursor:
+    """Answers rebuild_website_vectors' query with a fixed list of chunks."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class DirtyVectorIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(Config, 'VECTOR_INDEX_DIR', tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cursor = ChunkCursor([(1, 'Medicare Advantage plans.'), (2, 'Office hours.'), (3, 'Vision coverage.'),
+                                   (4, 'Dental coverage.')])
+        update_website_vectors(ChunkCursor([(1, 'Medicare Advantage plans.'), (2, 'Office hours.')]), 7,
+                               [(1, 'Medicare Advantage plans.'), (2, 'Office hours.')], [])
+        self.index = website_vector_index(7)
+
+    def test_failed_update_is_repaired_on_next_use(self):
+        # A crawl committed chunk 3 but could not apply it to the index
+        self.index.mark_dirty()
+        rebuild_dirty_website_vectors(self.cursor, 7)
+        self.assertFalse(self.index.is_dirty())
+        self.assertEqual(list(self.index.load()[0]), [1, 2, 3, 4])
+
+        with mock.patch('utils.vector_index.rebuild_website_vectors') as rebuild:
+            rebuild_dirty_website_vectors(self.cursor, 7)
+        rebuild.assert_not_called()
+
+    def test_dirty_index_is_rebuilt_instead_of_updated(self):
+        self.index.mark_dirty()
+        update_website_vectors(self.cursor, 7, [(4, 'Dental coverage.')], [])
+        self.assertFalse(self.index.is_dirty())
+        self.assertEqual(list(self.index.load()[0]), [1, 2, 3, 4])
+
+
+class FuseTestCase(unittest.TestCase):
+
+    def test_reciprocal_rank_fusion(self):
+        bm25 = [(1, 9.0), (2, 5.0), (3, 1.0)]
+        vector = [(3, 0.9), (1, 0.8)]
+        self.assertEqual(_fuse([bm25, vector], 2), [1, 3])
+        self.assertEqual(_fuse([], 5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import time
+import unittest
+
+from utils.lru import LRUCache
+from utils.response_cache import message_key
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(10, ttl=0.05)
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+        time.sleep(0.06)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_stats(self):
+        cache = LRUCache(10)
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('missing')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+    def test_byte_bound_evicts_oldest(self):
+        cache = LRUCache(100, maxbytes=10, sizeof=len)
+        cache.put('a', 'xxxx')
+        cache.put('b', 'yyyy')
+        cache.put('c', 'zzzz')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.bytes, 8)
+        cache.put('b', 'y')
+        cache.pop('c')
+        self.assertEqual(cache.bytes, 1)
+        cache.put('huge', 'x' * 11)  # larger than the whole cache: not stored
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.stats()['bytes'], 1)
+
+
+class MessageKeyTestCase(unittest.TestCase):
+
+    def test_equivalent_messages_share_a_key(self):
+        self.assertEqual(message_key('What plans do you cover?'), message_key('  what plans   do you COVER '))
+        self.assertNotEqual(message_key('What plans do you cover?'), message_key('What plans do you sell?'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from utils.near_duplicates import MinHasher, NearDuplicateIndex, similarity
+
+
+ARTICLE = ' '.join(f'sentence {number} about medicare coverage and hospital benefits' for number in range(40))
+
+
+class NearDuplicateIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.hasher = MinHasher(num_perm=128)
+
+    def test_similarity_tracks_shared_shingles(self):
+        original = self.hasher.signature(ARTICLE)
+        variant = self.hasher.signature(ARTICLE + ' page 2 of 3')
+        unrelated = self.hasher.signature(' '.join(f'recipe step {number} stir the soup' for number in range(40)))
+
+        self.assertGreater(similarity(original, variant), 0.9)
+        self.assertLess(similarity(original, unrelated), 0.1)
+
+    def test_finds_indexed_near_duplicate(self):
+        index = NearDuplicateIndex(threshold=0.8, bands=32)
+        index.add('/article', self.hasher.signature(ARTICLE))
+
+        match = index.find(self.hasher.signature('Deutsch ' + ARTICLE))
+        self.assertEqual(match[0], '/article')
+        self.assertIsNone(index.find(self.hasher.signature('contact us by phone or email ' * 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+import re
+import sys
+import unittest
+
+from utils import db
+from utils.db import NORMALIZED_QUESTION_SQL, NORMALIZED_QUESTION_VERSION, get_db_connection, init_db
+from utils.faq import clean_question
+
+
+QUESTIONS = [
+    'What about HIV',
+    'what about hiv?',
+    '\vwhat about hiv\v',
+    'v',
+    'vision coverage',
+    '  Do you cover vision?\t\n',
+    ' Office hours　',
+    '\x0bHours?\x0c\x1c',
+    '???',
+]
+
+E_STRING_ESCAPE = re.compile(r'\\(u[0-9a-fA-F]{4}|U[0-9a-fA-F]{8}|x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+SIMPLE_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def decode_e_string(body):
+    """Decode the body of a Postgres E'...' literal the way the server does."""
+    def escape(match):
+        code = match.group(1)
+        if code[0] in 'uUx':
+            return chr(int(code[1:], 16))
+        if code[0] in '01234567':
+            return chr(int(code, 8))
+        # Any other escaped character stands for itself: E'\v' is 'v'.
+        return SIMPLE_ESCAPES.get(code, code)
+    return E_STRING_ESCAPE.sub(escape, body)
+
+
+def normalize_like_sql(question):
+    """NORMALIZED_QUESTION_SQL evaluated in Python, with its btrim set decoded from the SQL."""
+    strip_chars = decode_e_string(re.search(r"E'([^']*)'", NORMALIZED_QUESTION_SQL).group(1))
+    return re.sub(r'[^\w\s]', '', question.strip(strip_chars).lower())
+
+
+def database_available():
+    try:
+        init_db()
+        return True
+    except Exception:
+        return False
+
+
+class NormalizedQuestionTestCase(unittest.TestCase):
+
+    def test_btrim_set_is_what_str_strip_removes(self):
+        strip_chars = decode_e_string(re.search(r"E'([^']*)'", NORMALIZED_QUESTION_SQL).group(1))
+        whitespace = {chr(code) for code in range(sys.maxunicode + 1) if chr(code).isspace()}
+        self.assertEqual(set(strip_chars), whitespace)
+        self.assertNotIn('v', strip_chars)
+
+    def test_sql_matches_clean_question(self):
+        for question in QUESTIONS:
+            with self.subTest(question=question):
+                self.assertEqual(normalize_like_sql(question), clean_question(question))
+        self.assertEqual(normalize_like_sql('what about hiv'), 'what about hiv')
+
+
+class ScriptedCursor:
+    """Answers the catalog lookups of _create_schema and records every statement."""
+
+    def __init__(self, column_comment, index_exists=True):
+        self.column_comment = column_comment
+        self.index_exists = index_exists
+        self.statements = []
+        self.rowcount = 0
+        self._result = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.statements.append(sql)
+        if 'FROM pg_attribute' in sql:
+            self._result = None if self.column_comment is False else (self.column_comment,)
+        elif "to_regclass('idx_training_data_website_question')" in sql:
+            self._result = ('idx_training_data_website_question',) if self.index_exists else (None,)
+        elif sql.startswith('DROP INDEX IF EXISTS idx_training_data_website_question'):
+            self.index_exists = False
+
+    def fetchone(self):
+        return self._result
+
+    def position(self, prefix):
+        return next(number for number, sql in enumerate(self.statements) if sql.startswith(prefix))
+
+
+class NormalizedQuestionMigrationTestCase(unittest.TestCase):
+
+    def test_outdated_column_is_rebuilt_and_deduplicated(self):
+        cursor = ScriptedCursor(column_comment=None)
+        db._create_schema(cursor)
+        order = [cursor.position(prefix) for prefix in (
+            'CREATE TABLE IF NOT EXISTS training_data_duplicates',
+            'DROP INDEX IF EXISTS idx_training_data_website_question',
+            'ALTER TABLE training_data DROP COLUMN normalized_question',
+            'ALTER TABLE training_data ADD COLUMN IF NOT EXISTS normalized_question',
+            'COMMENT ON COLUMN training_data.normalized_question',
+            'WITH removed AS ( DELETE FROM training_data newer',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_training_data_website_question',
+        )]
+        self.assertEqual(order, sorted(order))
+
+    def test_current_column_is_left_alone(self):
+        cursor = ScriptedCursor(column_comment=NORMALIZED_QUESTION_VERSION)
+        db._create_schema(cursor)
+        self.assertFalse(any(sql.startswith('ALTER TABLE training_data DROP COLUMN') or
+                             'DELETE FROM training_data' in sql for sql in cursor.statements))
+
+    def test_new_database_gets_the_column(self):
+        cursor = ScriptedCursor(column_comment=False, index_exists=False)
+        db._create_schema(cursor)
+        self.assertFalse(any(sql.startswith('ALTER TABLE training_data DROP COLUMN') for sql in cursor.statements))
+        cursor.position('ALTER TABLE training_data ADD COLUMN IF NOT EXISTS normalized_question')
+
+
+@unittest.skipUnless(database_available(), 'database not reachable')
+class NormalizedQuestionDatabaseTestCase(unittest.TestCase):
+
+    def test_postgres_matches_clean_question(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for question in QUESTIONS:
+                with self.subTest(question=question):
+                    cursor.execute(f'SELECT {NORMALIZED_QUESTION_SQL.format("%s")}', (question,))
+                    self.assertEqual(cursor.fetchone()[0], clean_question(question))
+
+    def test_migration_keeps_the_oldest_of_each_normalized_question(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO users (first_name, last_name, username, email, country_code, mobile_number,
+                                   company_name, city, state, country, medicare_bot_usage, package, password_hash)
+                VALUES ('t', 't', 'dedup-test', 'dedup@test', '1', '1', 'c', 'c', 's', 'c', 'u', 'p', 'x')
+                RETURNING id
+            ''')
+            user_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO knowledge_base (website_url, summary, user_id) VALUES ('u', 's', %s) RETURNING id",
+                           (user_id,))
+            website_id = cursor.fetchone()[0]
+            cursor.execute('DROP INDEX idx_training_data_website_question')
+            for question in ('What about HIV?', 'what about hiv', 'What about HI?', 'Vision?', 'vision'):
+                cursor.execute('INSERT INTO training_data (website_id, question, answer) VALUES (%s, %s, %s)',
+                               (website_id, question, question))
+            cursor.execute("COMMENT ON COLUMN training_data.normalized_question IS 'outdated'")
+
+            db._create_schema(cursor)
+            cursor.execute('SELECT id, question FROM training_data WHERE website_id = %s ORDER BY id', (website_id,))
+            kept = {question: row_id for row_id, question in cursor.fetchall()}
+            cursor.execute('SELECT question, kept_id FROM training_data_duplicates WHERE website_id = %s ORDER BY id',
+                           (website_id,))
+            archived = cursor.fetchall()
+            conn.rollback()
+        self.assertEqual(list(kept), ['What about HIV?', 'What about HI?', 'Vision?'])
+        self.assertEqual(archived, [('what about hiv', kept['What about HIV?']), ('vision', kept['Vision?'])])
+
+
+if __name__ == '__main__':
+    unittest.main()
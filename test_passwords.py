@@ -0,0 +1,117 @@
+import threading
+import unittest
+from unittest import mock
+
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import generate_password_hash
+
+import auth
+from app import app
+from utils import passwords
+from utils.passwords import AdmissionControl, HashingBusy, PasswordHasher, hash_prefix
+
+FAST_METHOD = 'pbkdf2:sha256:1000'
+
+
+class PasswordHasherTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.hasher = PasswordHasher(workers=1, max_pending=4, method=FAST_METHOD)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.hasher.close()
+
+    def test_hash_and_verify(self):
+        password_hash = self.hasher.hash('s3cret')
+        self.assertTrue(password_hash.startswith(FAST_METHOD + '$'))
+        self.assertTrue(self.hasher.verify(password_hash, 's3cret'))
+        self.assertFalse(self.hasher.verify(password_hash, 'wrong'))
+
+    def test_missing_or_malformed_hash_never_verifies(self):
+        self.assertFalse(self.hasher.verify(None, 's3cret'))
+        self.assertFalse(self.hasher.verify('bogus$salt$hash', 's3cret'))
+
+    def test_needs_rehash_when_parameters_change(self):
+        self.assertFalse(self.hasher.needs_rehash(self.hasher.hash('s3cret')))
+        self.assertTrue(self.hasher.needs_rehash(generate_password_hash('s3cret', method='pbkdf2:sha256:2000')))
+
+    def test_needs_rehash_does_not_use_the_pool(self):
+        password_hash = generate_password_hash('s3cret', method=FAST_METHOD)
+        with mock.patch.object(self.hasher, '_run', side_effect=HashingBusy):
+            self.assertFalse(self.hasher.needs_rehash(password_hash))
+
+    def test_hash_prefix_matches_werkzeug(self):
+        for method in ('scrypt', 'scrypt:16384:8:2', 'pbkdf2:sha1:1000', FAST_METHOD):
+            with self.subTest(method):
+                self.assertEqual(hash_prefix(method), generate_password_hash('', method=method).split('$')[0])
+        self.assertEqual(hash_prefix('pbkdf2'), f'pbkdf2:sha256:{passwords.DEFAULT_PBKDF2_ITERATIONS}')
+        with self.assertRaises(ValueError):
+            hash_prefix('md5')
+
+    def test_full_queue_fails_fast(self):
+        hasher = PasswordHasher(workers=1, max_pending=1, method=FAST_METHOD)
+        self.addCleanup(hasher.close)
+        release = threading.Event()
+        started = threading.Event()
+
+        def slow_submit(function, *args):
+            started.set()
+            release.wait(5)
+            return mock.Mock(result=lambda: 'hash')
+
+        with mock.patch.object(hasher._pool, 'submit', side_effect=slow_submit):
+            worker = threading.Thread(target=hasher.hash, args=('first',))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            with self.assertRaises(HashingBusy):
+                hasher.hash('second')
+            release.set()
+            worker.join()
+        self.assertEqual(hasher.stats['rejected'], 1)
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+
+    def test_attempts_are_limited_per_key_within_the_window(self):
+        control = AdmissionControl(limit=2, window=60)
+        self.assertEqual(control.admit('10.0.0.1', now=0), 0)
+        self.assertEqual(control.admit('10.0.0.1', now=10), 0)
+        self.assertEqual(control.admit('10.0.0.1', now=20), 40)
+        self.assertEqual(control.admit('10.0.0.2', now=20), 0)
+        # The first attempt has left the window
+        self.assertEqual(control.admit('10.0.0.1', now=61), 0)
+        self.assertEqual(control.rejected, 1)
+
+    def test_tracked_keys_are_bounded(self):
+        control = AdmissionControl(limit=1, window=60, max_keys=2)
+        for key in ('a', 'b', 'c'):
+            control.admit(key, now=0)
+        self.assertEqual(list(control._attempts), ['b', 'c'])
+
+    def test_username_limit_applies_across_ips(self):
+        with mock.patch.object(passwords, '_ip_attempts', AdmissionControl(100, 60)), \
+                mock.patch.object(passwords, '_username_attempts', AdmissionControl(2, 60)):
+            self.assertEqual(passwords.admit_password_attempt('10.0.0.1', 'Alice'), 0)
+            self.assertEqual(passwords.admit_password_attempt('10.0.0.2', 'alice'), 0)
+            self.assertGreater(passwords.admit_password_attempt('10.0.0.3', 'alice'), 0)
+            self.assertEqual(passwords.admit_password_attempt('10.0.0.3', 'bob'), 0)
+
+
+class LoginAdmissionTestCase(unittest.TestCase):
+
+    def test_limits_key_on_the_forwarded_client_behind_a_proxy(self):
+        client = app.test_client()
+        credentials = {'username': 'alice', 'password': 'x'}
+        with mock.patch.object(app, 'wsgi_app', ProxyFix(app.wsgi_app, x_for=1)), \
+                mock.patch.object(auth, 'admit_password_attempt', return_value=5) as admit:
+            response = client.post('/login', json=credentials,
+                                   headers={'X-Forwarded-For': '198.51.100.7'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        admit.assert_called_once_with('198.51.100.7', 'alice')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+
+from utils.prompt_builder import (MESSAGE_OVERHEAD, REPLY_OVERHEAD, PromptBuilder, Tokenizer,
+                                  format_breakdown)
+
+
+SYSTEM = "You are a helpful chatbot."
+
+
+def words(prefix, count):
+    return ' '.join(f'{prefix}{number}' for number in range(count))
+
+
+class PromptBuilderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tokenizer = Tokenizer(cache_size=1000)
+
+    def builder(self, budget, **kwargs):
+        return PromptBuilder(budget=budget, priority=['knowledge', 'training', 'history'],
+                             shares={'knowledge': 0.5, 'training': 0.3, 'history': 0.2},
+                             tokenizer=self.tokenizer, **kwargs)
+
+    def prompt_tokens(self, messages):
+        return sum(self.tokenizer.count(m['content']) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+    def test_small_prompt_keeps_everything_in_order(self):
+        messages, breakdown = self.builder(3000).build(
+            SYSTEM, 'opening hours?', ['[/a] first passage', '[/b] second passage'],
+            [('Where are you?', 'Main street')], [('newer q', 'newer a'), ('older q', 'older a')])
+
+        self.assertEqual([m['content'] for m in messages], [
+            SYSTEM,
+            'Website Knowledge: [/a] first passage\n\n[/b] second passage',
+            'Question: Where are you?', 'Answer: Main street',
+            'older q', 'older a', 'newer q', 'newer a',
+            'User asked: opening hours?',
+        ])
+        self.assertEqual(breakdown['dropped'], {'knowledge': 0, 'training': 0, 'history': 0})
+        self.assertLessEqual(self.prompt_tokens(messages), breakdown['total'])
+
+    def test_large_prompt_fits_the_budget(self):
+        passages = [f'[/page{number}] ' + words('k', 300) for number in range(10)]
+        training = [(f'question {number}', words('a', 60)) for number in range(50)]
+        history = [(words('u', 40), words('r', 80)) for _ in range(4)]
+        messages, breakdown = self.builder(2000).build(SYSTEM, 'hello', passages, training, history)
+
+        self.assertLessEqual(self.prompt_tokens(messages), breakdown['total'])
+        self.assertLessEqual(breakdown['total'], 2000)
+        self.assertGreater(breakdown['total'], 1800)
+        self.assertTrue(all(breakdown['dropped'].values()))
+        # Each section got at least most of its reserved share.
+        available = 2000 - breakdown['system'] - breakdown['message']
+        self.assertGreater(breakdown['knowledge'], available * 0.4)
+        self.assertGreater(breakdown['training'], available * 0.2)
+        self.assertGreater(breakdown['history'], available * 0.1)
+        self.assertIn('dropped', format_breakdown(breakdown))
+
+    def test_unused_share_goes_to_other_sections(self):
+        passages = [words('k', 300) for _ in range(10)]
+        _, with_history = self.builder(2000).build(SYSTEM, 'hi', passages, [], [(words('u', 100), words('r', 100))])
+        _, without_history = self.builder(2000).build(SYSTEM, 'hi', passages, [], [])
+        self.assertGreater(without_history['knowledge'], with_history['knowledge'])
+        self.assertGreater(without_history['knowledge'], 1500)
+
+    def test_most_relevant_training_pairs_are_kept(self):
+        training = [(f'unrelated topic {number}', words('a', 100)) for number in range(20)]
+        training.insert(10, ('What are your opening hours?', 'Nine to five'))
+        messages, _ = self.builder(600).build(SYSTEM, 'what are the opening hours', [], training, [])
+        self.assertEqual(messages[1]['content'], 'Question: What are your opening hours?')
+
+    def test_history_keeps_the_newest_turns(self):
+        history = [(f'question {number} ' + words('u', 60), words('r', 60)) for number in range(4)]
+        messages, breakdown = self.builder(400).build(SYSTEM, 'hi', [], [], history)
+        kept = [m['content'] for m in messages if m['content'].startswith('question')]
+        self.assertTrue(kept)
+        self.assertTrue(kept[-1].startswith('question 0 '))
+        self.assertEqual(len(kept) + breakdown['dropped']['history'], 4)
+
+    def test_last_passage_is_truncated_to_fill_the_budget(self):
+        passages = [words('k', 600)]
+        messages, breakdown = self.builder(500).build(SYSTEM, 'hi', passages, [], [])
+        self.assertTrue(passages[0].startswith(messages[1]['content'][len('Website Knowledge: '):]))
+        self.assertLessEqual(self.prompt_tokens(messages), 500)
+        self.assertGreater(breakdown['knowledge'], 400)
+
+    def test_token_counts_are_cached(self):
+        text = words('w', 50)
+        self.tokenizer.count(text)
+        self.tokenizer.count(text)
+        self.assertEqual(self.tokenizer._counts.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+EXPLAIN the queries on the chat, login and crawl hot paths and fail if any
+of them would scan a whole table. Sequential scans are disabled for the
+check, so the planner only picks one when no index can serve the query;
+small test tables would otherwise always be scanned.
+
+Needs the database from Config; skipped when it is not reachable.
+"""
+import unittest
+
+from utils.db import NORMALIZED_QUESTION_SQL, get_db_connection, init_db
+
+
+HOT_QUERIES = {
+    'recent conversation history': ('''
+        SELECT id, user_message, assistant_response FROM conversation_history
+        WHERE website_id = %s ORDER BY id DESC LIMIT %s
+    ''', (1, 4)),
+    'conversations to archive': ('''
+        SELECT id FROM conversation_history
+        WHERE created_at < NOW() - make_interval(days => %s)
+        ORDER BY created_at LIMIT %s FOR UPDATE SKIP LOCKED
+    ''', (90, 5000)),
+    'training data of a website': (
+        'SELECT question, answer FROM training_data WHERE website_id = %s', (1,)),
+    'exact training answer': (f'''
+        SELECT answer FROM training_data
+        WHERE website_id = %s AND normalized_question = {NORMALIZED_QUESTION_SQL.format('%s')}
+    ''', (1, 'What are your hours?')),
+    'password reset token': (
+        'SELECT user_id, expiration FROM password_reset_tokens WHERE token = %s', ('token',)),
+    'delete password reset token': (
+        'DELETE FROM password_reset_tokens WHERE token = %s', ('token',)),
+    'login': ('SELECT id, password_hash FROM users WHERE username = %s', ('user',)),
+    'token revocation': ('SELECT tokens_valid_after FROM users WHERE id = %s', (1,)),
+    'content version of a website': ('SELECT content_version FROM knowledge_base WHERE id = %s', (1,)),
+    'websites of a user': ('SELECT id, website_url FROM knowledge_base WHERE user_id = %s', (1,)),
+    'versions of a page of summaries': (
+        'SELECT id, content_version FROM knowledge_base WHERE user_id = %s AND id > %s ORDER BY id LIMIT %s',
+        (1, 0, 51)),
+    'cached chat response': ('''
+        SELECT response FROM chat_response_cache
+        WHERE website_id = %s AND message_key = %s AND content_version = %s AND expires_at > NOW()
+    ''', (1, 'key', 1)),
+    'knowledge chunks of a website': (
+        'SELECT id, chunk_text FROM knowledge_chunks WHERE website_id = %s ORDER BY id', (1,)),
+    'crawl state of a website': (
+        'SELECT url, etag, last_modified, content_hash, summary, links, lines FROM crawl_pages WHERE website_id = %s', (1,)),
+    'next crawl job': ('''
+        SELECT id FROM crawl_jobs WHERE status = 'queued' ORDER BY id LIMIT 1 FOR UPDATE SKIP LOCKED
+    ''', ()),
+}
+
+
+def database_available():
+    try:
+        init_db()
+        return True
+    except Exception:
+        return False
+
+
+def sequential_scans(plan):
+    """Names of the tables a JSON plan node (or its children) scans sequentially."""
+    tables = [plan['Relation Name']] if plan['Node Type'] == 'Seq Scan' else []
+    for child in plan.get('Plans', ()):
+        tables.extend(sequential_scans(child))
+    return tables
+
+
+@unittest.skipUnless(database_available(), 'database not reachable')
+class QueryPlanTestCase(unittest.TestCase):
+
+    def test_hot_queries_use_indexes(self):
+        for name, (sql, params) in HOT_QUERIES.items():
+            with self.subTest(name), get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0][0]['Plan']
+                conn.rollback()
+                self.assertEqual(sequential_scans(plan), [], f'{name}: {plan}')
+
+
+if __name__ == '__main__':
+    unittest.main()
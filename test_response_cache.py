@@ -0,0 +1,178 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import web_crawler
+from app import app
+from config import Config
+from test_normalized_question import ScriptedCursor, database_available
+from utils import db, response_cache
+from utils.db import NORMALIZED_QUESTION_VERSION, get_db_connection
+from utils.jwt_utils import generate_access_token
+from utils.lru import LRUCache
+from utils.response_cache import cache_response, get_cached_response, message_key, store_responses
+
+
+class ChatCursor:
+    """Answers the content_version and chat_response_cache lookups; records every statement."""
+
+    def __init__(self, content_version=5, shared=None):
+        self.content_version = content_version
+        self.shared = shared  # the chat_response_cache row, if any
+        self.statements = []
+        self._row = None
+
+    def execute(self, sql, params=None):
+        sql = ' '.join(sql.split())
+        self.statements.append(sql)
+        if sql.startswith('SELECT content_version FROM knowledge_base'):
+            self._row = (self.content_version,) if self.content_version is not None else None
+        elif 'FROM chat_response_cache' in sql:
+            self._row = (self.shared,) if self.shared else None
+        else:
+            raise AssertionError(f'Unexpected statement: {sql}')
+
+    def fetchone(self):
+        return self._row
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(response_cache, '_local', LRUCache(100)),
+            mock.patch.object(Config, 'RESPONSE_CACHE_ENABLED', True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cursor = ChatCursor()
+
+    def test_local_hit_runs_no_query(self):
+        self.assertEqual(cache_response(3, 5, 'Office hours?', 'Nine to five'),
+                         (3, message_key('office hours'), 5, 'Nine to five'))
+        self.assertEqual(get_cached_response(self.cursor, 3, 5, '  office HOURS '), 'Nine to five')
+        self.assertEqual(self.cursor.statements, [])
+
+    def test_shared_hit_is_kept_locally(self):
+        self.cursor.shared = 'Nine to five'
+        self.assertEqual(get_cached_response(self.cursor, 3, 5, 'Office hours?'), 'Nine to five')
+        self.cursor.shared = None
+        self.assertEqual(get_cached_response(self.cursor, 3, 5, 'Office hours?'), 'Nine to five')
+        self.assertEqual(len(self.cursor.statements), 1)
+
+    def test_new_content_version_misses(self):
+        cache_response(3, 5, 'Office hours?', 'Nine to five')
+        # A re-crawl or training-data write bumped the website's version
+        self.assertIsNone(get_cached_response(self.cursor, 3, 6, 'Office hours?'))
+        self.assertIsNone(get_cached_response(self.cursor, 4, 5, 'Office hours?'))
+        self.assertEqual(len(self.cursor.statements), 2)
+
+    def test_disabled_cache(self):
+        with mock.patch.object(Config, 'RESPONSE_CACHE_ENABLED', False):
+            self.assertIsNone(cache_response(3, 5, 'Office hours?', 'Nine to five'))
+            self.assertIsNone(get_cached_response(self.cursor, 3, 5, 'Office hours?'))
+        self.assertEqual(self.cursor.statements, [])
+
+    def test_store_responses_upserts_the_latest_row_per_key(self):
+        rows = [cache_response(3, 5, 'Office hours?', 'old'), None, cache_response(3, 5, 'office hours', 'new'),
+                cache_response(3, 5, 'Do you cover vision?', 'Yes')]
+        with mock.patch.object(response_cache, 'execute_values') as execute_values:
+            store_responses(self.cursor, rows)
+            store_responses(self.cursor, [None])
+        execute_values.assert_called_once()
+        _, sql, values = execute_values.call_args[0]
+        self.assertIn('ON CONFLICT (website_id, message_key) DO UPDATE', sql)
+        self.assertEqual(sorted(row[3] for row in values), ['Yes', 'new'])
+
+    def test_training_data_writes_bump_the_version(self):
+        cursor = ScriptedCursor(column_comment=NORMALIZED_QUESTION_VERSION)
+        db._create_schema(cursor)
+        function = next(sql for sql in cursor.statements if 'FUNCTION bump_website_content_version' in sql)
+        self.assertIn('SET content_version = content_version + 1', function)
+        self.assertIn('DELETE FROM chat_response_cache', function)
+        self.assertIn('AFTER INSERT OR UPDATE OR DELETE ON training_data', cursor.statements[
+            cursor.position('CREATE TRIGGER training_data_content_version')])
+
+
+@unittest.skipUnless(database_available(), 'database not reachable')
+class ResponseCacheDatabaseTestCase(unittest.TestCase):
+
+    def test_training_data_write_invalidates_cached_answers(self):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO users (first_name, last_name, username, email, country_code, mobile_number,
+                                   company_name, city, state, country, medicare_bot_usage, package, password_hash)
+                VALUES ('t', 't', 'cache-test', 'cache@test', '1', '1', 'c', 'c', 's', 'c', 'u', 'p', 'x')
+                RETURNING id
+            ''')
+            user_id = cursor.fetchone()[0]
+            cursor.execute("INSERT INTO knowledge_base (website_url, summary, user_id) VALUES ('u', 's', %s) "
+                           "RETURNING id, content_version", (user_id,))
+            website_id, version = cursor.fetchone()
+            with mock.patch.object(Config, 'RESPONSE_CACHE_ENABLED', True):
+                store_responses(cursor, [cache_response(website_id, version, 'Office hours?', 'Nine to five')])
+                cursor.execute('INSERT INTO training_data (website_id, question, answer) VALUES (%s, %s, %s)',
+                               (website_id, 'Office hours?', 'Eight to six'))
+                cursor.execute('SELECT content_version FROM knowledge_base WHERE id = %s', (website_id,))
+                new_version = cursor.fetchone()[0]
+                cursor.execute('SELECT count(*) FROM chat_response_cache WHERE website_id = %s', (website_id,))
+                cached = cursor.fetchone()[0]
+            conn.rollback()
+        self.assertEqual(new_version, version + 1)
+        self.assertEqual(cached, 0)
+
+
+class CachedChatTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cursor = ChatCursor()
+        connection = mock.MagicMock()
+        connection.__enter__.return_value.cursor.return_value = self.cursor
+        self.backend = mock.Mock()
+        self.backend.complete.return_value = ('fresh answer', 10, 5)
+        self.context = SimpleNamespace(content_version=5, answers=None, training_data=[])
+        for patcher in (
+            mock.patch.object(web_crawler, 'get_db_connection', return_value=connection),
+            mock.patch.object(web_crawler, 'get_chat_backend', return_value=self.backend),
+            mock.patch.object(web_crawler, 'get_writer'),
+            mock.patch.object(web_crawler, 'get_website_context', return_value=self.context),
+            mock.patch.object(response_cache, '_local', LRUCache(100)),
+            mock.patch.object(Config, 'RESPONSE_CACHE_ENABLED', True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+        self.headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+
+    def chat(self, message='What plans do you cover?'):
+        return self.client.post('/chat', json={'message': message, 'website_id': 3}, headers=self.headers)
+
+    def test_hit_loads_no_context_and_skips_the_llm(self):
+        response_cache.cache_response(3, 5, 'what plans do you cover', 'cached answer')
+        response = self.chat()
+        self.assertEqual(response.get_json(), {'response': 'cached answer'})
+        self.assertEqual(self.cursor.statements, ['SELECT content_version FROM knowledge_base WHERE id = %s'])
+        web_crawler.get_website_context.assert_not_called()
+        self.backend.complete.assert_not_called()
+
+    def test_shared_hit_loads_no_context(self):
+        self.cursor.shared = 'answer from another worker'
+        self.assertEqual(self.chat().get_json(), {'response': 'answer from another worker'})
+        self.assertEqual(len(self.cursor.statements), 2)
+        web_crawler.get_website_context.assert_not_called()
+        self.backend.complete.assert_not_called()
+
+    def test_miss_loads_the_context(self):
+        with mock.patch.object(web_crawler, 'match_training_answer', return_value='curated answer'):
+            self.assertEqual(self.chat().get_json(), {'response': 'curated answer'})
+        web_crawler.get_website_context.assert_called_once()
+
+    def test_unknown_website(self):
+        self.cursor.content_version = None
+        self.assertEqual(self.chat().status_code, 404)
+        web_crawler.get_website_context.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
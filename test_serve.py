@@ -0,0 +1,121 @@
+import socket
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from unittest import mock
+
+import requests
+
+import serve
+import web_crawler
+from config import Config
+from utils.jwt_utils import generate_access_token
+from utils.llm import FakeLLMBackend
+
+
+CONTEXT = [{"role": "user", "content": "User asked: hello there"}]
+
+
+class HeldLLMBackend(FakeLLMBackend):
+    """Keeps every chat request on its worker thread until release()."""
+
+    def __init__(self):
+        super().__init__(latency=0, seconds_per_token=0)
+        self.entered = threading.Semaphore(0)
+        self._released = threading.Event()
+
+    def complete(self, messages, max_tokens):
+        self.entered.release()
+        self._released.wait(30)
+        return super().complete(messages, max_tokens)
+
+    def wait_for(self, count):
+        return all(self.entered.acquire(timeout=10) for _ in range(count))
+
+    def release(self):
+        self._released.set()
+
+
+class LaneServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = HeldLLMBackend()
+        self.addCleanup(self.backend.release)
+        for patcher in (
+            mock.patch.object(web_crawler, 'get_chat_backend', return_value=self.backend),
+            mock.patch.object(web_crawler, '_prepare_chat', return_value=(None, CONTEXT, 1)),
+            mock.patch.object(web_crawler, '_save_chat_turn'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+        self.pool = ThreadPoolExecutor(8)
+        self.addCleanup(self.pool.shutdown)
+
+    def start(self, **lanes):
+        server = serve.make_server('127.0.0.1', 0, **lanes)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.port}'
+
+    def chat(self, url):
+        return self.pool.submit(requests.post, url + '/chat', json={'message': 'hi', 'website_id': 1},
+                                headers=self.headers, timeout=30)
+
+    def dashboard(self, url):
+        return self.pool.submit(requests.get, url + '/dashboard', headers=self.headers, timeout=30)
+
+    def test_fast_routes_are_not_blocked_by_chat(self):
+        url = self.start(api_threads=2, chat_threads=2, chat_queue=1)
+        chats = [self.chat(url) for _ in range(3)]
+        # Both chat threads are busy and the third chat waits in the queue...
+        self.assertTrue(self.backend.wait_for(2))
+        # ...so a fourth is turned away at once.
+        rejected = self.chat(url).result(timeout=10)
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers['Retry-After'], '1')
+
+        # The API lane is untouched: the dashboard answers while every chat is held.
+        self.assertEqual(self.dashboard(url).result(timeout=10).status_code, 200)
+        self.assertFalse(any(chat.done() for chat in chats))
+
+        self.backend.release()
+        self.assertEqual([chat.result(timeout=10).status_code for chat in chats], [200, 200, 200])
+
+    def test_slow_clients_do_not_hold_the_api_lane(self):
+        with mock.patch.object(Config, 'SERVER_CLASSIFY_TIMEOUT', 0.5):
+            url = self.start(api_threads=1, chat_threads=1, chat_queue=0)
+            chat = self.chat(url)
+            self.assertTrue(self.backend.wait_for(1))
+
+            slow = socket.create_connection(('127.0.0.1', int(url.rsplit(':', 1)[1])))
+            self.addCleanup(slow.close)
+            slow.sendall(b'GET /dashboard HT')
+            # The only API thread is not waiting for the rest of the slow request line.
+            self.assertEqual(self.dashboard(url).result(timeout=5).status_code, 200)
+
+            # Once the classifier gives up on it, the slow client goes to the (full) chat lane.
+            slow.settimeout(10)
+            self.assertTrue(slow.recv(1024).startswith(b'HTTP/1.0 503'))
+
+            self.backend.release()
+            self.assertEqual(chat.result(timeout=10).status_code, 200)
+
+    def test_shared_threads_block_fast_routes(self):
+        url = self.start(api_threads=2, chat_threads=0)
+        chats = [self.chat(url) for _ in range(2)]
+        self.assertTrue(self.backend.wait_for(2))
+
+        # Both shared threads are held by chats: the dashboard can only be served after them.
+        dashboard = self.dashboard(url)
+        with self.assertRaises(FutureTimeout):
+            dashboard.result(timeout=0.5)
+
+        self.backend.release()
+        self.assertEqual(dashboard.result(timeout=10).status_code, 200)
+        self.assertEqual([chat.result(timeout=10).status_code for chat in chats], [200, 200])
+
+
+if __name__ == '__main__':
+    unittest.main()
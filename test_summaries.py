@@ -0,0 +1,194 @@
+import json
+import re
+import unittest
+from unittest import mock
+
+import web_crawler
+from app import app
+from config import Config
+from utils.db import PoolTimeout
+from utils.jwt_utils import generate_access_token
+
+
+class FakeCursor:
+    """Answers the /summaries queries from a list of knowledge_base rows."""
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self.connection.queries.append(sql)
+        if sql.startswith('SET TRANSACTION'):
+            return
+        user_id, after_id, *upper = params[:3] if self.name else params[:2]
+        rows = [row for row in self.connection.rows
+                if str(row['user_id']) == str(user_id) and row['id'] > after_id and (not upper or row['id'] <= upper[0])]
+        if self.name is None:  # the versions query
+            self._rows = [(row['id'], row['content_version']) for row in rows[:params[2]]]
+        else:
+            columns = [column.strip() for column in re.search(r'SELECT (.*?) FROM', sql).group(1).split(',')]
+            self._rows = [{column: row[column] for column in columns} for row in rows]
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        self.connection.batches.append(min(size, len(self._rows)))
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+
+class FakeConnection:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.batches = []
+        self.queries = []
+        self.closed = 0
+
+    def cursor(self, name=None, cursor_factory=None):
+        return FakeCursor(self, name)
+
+    def close(self):
+        self.closed += 1
+
+
+class SummariesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        rows = [{'id': website_id, 'website_url': f'https://site{website_id}.example', 'summary': 'x' * 100,
+                 'user_id': 1, 'content_version': 1} for website_id in range(1, 8)]
+        rows.append({'id': 8, 'website_url': 'https://other.example', 'summary': 'y', 'user_id': 2,
+                     'content_version': 1})
+        self.connection = FakeConnection(rows)
+        for patcher in (
+            mock.patch.object(web_crawler, 'get_export_connection', return_value=self.connection),
+            mock.patch.object(Config, 'SUMMARIES_FETCH_SIZE', 3),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+        self.headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+
+    def get(self, query='', **headers):
+        return self.client.get('/summaries' + query, headers=dict(self.headers, **headers))
+
+    def test_streams_every_row_in_batches(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        rows = json.loads(response.get_data(as_text=True))
+        self.assertEqual([row['id'] for row in rows], list(range(1, 8)))
+        self.assertEqual(rows[0]['summary'], 'x' * 100)
+        self.assertLessEqual(max(self.connection.batches), 3)
+        self.assertNotIn('Link', response.headers)
+        self.assertGreaterEqual(self.connection.closed, 1)
+
+    def test_keyset_pages_and_field_selection(self):
+        response = self.get('?limit=3&fields=website_url')
+        rows = json.loads(response.get_data(as_text=True))
+        self.assertEqual(rows, [{'id': website_id, 'website_url': f'https://site{website_id}.example'}
+                                for website_id in (1, 2, 3)])
+        self.assertEqual(response.headers['Link'], '</summaries?after_id=3&limit=3&fields=id%2Cwebsite_url>; rel="next"')
+
+        ids = []
+        query = '?limit=3'
+        while query:
+            response = self.get(query)
+            ids += [row['id'] for row in json.loads(response.get_data(as_text=True))]
+            link = response.headers.get('Link')
+            query = link and link[len('</summaries'):link.index('>')]
+        self.assertEqual(ids, list(range(1, 8)))
+
+    def test_ndjson(self):
+        response = self.get('?after_id=5', Accept='application/x-ndjson')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], [6, 7])
+
+    def test_empty_results(self):
+        self.assertEqual(self.get('?after_id=7').get_data(as_text=True), '[]')
+        self.connection.rows = []
+        self.assertEqual(self.get().status_code, 404)
+
+    def test_unchanged_poll_gets_304_without_reading_rows(self):
+        response = self.get('?limit=3')
+        etag = response.headers['ETag']
+        self.assertEqual(response.headers['Cache-Control'], Config.SUMMARIES_CACHE_CONTROL)
+
+        self.connection.queries.clear()
+        response = self.get('?limit=3', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        self.assertFalse(any('summary' in sql for sql in self.connection.queries))
+
+        # Re-crawling a website on the page bumps its content_version
+        self.connection.rows[1]['content_version'] += 1
+        response = self.get('?limit=3', **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_etag_depends_on_the_representation(self):
+        etags = {self.get(query).headers['ETag'] for query in ('', '?fields=id', '?format=ndjson', '?limit=3')}
+        self.assertEqual(len(etags), 4)
+
+    def test_invalid_parameters(self):
+        for query in ('?limit=0', '?limit=abc', f'?limit={Config.SUMMARIES_MAX_LIMIT + 1}',
+                      '?fields=password_hash', '?format=xml'):
+            with self.subTest(query):
+                self.assertEqual(self.get(query).status_code, 400)
+
+    def test_streams_never_use_the_main_pool(self):
+        with mock.patch.object(web_crawler, 'get_db_connection') as get_db_connection:
+            self.get().get_data()
+        get_db_connection.assert_not_called()
+
+        with mock.patch.object(web_crawler, 'get_export_connection', side_effect=PoolTimeout('busy')):
+            response = self.get()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+
+class SummaryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.row = {'id': 3, 'website_url': 'https://site3.example', 'summary': 'x' * 100, 'user_id': 1,
+                    'content_version': 4}
+        self.queries = []
+        cursor = mock.Mock()
+        cursor.execute.side_effect = lambda sql, params: self.queries.append(sql)
+        cursor.fetchone.side_effect = lambda: {'content_version': self.row['content_version']} \
+            if 'SELECT content_version' in self.queries[-1] else dict(self.row)
+        connection = mock.MagicMock()
+        connection.__enter__.return_value.cursor.return_value = cursor
+        patcher = mock.patch.object(web_crawler, 'get_db_connection', return_value=connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app.test_client()
+        self.headers = {'Authorization': f'Bearer {generate_access_token(1)}'}
+
+    def get(self, **headers):
+        return self.client.get('/summary/3', headers=dict(self.headers, **headers))
+
+    def test_conditional_get(self):
+        response = self.get()
+        self.assertEqual(response.get_json()['summary'], 'x' * 100)
+        etag = response.headers['ETag']
+
+        self.queries.clear()
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(self.queries), 1)
+        self.assertNotIn('SELECT *', self.queries[0])
+
+        self.row['content_version'] += 1
+        response = self.get(**{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest import mock
+
+from config import Config
+from utils.summarization import BatchSummarizer, FakeLLMBackend, TokenRateLimiter
+
+
+class FlakyBackend(FakeLLMBackend):
+    """Fails the first `failures` requests, like a rate-limited API."""
+
+    def __init__(self, failures):
+        super().__init__(latency=0, seconds_per_token=0)
+        self.failures = failures
+
+    def complete(self, messages, max_tokens):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('429 Too Many Requests')
+        return super().complete(messages, max_tokens)
+
+
+class BatchSummarizerTestCase(unittest.TestCase):
+
+    def summarizer(self, backend=None):
+        return BatchSummarizer(max_tokens=5, backend=backend or FakeLLMBackend(latency=0, seconds_per_token=0),
+                               limiter=TokenRateLimiter(10 ** 9, 4), concurrency=2)
+
+    def test_small_pages_are_packed_into_one_request(self):
+        pages = [f'page {number} talks about topic {number} in a few words' for number in range(5)]
+        with self.summarizer() as summarizer:
+            futures = [summarizer.submit(page) for page in pages]
+            summarizer.flush()
+            summaries = [future.result() for future in futures]
+
+        self.assertEqual(summarizer.stats['requests'], 1)
+        self.assertEqual(summarizer.stats['batched_pages'], 5)
+        self.assertEqual(summaries, [' '.join(page.split()[:5])[:20] for page in pages])
+
+    def test_oversized_page_is_split_and_reduced(self):
+        page = ' '.join(f'word{number}' for number in range(Config.SUMMARY_MAX_INPUT_TOKENS * 2))
+        with self.summarizer() as summarizer:
+            summary = summarizer.submit(page).result()
+
+        self.assertEqual(summarizer.stats['split_pages'], 1)
+        self.assertGreater(summarizer.stats['requests'], 2)  # map pieces, then one reduce
+        self.assertEqual(summary, 'word0 word1 word2 wo')
+
+    @mock.patch('utils.summarization.time.sleep')
+    def test_transient_errors_are_retried(self, sleep):
+        with self.summarizer(FlakyBackend(failures=2)) as summarizer:
+            summary = summarizer.submit('a short page').result()
+
+        self.assertEqual(summary, 'a short page')
+        self.assertEqual(summarizer.stats['retries'], 2)
+        self.assertEqual(summarizer.stats['failures'], 0)
+
+    def test_backoff_does_not_hold_a_concurrency_slot(self):
+        limiter = TokenRateLimiter(10 ** 9, 1)
+        slots_free = []
+
+        def sleep(seconds):
+            if not seconds:  # the fake backend's own latency
+                return
+            # Another request can start while this one backs off.
+            acquired = limiter._slots.acquire(blocking=False)
+            if acquired:
+                limiter._slots.release()
+            slots_free.append(acquired)
+
+        summarizer = BatchSummarizer(max_tokens=5, backend=FlakyBackend(failures=2), limiter=limiter, concurrency=1)
+        with summarizer, mock.patch('utils.summarization.time.sleep', side_effect=sleep):
+            self.assertEqual(summarizer.submit('a short page').result(), 'a short page')
+        self.assertEqual(slots_free, [True, True])
+
+    @mock.patch('utils.summarization.time.sleep')
+    def test_falls_back_to_truncation_after_retries(self, sleep):
+        with self.summarizer(FlakyBackend(failures=100)) as summarizer:
+            summary = summarizer.submit('a short page').result()
+
+        self.assertEqual(summary, 'a sho')
+        self.assertEqual(summarizer.stats['failures'], 1)
+
+
+class TokenRateLimiterTestCase(unittest.TestCase):
+
+    def test_waits_when_minute_budget_is_spent(self):
+        clock = [1000.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        limiter = TokenRateLimiter(tokens_per_minute=100, max_concurrency=2)
+        with mock.patch('utils.summarization.time.monotonic', side_effect=lambda: clock[0]), \
+                mock.patch('utils.summarization.time.sleep', side_effect=sleep):
+            limiter.settle(limiter.reserve(80), 80)
+            limiter.settle(limiter.reserve(50), 50)
+        self.assertGreaterEqual(clock[0], 1060)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import web_crawler
+from config import Config
+from utils import summarization, summary_cache
+from utils.summarization import FakeLLMBackend
+
+
+# Small synthetic site: every page links to a few others, some of them repeated.
+SITE = {
+    '/': ['/a', '/b', '/c', '/a#top'],
+    '/a': ['/d', '/b', '/e'],
+    '/b': ['/f', '/', '/g'],
+    '/c': ['/h', '/logo.png'],
+    '/d': ['/i'],
+    '/e': [],
+    '/f': ['/j'],
+    '/g': [],
+    '/h': [],
+    '/i': [],
+    '/j': [],
+}
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    delays = {}
+    etags = {}
+    texts = {}
+    footer = ''
+
+    def do_GET(self):
+        links = SITE.get(self.path)
+        if links is None:
+            self.send_error(404)
+            return
+        time.sleep(self.delays.get(self.path, 0))
+        etag = self.etags.get(self.path)
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        anchors = ''.join(f'<a href="{href}">{href}</a>' for href in links)
+        text = self.texts.get(self.path, f'Page {self.path}')
+        body = f'<html><body><p>{text}</p>{anchors}{self.footer}</body></html>'.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CrawlMajorPagesTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SiteHandler)
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_port}/'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.backend = FakeLLMBackend(latency=0, seconds_per_token=0)
+        patcher = mock.patch.object(summarization, 'get_backend', return_value=self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(Config, 'SUMMARY_CACHE_SHARED', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        summary_cache._local.clear()
+
+    def crawled_paths(self, summaries):
+        return [item['url'][len(self.base_url) - 1:] for item in summaries]
+
+    def test_breadth_first_order(self):
+        summaries = web_crawler.crawl_major_pages(self.base_url, max_pages=8, concurrency=1)
+        self.assertEqual(self.crawled_paths(summaries), ['/', '/a', '/b', '/c', '/d', '/e', '/f', '/g'])
+
+    def test_concurrent_crawl_is_deterministic(self):
+        expected = web_crawler.crawl_major_pages(self.base_url, max_pages=9, concurrency=1)
+        # Make early pages slow so later pages finish first.
+        with mock.patch.dict(SiteHandler.delays, {'/': 0.05, '/a': 0.05}):
+            for _ in range(3):
+                result = web_crawler.crawl_major_pages(self.base_url, max_pages=9, concurrency=8, per_host_limit=8)
+                self.assertEqual(result, expected)
+
+    def test_recrawl_skips_unchanged_pages(self):
+        with mock.patch.dict(SiteHandler.etags, {'/': '"root-v1"', '/a': '"a-v1"'}):
+            first = web_crawler.crawl_major_pages(self.base_url, max_pages=6)
+            self.assertTrue(all(page['changed'] for page in first))
+            state = {page['url']: page for page in first}
+
+            self.backend.documents = 0
+            second = web_crawler.crawl_major_pages(self.base_url, max_pages=6, page_state=state)
+
+        # '/' and '/a' answer 304, the rest hash to the same content.
+        self.assertEqual(self.backend.documents, 0)
+        self.assertEqual([page['url'] for page in second], [page['url'] for page in first])
+        self.assertEqual([page['summary'] for page in second], [page['summary'] for page in first])
+        self.assertFalse(any(page['changed'] for page in second))
+
+    def test_recrawl_resummarizes_changed_pages(self):
+        first = web_crawler.crawl_major_pages(self.base_url, max_pages=3)
+        state = {page['url']: dict(page) for page in first}
+        state[self.base_url + 'a']['content_hash'] = 'stale'
+
+        self.backend.documents = 0
+        summary_cache._local.clear()
+        second = web_crawler.crawl_major_pages(self.base_url, max_pages=3, page_state=state)
+        self.assertEqual(self.backend.documents, 1)
+        self.assertEqual([page['changed'] for page in second], [False, True, False])
+
+    def test_duplicate_bodies_are_summarized_once(self):
+        stats = {}
+        with mock.patch.dict(SiteHandler.texts, {'/e': 'Same body', '/g': 'Same body'}):
+            first = web_crawler.crawl_major_pages(self.base_url, max_pages=8, stats=stats)
+            self.assertEqual(self.backend.documents, 7)
+            self.assertEqual(stats['dedupe_ratio'], 0.125)
+            summaries = {page['url']: page['summary'] for page in first}
+            self.assertEqual(summaries[self.base_url + 'e'], summaries[self.base_url + 'g'])
+
+            # A later crawl, e.g. for another user, reuses every summary.
+            self.backend.documents = 0
+            web_crawler.crawl_major_pages(self.base_url, max_pages=8, stats=stats)
+        self.assertEqual(self.backend.documents, 0)
+        self.assertEqual(stats['dedupe_ratio'], 1.0)
+
+    def test_near_duplicates_are_skipped_and_their_links_deferred(self):
+        words = ' '.join(f'listing item {number} with price and rating' for number in range(20))
+        texts = {'/b': f'Page two of results {words}', '/c': f'Page three of results {words}'}
+        with mock.patch.dict(SiteHandler.texts, texts):
+            stats = {}
+            summaries = web_crawler.crawl_major_pages(self.base_url, max_pages=8, concurrency=8, stats=stats)
+            self.assertEqual(self.crawled_paths(summaries), ['/', '/a', '/b', '/d', '/e', '/f', '/g', '/i'])
+            self.assertEqual(stats['near_duplicates'], 1)
+
+            # '/h' is only linked from the near-duplicate '/c': crawled last.
+            summaries = web_crawler.crawl_major_pages(self.base_url, max_pages=20)
+            self.assertEqual(self.crawled_paths(summaries)[-2:], ['/j', '/h'])
+
+    def test_boilerplate_is_kept_only_on_first_page(self):
+        footer = '<footer><p>Call us at 555-0100</p><p>Accept cookies</p></footer>'
+        with mock.patch.object(SiteHandler, 'footer', footer):
+            stats = {}
+            summaries = web_crawler.crawl_major_pages(self.base_url, max_pages=6, concurrency=4, stats=stats)
+
+        self.assertIn('Call us at 555-0100 Accept cookies', summaries[0]['content'])
+        for page in summaries[1:]:
+            self.assertNotIn('555-0100', page['content'])
+            self.assertNotIn('Accept cookies', page['content'])
+            self.assertGreater(page['boilerplate_bytes'], 0)
+        self.assertGreaterEqual(stats['boilerplate_bytes_removed'], 5 * len('Call us at 555-0100 Accept cookies'))
+
+    def test_boilerplate_is_learned_from_unchanged_pages(self):
+        footer = '<footer><p>Call us at 555-0100</p><p>Accept cookies</p></footer>'
+        etags = {path: f'"{path}-v1"' for path in ('/', '/a', '/b', '/c', '/d')}
+        with mock.patch.object(SiteHandler, 'footer', footer), mock.patch.dict(SiteHandler.etags, etags):
+            first = web_crawler.crawl_major_pages(self.base_url, max_pages=6)
+            state = {page['url']: page for page in first}
+            # Only '/e' changed; every other page answers 304 and brings its stored lines.
+            with mock.patch.dict(SiteHandler.texts, {'/e': 'New opening hours'}):
+                second = web_crawler.crawl_major_pages(self.base_url, max_pages=6, page_state=state)
+
+        self.assertEqual([page['changed'] for page in second], [False] * 5 + [True])
+        self.assertEqual(second[5]['content'], 'New opening hours')
+        self.assertEqual(second[0]['lines'], first[0]['lines'])
+
+    def test_repeated_inline_markup_is_not_boilerplate(self):
+        texts = {path: f'Page {path}: enroll in <a href="/plans">Medicare Advantage</a> before <b>March</b>.'
+                 for path in SITE}
+        submit = summary_cache.CrawlSummaryCache.submit
+        submitted = []
+
+        def record(cache, text, digest):
+            submitted.append((text, digest))
+            return submit(cache, text, digest)
+
+        with mock.patch.dict(SiteHandler.texts, texts), \
+                mock.patch.object(summary_cache.CrawlSummaryCache, 'submit', record):
+            summaries = web_crawler.crawl_major_pages(self.base_url, max_pages=6, concurrency=4)
+
+        for page in summaries:
+            path = page['url'][len(self.base_url) - 1:]
+            self.assertIn(f'Page {path}: enroll in Medicare Advantage before March.', page['content'])
+        # The summary cache is keyed on the text that is summarized, not on the raw page
+        self.assertTrue(submitted)
+        for text, digest in submitted:
+            self.assertEqual(digest, web_crawler.content_hash(text))
+
+    def test_failed_summaries_are_redone_on_the_next_crawl(self):
+        with mock.patch.dict(SiteHandler.etags, {'/': '"root-v1"'}), \
+                mock.patch.object(Config, 'LLM_MAX_RETRIES', 0), \
+                mock.patch.object(self.backend, 'complete', side_effect=ValueError('model overloaded')):
+            first = web_crawler.crawl_major_pages(self.base_url, max_pages=3)
+        self.assertTrue(all(isinstance(page['summary'], summarization.FallbackSummary) for page in first))
+
+        connection = mock.MagicMock()
+        connection.__enter__.return_value.cursor.return_value.fetchone.return_value = (7,)
+        with mock.patch.object(web_crawler, 'get_db_connection', return_value=connection), \
+                mock.patch.object(web_crawler, 'execute_values') as execute_values, \
+                mock.patch.object(web_crawler, 'save_page_chunks', return_value=([], [])):
+            self.assertEqual(web_crawler.save_summary_to_db(self.base_url, first, 1), 7)
+        rows = execute_values.call_args[0][2]
+        self.assertEqual([row[2:5] for row in rows], [(None, None, None)] * 3)
+
+        # The stored state no longer matches: every page is fetched and summarized again
+        state = {url: dict(zip(('etag', 'last_modified', 'content_hash', 'summary', 'links', 'lines'), values))
+                 for _, url, *values in rows}
+        self.backend.documents = 0
+        with mock.patch.dict(SiteHandler.etags, {'/': '"root-v1"'}):
+            second = web_crawler.crawl_major_pages(self.base_url, max_pages=3, page_state=state)
+        self.assertEqual(self.backend.documents, 3)
+        self.assertTrue(all(page['changed'] for page in second))
+
+    def test_per_host_limit(self):
+        limiter = web_crawler.HostLimiter(max_per_host=2)
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def hit():
+            with limiter.slot('http://example.com/page'):
+                with lock:
+                    active[0] += 1
+                    peak[0] = max(peak[0], active[0])
+                time.sleep(0.02)
+                with lock:
+                    active[0] -= 1
+
+        threads = [threading.Thread(target=hit) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak[0], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
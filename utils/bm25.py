@@ -0,0 +1,208 @@
+import heapq
+import math
+import re
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+
+from config import Config
+from utils.lru import LRUCache
+
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+STOPWORDS = frozenset('''
+a about an and are as at be but by can do does for from has have how i if in is it its
+me my no not of on or our so than that the their them then there these they this to
+us was we what when where which who why will with you your
+'''.split())
+
+FORMAT_MAGIC = b'BM25'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sHIId')
+
+
+def tokenize(text):
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _pack(values):
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring over one website's knowledge chunks.
+
+    Postings are kept array-backed: for term number t, its documents are
+    `doc_postings[offsets[t]:offsets[t + 1]]` with matching `tf_postings`.
+    Documents are referred to by position; `doc_ids` maps them back to
+    knowledge_chunks ids.
+    """
+
+    def __init__(self, doc_ids, doc_lengths, terms, offsets, doc_postings, tf_postings, avgdl,
+                 k1=1.5, b=0.75):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.term_ids = {term: index for index, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_postings = doc_postings
+        self.tf_postings = tf_postings
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+        # Per-document length normalisation, precomputed once per load.
+        self._norms = [k1 * (1 - b + b * length / avgdl) if avgdl else k1 for length in doc_lengths]
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Build an index from (doc_id, text) pairs.
+        """
+        doc_ids = array('i')
+        doc_lengths = array('I')
+        postings = {}
+        for position, (doc_id, text) in enumerate(documents):
+            tokens = tokenize(text)
+            doc_ids.append(doc_id)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings.setdefault(term, []).append((position, tf))
+
+        terms = sorted(postings)
+        offsets = array('I', [0])
+        doc_postings = array('I')
+        tf_postings = array('H')
+        for term in terms:
+            for position, tf in postings[term]:
+                doc_postings.append(position)
+                tf_postings.append(min(tf, 0xFFFF))
+            offsets.append(len(doc_postings))
+
+        avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        return cls(doc_ids, doc_lengths, terms, offsets, doc_postings, tf_postings, avgdl)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, query, k=10):
+        """
+        Return up to `k` (doc_id, score) pairs, best first.
+        """
+        n_docs = len(self.doc_ids)
+        scores = {}
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            df = end - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            weight = idf * (self.k1 + 1)
+            norms = self._norms
+            for position, tf in zip(self.doc_postings[start:end], self.tf_postings[start:end]):
+                scores[position] = scores.get(position, 0.0) + weight * tf / (tf + norms[position])
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [(self.doc_ids[position], score) for position, score in best]
+
+    def to_bytes(self):
+        terms = '\0'.join(self.terms).encode('utf-8')
+        sections = [
+            _pack(self.doc_ids), _pack(self.doc_lengths), terms,
+            _pack(self.offsets), _pack(self.doc_postings), _pack(self.tf_postings),
+        ]
+        header = _HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, len(self.doc_ids), len(self.terms), self.avgdl)
+        lengths = struct.pack(f'<{len(sections)}Q', *(len(section) for section in sections))
+        return zlib.compress(header + lengths + b''.join(sections))
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = zlib.decompress(data)
+        magic, version, _n_docs, n_terms, avgdl = _HEADER.unpack_from(data)
+        if magic != FORMAT_MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Unsupported BM25 index format')
+        position = _HEADER.size
+        lengths = struct.unpack_from('<6Q', data, position)
+        position += struct.calcsize('<6Q')
+        sections = []
+        for length in lengths:
+            sections.append(data[position:position + length])
+            position += length
+
+        terms = sections[2].decode('utf-8').split('\0') if n_terms else []
+        return cls(
+            _unpack('i', sections[0]), _unpack('I', sections[1]), terms,
+            _unpack('I', sections[3]), _unpack('I', sections[4]), _unpack('H', sections[5]), avgdl,
+        )
+
+
+def build_website_index(cursor, website_id):
+    """
+    Rebuild and store the BM25 index over a website's knowledge_chunks.
+
+    Runs inside the caller's transaction, so the index always matches the
+    chunks committed with it.
+    """
+    cursor.execute('''
+        SELECT id, chunk_text FROM knowledge_chunks WHERE website_id = %s ORDER BY id
+    ''', (website_id,))
+    index = BM25Index.build(cursor.fetchall())
+    cursor.execute('''
+        INSERT INTO knowledge_indexes (website_id, index_data, version, built_at)
+        VALUES (%s, %s, 1, NOW())
+        ON CONFLICT (website_id) DO UPDATE SET
+            index_data = EXCLUDED.index_data,
+            version = knowledge_indexes.version + 1,
+            built_at = NOW()
+    ''', (website_id, index.to_bytes()))
+    return index
+
+
+# website_id -> (version, BM25Index), shared by all requests in this worker
+_index_cache = LRUCache(Config.BM25_CACHE_SIZE)
+
+
+def load_website_index(cursor, website_id):
+    """
+    Return the website's BM25 index, or None if it has not been built.
+
+    The cached copy is reused while its version matches the stored one; the
+    index blob is only transferred when it changed.
+    """
+    cached = _index_cache.get(website_id)
+    cached_version = cached[0] if cached else -1
+    cursor.execute('''
+        SELECT version, CASE WHEN version <> %s THEN index_data END
+        FROM knowledge_indexes WHERE website_id = %s
+    ''', (cached_version, website_id))
+    row = cursor.fetchone()
+    if not row:
+        _index_cache.pop(website_id)
+        return None
+
+    version, data = row
+    if data is None:
+        return cached[1]
+    index = BM25Index.from_bytes(bytes(data))
+    _index_cache.put(website_id, (version, index))
+    return index
+
+
+def index_cache_stats():
+    return _index_cache.stats()
@@ -0,0 +1,36 @@
+"""
+Site-wide boilerplate detection for one crawl.
+
+Navigation bars, footers, cookie banners and sidebars repeat the same text
+on every page of a site. Pages are compared line by line, where a line is a
+whole block of text (a paragraph, list item, nav or footer; see
+utils.html_extract), never a link or bold run inside a sentence. Lines seen
+on at least Config.BOILERPLATE_MIN_PAGES pages of the crawl are kept only on
+the first page they appeared on (so e.g. the footer's phone number is still
+known once) and stripped from all the others before summarization and
+chunking.
+"""
+from config import Config
+
+
+class BoilerplateDetector:
+
+    def __init__(self, min_pages=None):
+        self.min_pages = min_pages or Config.BOILERPLATE_MIN_PAGES
+        self._counts = {}  # line -> number of pages containing it
+        self._first_page = {}  # line -> key of the first page containing it
+        self.pages = 0
+
+    def observe(self, key, lines):
+        """Count the distinct lines of one page."""
+        self.pages += 1
+        for line in set(lines):
+            self._counts[line] = self._counts.get(line, 0) + 1
+            self._first_page.setdefault(line, key)
+
+    def is_boilerplate(self, line):
+        return self._counts.get(line, 0) >= self.min_pages
+
+    def strip(self, key, lines):
+        """Return the lines of page `key` without the boilerplate other pages already carry."""
+        return [line for line in lines if not self.is_boilerplate(line) or self._first_page[line] == key]
@@ -0,0 +1,212 @@
+"""
+Per-website chat context, cached in each worker.
+
+Every chat message needs the website's content_version, its summary, its
+whole training_data set (for curated answers and the prompt) and its BM25
+index. They only change when the site is re-crawled or retrained, so each
+worker keeps them in memory (an LRU bounded by Config.CONTEXT_CACHE_BYTES)
+instead of reading them from Postgres on every message.
+
+Staleness is handled with LISTEN/NOTIFY: a trigger on knowledge_base sends
+the website ID on the 'website_context' channel whenever a row is updated
+or deleted. That covers save_summary_to_db and every training_data write,
+which bumps knowledge_base.content_version. One listener thread per worker
+drops the matching entry. While the listener is not connected, contexts
+are still loaded but neither cached nor served from the cache. After a
+reconnect the whole cache is cleared, because notifications sent in the
+meantime are lost.
+"""
+import os
+import select
+import sys
+import threading
+
+import psycopg2
+
+from config import Config
+from utils.bm25 import load_website_index
+from utils.db import get_pool
+from utils.faq import CuratedAnswers
+from utils.lru import LRUCache
+
+
+CHANNEL = 'website_context'
+
+
+class WebsiteContext:
+    """Everything the chatbot reads about one website that only changes on re-crawl or retraining."""
+
+    def __init__(self, website_id, content_version, summary, training_rows, bm25_index):
+        self.website_id = website_id
+        self.content_version = content_version
+        self.summary = summary or ''
+        self.training_data = [(question, answer) for _, question, answer in training_rows]
+        self.answers = CuratedAnswers(training_rows)
+        self.bm25_index = bm25_index
+        self.nbytes = self._estimate_bytes(training_rows)
+
+    def _estimate_bytes(self, training_rows):
+        size = sys.getsizeof(self.summary)
+        for _, question, answer in training_rows:
+            # The strings, the prompt pair and the exact-match key, plus trigram postings.
+            size += 2 * sys.getsizeof(question) + sys.getsizeof(answer) + 8 * len(question) + 200
+        index = self.bm25_index
+        if index is not None:
+            for values in (index.doc_ids, index.doc_lengths, index.offsets, index.doc_postings, index.tf_postings):
+                size += values.itemsize * len(values)
+            size += sum(sys.getsizeof(term) + 100 for term in index.terms) + 32 * len(index.doc_ids)
+        return size
+
+
+def load_website_context(cursor, website_id):
+    """Read a website's context from the database, or None if the website does not exist."""
+    cursor.execute('SELECT content_version, summary FROM knowledge_base WHERE id = %s', (website_id,))
+    website = cursor.fetchone()
+    if not website:
+        return None
+    cursor.execute('SELECT id, question, answer FROM training_data WHERE website_id = %s', (website_id,))
+    training_rows = cursor.fetchall()
+    bm25_index = load_website_index(cursor, website_id) if Config.KNOWLEDGE_RETRIEVER in ('bm25', 'hybrid') else None
+    return WebsiteContext(website_id, website[0], website[1], training_rows, bm25_index)
+
+
+class ContextCache:
+    """
+    Byte-bounded LRU of WebsiteContext objects kept fresh by a LISTEN thread.
+
+    Parameters:
+    - maxbytes: Bound on the estimated size of the cached contexts.
+    """
+
+    def __init__(self, maxbytes=None):
+        self._cache = LRUCache(sys.maxsize, maxbytes=maxbytes or Config.CONTEXT_CACHE_BYTES,
+                               sizeof=lambda context: context.nbytes)
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a load that raced with one is not cached.
+        self._generation = 0
+        self.listening = False
+        self.invalidations = 0
+        self.pid = os.getpid()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._listen, name='context-listener', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def get(self, cursor, website_id):
+        """Return the website's context, from the cache when it is known to be current."""
+        if self.listening:
+            context = self._cache.get(website_id)
+            if context is not None:
+                return context
+        generation = self._generation
+        context = load_website_context(cursor, website_id)
+        if context is not None:
+            with self._lock:
+                if self.listening and generation == self._generation:
+                    self._cache.put(website_id, context)
+        return context
+
+    def invalidate(self, website_id=None):
+        """Drop one website's context, or every context if website_id is None."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if website_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(website_id)
+
+    def _set_listening(self, listening):
+        with self._lock:
+            self.listening = listening
+        # Anything cached before this point may have missed a notification.
+        self.invalidate()
+
+    def _listen(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**get_pool().dsn_kwargs)
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN {CHANNEL};')
+                self._set_listening(True)
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], Config.CONTEXT_CACHE_LISTEN_TIMEOUT) == ([], [], []):
+                        # Idle: make sure the connection is still alive.
+                        conn.cursor().execute('SELECT 1;')
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.invalidate(int(notify.payload))
+            except Exception as e:
+                print(f"Error listening for website context changes: {e}")
+            finally:
+                if self.listening:
+                    self._set_listening(False)
+                if conn is not None:
+                    conn.close()
+            self._stop.wait(Config.CONTEXT_CACHE_RECONNECT_DELAY)
+
+    def stats(self):
+        stats = self._cache.stats()
+        return {
+            'entries': stats['entries'],
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+            'hit_rate': stats['hit_rate'],
+            'resident_bytes': stats['bytes'],
+            'max_bytes': stats['maxbytes'],
+            'listening': self.listening,
+            'invalidations': self.invalidations,
+        }
+
+
+_context_cache = None
+_context_cache_lock = threading.Lock()
+
+
+def get_context_cache():
+    """Return this worker's context cache, starting its listener on first use (and again after fork)."""
+    global _context_cache
+    cache = _context_cache
+    if cache is not None and cache.pid == os.getpid():
+        return cache
+    with _context_cache_lock:
+        if _context_cache is None or _context_cache.pid != os.getpid():
+            _context_cache = ContextCache().start()
+        return _context_cache
+
+
+def get_website_context(cursor, website_id):
+    """
+    The website's chat context, or None if it does not exist.
+
+    Parameters:
+    - cursor: Used only when the context is not cached.
+    - website_id: The ID of the website in the knowledge base.
+    """
+    if not Config.CONTEXT_CACHE_ENABLED:
+        return load_website_context(cursor, website_id)
+    return get_context_cache().get(cursor, website_id)
+
+
+def invalidate_website_context(website_id):
+    """
+    Drop a website's context in this worker right away. Other workers hear
+    about the change from the database trigger once it commits.
+    """
+    cache = _context_cache
+    if cache is not None and cache.pid == os.getpid():
+        cache.invalidate(website_id)
+
+
+def context_cache_stats():
+    cache = _context_cache
+    return cache.stats() if cache is not None and cache.pid == os.getpid() else {}
@@ -0,0 +1,276 @@
+"""
+Write-behind buffer for chat turns.
+
+The chatbot used to open a connection after every answer just to insert one
+conversation_history row. Turns are now queued and a background thread
+writes them in batches (one multi-row INSERT per batch, plus the matching
+chat_response_cache upserts) once Config.CONVERSATION_BATCH_SIZE turns are
+waiting or Config.CONVERSATION_FLUSH_INTERVAL seconds have passed.
+
+The queue is bounded: when it is full, callers wait up to
+Config.CONVERSATION_ENQUEUE_TIMEOUT for room and then write their turn
+themselves, so a slow database slows chats down instead of growing memory.
+Turns not yet written stay visible to recent_history, and close_writer()
+(called on shutdown and at exit) writes everything still queued.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+
+from psycopg2.extras import execute_values
+
+from config import Config
+from utils.db import get_db_connection
+from utils.response_cache import store_responses
+
+
+_STOP = object()
+
+# Written turns remembered per website (sequence -> conversation_history id),
+# so recent_history can tell a just-written turn from an older identical one.
+_WRITTEN_KEPT = 100
+
+
+class ConversationWriter:
+    """
+    Parameters:
+    - batch_size: Most turns written per INSERT.
+    - flush_interval: Longest time a turn waits in the queue, in seconds.
+    - max_queue: Turns that may wait before callers are held back.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None, max_queue=None):
+        self.batch_size = batch_size or Config.CONVERSATION_BATCH_SIZE
+        self.flush_interval = Config.CONVERSATION_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._queue = queue.Queue(maxsize=max_queue or Config.CONVERSATION_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._pending = {}  # website_id -> {sequence: (user_message, assistant_response)}
+        self._written = {}  # website_id -> {sequence: conversation_history id}, the last _WRITTEN_KEPT
+        self._sequence = 0
+        self.pid = os.getpid()
+        self.stats = {'turns': 0, 'batches': 0, 'direct_writes': 0, 'failures': 0, 'dropped': 0}
+        self._thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+        self._thread.start()
+
+    def append(self, website_id, user_message, assistant_response, cache_row=None):
+        """
+        Queue one chat turn, with an optional store_responses row for the
+        shared response cache.
+        """
+        with self._lock:
+            self._sequence += 1
+            turn = (self._sequence, website_id, user_message, assistant_response, cache_row)
+            self._pending.setdefault(website_id, {})[turn[0]] = (user_message, assistant_response)
+            self.stats['turns'] += 1
+        try:
+            self._queue.put(turn, timeout=Config.CONVERSATION_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with self._lock:
+                self.stats['direct_writes'] += 1
+            self._write([turn])
+
+    def recent(self, website_id):
+        """Turns of a website not yet written, newest first."""
+        return [turn for _, turn in self.pending(website_id)]
+
+    def pending(self, website_id):
+        """(sequence, turn) pairs of a website not yet written, newest first."""
+        with self._lock:
+            return list(reversed(self._pending.get(website_id, {}).items()))
+
+    def written_ids(self, website_id, sequences):
+        """The conversation_history IDs of those of `sequences` that have been written since."""
+        with self._lock:
+            written = self._written.get(website_id, {})
+            return {written[sequence] for sequence in sequences if sequence in written}
+
+    def flush(self, timeout=None):
+        """Block until every turn queued so far is written."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=None):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, waiters = [], []
+            (waiters if isinstance(item, threading.Event) else batch).append(item)
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size and not waiters:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                (waiters if isinstance(item, threading.Event) else batch).append(item)
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _record_written(self, batch, ids):
+        with self._lock:
+            for (sequence, website_id, *_), row_id in zip(batch, ids):
+                written = self._written.setdefault(website_id, {})
+                written[sequence] = row_id
+                if len(written) > _WRITTEN_KEPT:
+                    del written[next(iter(written))]
+
+    def _write(self, batch):
+        rows = [(website_id, user_message, assistant_response)
+                for _, website_id, user_message, assistant_response, _ in batch]
+        cache_rows = [cache_row for *_, cache_row in batch if cache_row]
+        try:
+            for attempt in range(Config.CONVERSATION_WRITE_RETRIES + 1):
+                try:
+                    with get_db_connection() as conn:
+                        cursor = conn.cursor()
+                        ids = execute_values(cursor, '''
+                            INSERT INTO conversation_history (website_id, user_message, assistant_response)
+                            VALUES %s
+                            RETURNING id
+                        ''', rows, fetch=True)
+                        store_responses(cursor, cache_rows)
+                        # Recorded before the commit, so any read that sees the rows also sees their IDs.
+                        # A multi-row INSERT returns its rows in VALUES order.
+                        self._record_written(batch, [row[0] for row in ids])
+                    with self._lock:
+                        self.stats['batches'] += 1
+                    return
+                except Exception as e:
+                    print(f"Error writing conversation history ({len(rows)} turns): {e}")
+                    with self._lock:
+                        self.stats['failures'] += 1
+                    if attempt < Config.CONVERSATION_WRITE_RETRIES:
+                        time.sleep(2 ** attempt)
+            with self._lock:
+                self.stats['dropped'] += len(rows)
+        finally:
+            with self._lock:
+                for sequence, website_id, *_ in batch:
+                    turns = self._pending.get(website_id)
+                    if turns is not None:
+                        turns.pop(sequence, None)
+                        if not turns:
+                            del self._pending[website_id]
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return this process's writer, starting it on first use (and again after fork)."""
+    global _writer
+    writer = _writer
+    if writer is not None and writer.pid == os.getpid():
+        return writer
+    with _writer_lock:
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = ConversationWriter()
+        return _writer
+
+
+def close_writer(timeout=None):
+    """Write every queued turn and stop the writer thread."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None and _writer.pid == os.getpid():
+            _writer.close(timeout)
+        _writer = None
+
+
+atexit.register(close_writer)
+
+
+def recent_history(cursor, website_id, limit=4):
+    """
+    The last `limit` turns of a website as (user_message, assistant_response)
+    rows, newest first, including turns this process has not written yet.
+    """
+    # Read the queue first: a turn written between the two reads then shows
+    # up twice rather than not at all, and its row is skipped below by ID.
+    # Identical turns are not merged, so a repeated question is kept.
+    writer = get_writer()
+    pending = writer.pending(website_id)
+    cursor.execute('''
+        SELECT id, user_message, assistant_response
+        FROM conversation_history
+        WHERE website_id = %s
+        ORDER BY id DESC LIMIT %s
+    ''', (website_id, limit))
+    rows = cursor.fetchall()
+    written = writer.written_ids(website_id, [sequence for sequence, _ in pending])
+    history = [turn for _, turn in pending]
+    history.extend((user_message, assistant_response)
+                   for row_id, user_message, assistant_response in rows if row_id not in written)
+    return history[:limit]
+
+
+def archive_conversations(days=None, batch_size=None):
+    """
+    Move turns older than the retention period to conversation_history_archive.
+
+    Runs in batches of Config.CONVERSATION_ARCHIVE_BATCH rows, one transaction
+    each, so it never holds long locks on the live table; SKIP LOCKED lets
+    several workers run it at once.
+
+    Turns from before conversation_history.created_at was added carry the
+    time of that migration instead of their own, so they are archived that
+    many days after the upgrade.
+
+    Returns:
+    - The number of turns archived.
+    """
+    days = Config.CONVERSATION_RETENTION_DAYS if days is None else days
+    batch_size = batch_size or Config.CONVERSATION_ARCHIVE_BATCH
+    if days <= 0:
+        return 0
+
+    archived = 0
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH moved AS (
+                    DELETE FROM conversation_history
+                    WHERE id IN (
+                        SELECT id FROM conversation_history
+                        WHERE created_at < NOW() - make_interval(days => %s)
+                        ORDER BY created_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING id, website_id, user_message, assistant_response, created_at
+                )
+                INSERT INTO conversation_history_archive (id, website_id, user_message, assistant_response, created_at)
+                SELECT id, website_id, user_message, assistant_response, created_at FROM moved
+                ON CONFLICT (id) DO NOTHING
+            ''', (days, batch_size))
+            moved = cursor.rowcount
+        archived += moved
+        if moved < batch_size:
+            return archived
+
+
+def conversation_writer_stats():
+    writer = _writer
+    if writer is None:
+        return {}
+    with writer._lock:
+        stats = dict(writer.stats)
+        stats['pending'] = sum(len(turns) for turns in writer._pending.values())
+    return stats
@@ -1,18 +1,341 @@
+import os
+import threading
+import time
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from config import Config
 
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available within the timeout."""
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection checked out from a ConnectionPool.
+
+    Attribute access is forwarded to the underlying connection. Calling close()
+    (or leaving a `with` block) hands the connection back to the pool instead of
+    tearing down the socket, so existing `conn.close()` call sites keep working.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError('connection already returned to the pool')
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        if name in ('_pool', '_conn'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = self._conn
+        if conn is not None and not conn.closed and not conn.autocommit:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        self.close()
+        return False
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __del__(self):
+        # Safety net for call sites that forget to close: never leak the slot.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are created lazily up to `max_size`. Checkout blocks for at most
+    `timeout` seconds when the pool is exhausted and raises PoolTimeout after that.
+    Idle connections older than `healthcheck_interval` seconds are pinged with
+    `SELECT 1` before being handed out; broken connections are discarded.
+    """
+
+    def __init__(self, dsn_kwargs, min_size=0, max_size=10, timeout=5.0, healthcheck_interval=30.0):
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+        self.dsn_kwargs = dsn_kwargs
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.pid = os.getpid()
+
+        self._idle = []  # list of (connection, returned_at)
+        self._in_use = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counters = {
+            'created': 0,
+            'checkouts': 0,
+            'discarded': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+        }
+
+        for _ in range(self.min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.dsn_kwargs)
+        with self._cond:
+            self._counters['created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - idle_since < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._counters['discarded'] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Check out a raw connection, blocking up to `timeout` seconds."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise psycopg2.InterfaceError('connection pool is closed')
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._in_use < self.max_size:
+                    # Reserve the slot now, connect outside the lock.
+                    self._in_use += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f'No database connection available within {self.timeout}s '
+                        f'(max_size={self.max_size})'
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+        try:
+            if conn is not None and not self._is_healthy(conn, idle_since):
+                with self._cond:
+                    self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._counters['checkouts'] += 1
+            self._counters['wait_time_total'] += time.monotonic() - started
+        return conn
+
+    def release(self, conn):
+        """Return a raw connection to the pool, resetting any session state."""
+        keep = not conn.closed
+        if keep:
+            try:
+                if conn.autocommit:
+                    conn.autocommit = False
+                elif conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        with self._cond:
+            self._in_use -= 1
+            if keep and not self._closed:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._discard(conn)
+            self._cond.notify()
+
+    def connection(self):
+        """Check out a connection wrapped so close()/`with` return it to the pool."""
+        return PooledConnection(self, self.getconn())
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_size': self.max_size,
+                'size': self._in_use + len(self._idle),
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                **self._counters,
+            }
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+_pool = None
+_export_pool = None
+_pool_lock = threading.Lock()
+
+
+def _dsn_kwargs():
+    return {
+        'host': Config.DB_HOST,
+        'database': Config.DB_NAME,
+        'user': Config.DB_USER,
+        'password': Config.DB_PASSWORD,
+    }
+
+
+def get_pool():
+    """
+    Return the process-wide connection pool, creating it on first use.
+
+    A pool inherited across fork() is never reused: the child builds its own so
+    two processes never share a socket.
+    """
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                dsn_kwargs=_dsn_kwargs(),
+                min_size=Config.DB_POOL_MIN_SIZE,
+                max_size=Config.DB_POOL_MAX_SIZE,
+                timeout=Config.DB_POOL_TIMEOUT,
+                healthcheck_interval=Config.DB_POOL_HEALTHCHECK_INTERVAL,
+            )
+        return _pool
+
+
+def get_export_pool():
+    """
+    Return the process-wide pool for streamed responses (GET /summaries).
+
+    A streamed response keeps its connection until the client has read the
+    whole body, however slowly, so these get a few connections of their own
+    and can never starve the main pool.
+    """
+    global _export_pool
+    pool = _export_pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pool_lock:
+        if _export_pool is None or _export_pool.pid != os.getpid():
+            _export_pool = ConnectionPool(
+                dsn_kwargs=_dsn_kwargs(),
+                max_size=Config.DB_EXPORT_POOL_SIZE,
+                timeout=Config.DB_EXPORT_POOL_TIMEOUT,
+                healthcheck_interval=Config.DB_POOL_HEALTHCHECK_INTERVAL,
+            )
+        return _export_pool
+
+
 def get_db_connection():
-    return psycopg2.connect(
-        host=Config.DB_HOST,
-        database=Config.DB_NAME,
-        user=Config.DB_USER,
-        password=Config.DB_PASSWORD
-    )
+    """
+    Check out a pooled connection.
+
+    Use it as a context manager (`with get_db_connection() as conn:`) so it is
+    committed/rolled back and returned to the pool even on early returns.
+    """
+    return get_pool().connection()
+
+
+def get_export_connection():
+    """Check out a connection from the export pool; raises PoolTimeout when all are streaming."""
+    return get_export_pool().connection()
+
+
+def get_pool_stats():
+    return get_pool().stats()
+
+
+def get_export_pool_stats():
+    return get_export_pool().stats()
+
+
+def close_pool():
+    global _pool, _export_pool
+    with _pool_lock:
+        for pool in (_pool, _export_pool):
+            if pool is not None:
+                pool.close()
+        _pool = _export_pool = None
+
+
+# Every character str.strip() removes, as E-string escapes. E-strings have no
+# \v escape ('\v' is a plain 'v'), so each one is spelled as a code point.
+STRIP_CHARS_SQL = ''.join(f'\\u{ord(char):04x}' for char in (
+    '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005\u2006'
+    '\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'))
+
+# SQL counterpart of utils.faq.clean_question: trim, lowercase and drop
+# punctuation. Used for training_data.normalized_question and for normalizing
+# chat messages before the indexed exact-match lookup.
+NORMALIZED_QUESTION_SQL = f"regexp_replace(lower(btrim({{}}, E'{STRIP_CHARS_SQL}')), '[^\\w\\s]', '', 'g')"
+
+# Stored as the comment of training_data.normalized_question; a column
+# generated by an older expression is rebuilt by init_db.
+NORMALIZED_QUESTION_VERSION = 'clean_question v2'
+
 
 def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    with get_db_connection() as conn:
+        _create_schema(conn.cursor())
+
+
+def _create_schema(cursor):
 
     # Users Table
     cursor.execute('''
@@ -33,7 +356,8 @@ def init_db():
             email_verified BOOLEAN NOT NULL DEFAULT FALSE,
             password_hash TEXT NOT NULL,
             date_created TIMESTAMP NOT NULL DEFAULT NOW(),
-            account_status TEXT NOT NULL DEFAULT 'active'
+            account_status TEXT NOT NULL DEFAULT 'active',
+            tokens_valid_after DOUBLE PRECISION -- epoch seconds; tokens issued before it are refused
         );
     ''')
 
@@ -72,6 +396,20 @@ def init_db():
         );
     ''')
 
+    # Training rows removed by the normalized-question deduplication below,
+    # with the ID of the row that was kept instead
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS training_data_duplicates (
+            id INTEGER PRIMARY KEY,
+            website_id INTEGER NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            kept_id INTEGER NOT NULL,
+            archived_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
     # Conversation History Table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS conversation_history (
@@ -79,10 +417,112 @@ def init_db():
             website_id INTEGER NOT NULL,
             user_message TEXT NOT NULL,
             assistant_response TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
+    # Conversation History Archive Table (turns older than the retention
+    # period, moved out by utils.conversation_log.archive_conversations)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_history_archive (
+            id INTEGER PRIMARY KEY,
+            website_id INTEGER NOT NULL,
+            user_message TEXT NOT NULL,
+            assistant_response TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            archived_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
+    # Crawl Pages Table (per-page state for incremental re-crawls)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_pages (
+            id SERIAL PRIMARY KEY,
+            website_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT, -- NULL when summarization failed: the next crawl redoes the page
+            summary TEXT NOT NULL,
+            links TEXT[] NOT NULL DEFAULT '{}',
+            lines TEXT[], -- cleaned text lines, for boilerplate and near-duplicate checks on a 304
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            UNIQUE (website_id, url),
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
+    # Knowledge Chunks Table (per-page text chunks used for chat retrieval)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS knowledge_chunks (
+            id SERIAL PRIMARY KEY,
+            website_id INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            chunk_index INTEGER NOT NULL,
+            start_offset INTEGER NOT NULL,
+            end_offset INTEGER NOT NULL,
+            chunk_text TEXT NOT NULL,
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
+    # Knowledge Indexes Table (serialized BM25 index per website, see utils.bm25)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS knowledge_indexes (
+            website_id INTEGER PRIMARY KEY,
+            index_data BYTEA NOT NULL,
+            version INTEGER NOT NULL DEFAULT 1,
+            built_at TIMESTAMP NOT NULL DEFAULT NOW(),
             FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
         );
     ''')
 
+    # Chat Response Cache Table (shared tier of utils.response_cache)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_response_cache (
+            website_id INTEGER NOT NULL,
+            message_key TEXT NOT NULL,
+            content_version INTEGER NOT NULL,
+            response TEXT NOT NULL,
+            expires_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (website_id, message_key),
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE CASCADE
+        );
+    ''')
+
+    # Summary Cache Table (content-addressed page summaries, see utils.summary_cache)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS summary_cache (
+            content_hash TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW()
+        );
+    ''')
+
+    # Crawl Jobs Table (queue for crawl_jobs workers)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS crawl_jobs (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            base_url TEXT NOT NULL,
+            max_pages INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued', -- queued, running, completed, failed
+            pages_done INTEGER NOT NULL DEFAULT 0,
+            website_id INTEGER,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            stats JSONB,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY (website_id) REFERENCES knowledge_base(id) ON DELETE SET NULL
+        );
+    ''')
+
     # Integration Credentials Table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS integration_credentials (
@@ -94,21 +534,127 @@ def init_db():
         );
     ''')
 
+    # Migrations for databases created before these columns existed
+    cursor.execute('''
+        SELECT col_description(attrelid, attnum) FROM pg_attribute
+        WHERE attrelid = 'training_data'::regclass AND attname = 'normalized_question' AND NOT attisdropped;
+    ''')
+    column = cursor.fetchone()
+    if column is not None and column[0] != NORMALIZED_QUESTION_VERSION:
+        # Generated by an older expression (the first one kept a trailing 'v' out of
+        # 'hiv'): rebuild it, and the unique index below after deduplicating again.
+        cursor.execute('DROP INDEX IF EXISTS idx_training_data_website_question;')
+        cursor.execute('ALTER TABLE training_data DROP COLUMN normalized_question;')
+    cursor.execute(f'''
+        ALTER TABLE training_data ADD COLUMN IF NOT EXISTS normalized_question TEXT
+            GENERATED ALWAYS AS ({NORMALIZED_QUESTION_SQL.format('question')}) STORED;
+    ''')
+    cursor.execute(f"COMMENT ON COLUMN training_data.normalized_question IS '{NORMALIZED_QUESTION_VERSION}';")
+    cursor.execute('ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS content_version INTEGER NOT NULL DEFAULT 1;')
+    cursor.execute('ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS stats JSONB;')
+    cursor.execute('ALTER TABLE crawl_pages ALTER COLUMN content_hash DROP NOT NULL;')
+    cursor.execute('ALTER TABLE crawl_pages ADD COLUMN IF NOT EXISTS lines TEXT[];')
+    cursor.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS tokens_valid_after DOUBLE PRECISION;')
+    # Turns stored before created_at existed have no real timestamp: they all
+    # get the time of this migration, so the archiver only moves them out
+    # CONVERSATION_RETENTION_DAYS after the upgrade, not after they happened.
+    cursor.execute('ALTER TABLE conversation_history ADD COLUMN IF NOT EXISTS created_at TIMESTAMP NOT NULL DEFAULT NOW();')
+
+    # Any training_data write changes what the chatbot would answer: bump the
+    # website's content_version and drop its shared cached responses.
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION bump_website_content_version() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP <> 'INSERT' THEN
+                UPDATE knowledge_base SET content_version = content_version + 1 WHERE id = OLD.website_id;
+                DELETE FROM chat_response_cache WHERE website_id = OLD.website_id;
+            END IF;
+            IF TG_OP <> 'DELETE' AND (TG_OP = 'INSERT' OR NEW.website_id <> OLD.website_id) THEN
+                UPDATE knowledge_base SET content_version = content_version + 1 WHERE id = NEW.website_id;
+                DELETE FROM chat_response_cache WHERE website_id = NEW.website_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS training_data_content_version ON training_data;')
+    cursor.execute('''
+        CREATE TRIGGER training_data_content_version
+        AFTER INSERT OR UPDATE OR DELETE ON training_data
+        FOR EACH ROW EXECUTE FUNCTION bump_website_content_version();
+    ''')
+
+    # Workers cache each website's chat context (utils.context_cache) and drop
+    # it when notified here; training_data writes reach this trigger through
+    # the content_version bump above.
+    cursor.execute('''
+        CREATE OR REPLACE FUNCTION notify_website_context() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('website_context', OLD.id::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+    ''')
+    cursor.execute('DROP TRIGGER IF EXISTS knowledge_base_context_changed ON knowledge_base;')
+    cursor.execute('''
+        CREATE TRIGGER knowledge_base_context_changed
+        AFTER UPDATE OR DELETE ON knowledge_base
+        FOR EACH ROW EXECUTE FUNCTION notify_website_context();
+    ''')
+
+    cursor.execute("SELECT to_regclass('idx_training_data_website_question');")
+    if cursor.fetchone()[0] is None:
+        # The unique index needs one answer per normalized question; keep the
+        # oldest row, which is the one the chatbot used to match first, and move
+        # the others to training_data_duplicates so they can be reviewed or restored.
+        cursor.execute('''
+            WITH removed AS (
+                DELETE FROM training_data newer
+                USING training_data older
+                WHERE newer.website_id = older.website_id
+                  AND newer.normalized_question = older.normalized_question
+                  AND newer.id > older.id
+                RETURNING newer.id, newer.website_id, newer.question, newer.answer, newer.normalized_question
+            )
+            INSERT INTO training_data_duplicates (id, website_id, question, answer, kept_id)
+            SELECT removed.id, removed.website_id, removed.question, removed.answer,
+                   (SELECT min(kept.id) FROM training_data kept
+                    WHERE kept.website_id = removed.website_id
+                      AND kept.normalized_question = removed.normalized_question)
+            FROM removed;
+        ''')
+        if cursor.rowcount:
+            print(f"Moved {cursor.rowcount} training_data rows with an already answered question "
+                  f"to training_data_duplicates")
+
     # Add indexes for frequently queried fields
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username);')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_email ON users (email);')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_base_user_id ON knowledge_base (user_id);')
+    # Keyset pagination of a user's websites and their ETags (versions without the heap);
+    # supersedes the plain (user_id) and (user_id, id) indexes
+    cursor.execute('DROP INDEX IF EXISTS idx_knowledge_base_user_id;')
+    cursor.execute('DROP INDEX IF EXISTS idx_knowledge_base_user_id_id;')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_base_user_versions ON knowledge_base (user_id, id) INCLUDE (content_version);')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_training_data_website_question ON training_data (website_id, normalized_question);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_base_user_url ON knowledge_base (user_id, website_url);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_knowledge_chunks_website_url ON knowledge_chunks (website_id, url);')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_crawl_jobs_pending ON crawl_jobs (id) WHERE status IN ('queued', 'running');")
+    # Chat history: the last turns of a website, and old turns for the archive job.
+    # training_data lookups by website_id use idx_training_data_website_question.
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_history_website_id ON conversation_history (website_id, id);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_history_created_at ON conversation_history (created_at);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_conversation_history_archive_website_id ON conversation_history_archive (website_id, id);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_token ON password_reset_tokens (token);')
+
 
-    conn.commit()
-    conn.close()
 def fetch_knowledge_base():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        with get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
 
-        # Query to fetch data from knowledge_base
-        cursor.execute("SELECT * FROM knowledge_base;")
-        rows = cursor.fetchall()
+            # Query to fetch data from knowledge_base
+            cursor.execute("SELECT * FROM knowledge_base;")
+            rows = cursor.fetchall()
 
         for row in rows:
             print(row)
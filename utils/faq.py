@@ -0,0 +1,213 @@
+"""
+Curated answers from training_data: exact and fuzzy question matching.
+
+Exact matches are a single lookup on the indexed normalized_question column.
+Fuzzy matches use an in-process character-trigram index per website, kept in
+an LRU cache and rebuilt whenever the website's content_version moves on.
+"""
+import re
+import threading
+
+from config import Config
+from utils.db import NORMALIZED_QUESTION_SQL
+from utils.lru import LRUCache
+
+
+def clean_question(question):
+    # Remove question mark and normalize whitespace. Postgres applies the same
+    # rules to training_data.normalized_question (utils.db.NORMALIZED_QUESTION_SQL).
+    question = question.strip().lower()
+    question = re.sub(r'[^\w\s]', '', question)  # Remove punctuation (except spaces)
+    return question
+
+
+def trigrams(text):
+    text = ' '.join(clean_question(text).split())
+    if not text:
+        return set()
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """
+    Inverted index from character trigrams to training_data rows, scoring
+    candidates by Jaccard similarity of their trigram sets.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._sizes = {}  # training_data id -> number of distinct trigrams
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sizes)
+
+    def add(self, row_id, question):
+        grams = trigrams(question)
+        with self._lock:
+            if row_id in self._sizes:
+                return
+            self._sizes[row_id] = len(grams)
+            for gram in grams:
+                self._postings.setdefault(gram, []).append(row_id)
+
+    def best_match(self, text, threshold):
+        """
+        Return (row_id, similarity) of the most similar question, or None if
+        nothing reaches `threshold`.
+        """
+        grams = trigrams(text)
+        if not grams:
+            return None
+        overlaps = {}
+        with self._lock:
+            for gram in grams:
+                for row_id in self._postings.get(gram, ()):
+                    overlaps[row_id] = overlaps.get(row_id, 0) + 1
+            sizes = self._sizes
+
+            best = None
+            for row_id, shared in overlaps.items():
+                score = shared / (len(grams) + sizes[row_id] - shared)
+                if score >= threshold and (best is None or score > best[1] or
+                                           (score == best[1] and row_id < best[0])):
+                    best = (row_id, score)
+        return best
+
+
+class CuratedAnswers:
+    """
+    A website's whole training_data in memory, for matching without queries.
+
+    Parameters:
+    - rows: (id, question, answer) tuples.
+    """
+
+    def __init__(self, rows):
+        self.index = TrigramIndex()
+        self._answers = {}  # training_data id -> answer
+        self._exact = {}  # clean_question(question) -> answer of the oldest row
+        for row_id, question, answer in sorted(rows):
+            self.index.add(row_id, question)
+            self._answers[row_id] = answer
+            self._exact.setdefault(clean_question(question), answer)
+
+    def exact(self, message):
+        return self._exact.get(clean_question(message))
+
+    def fuzzy(self, message, threshold):
+        match = self.index.best_match(message, threshold)
+        return self._answers.get(match[0]) if match else None
+
+
+# website_id -> (content_version, TrigramIndex), per worker
+_indexes = LRUCache(Config.FAQ_INDEX_CACHE_SIZE)
+
+_counters_lock = threading.Lock()
+_counters = {'exact_hits': 0, 'fuzzy_hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _website_index(cursor, website_id):
+    """
+    Return the website's trigram index, rebuilding it if the website's
+    content_version has changed since it was built. A trigger bumps the version
+    on every training_data insert, update and delete, so questions edited in
+    place are picked up as well as new and deleted rows.
+    """
+    cursor.execute('SELECT content_version FROM knowledge_base WHERE id = %s', (website_id,))
+    row = cursor.fetchone()
+    version = row[0] if row else None
+
+    cached = _indexes.get(website_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    index = TrigramIndex()
+    cursor.execute('SELECT id, question FROM training_data WHERE website_id = %s', (website_id,))
+    for row_id, question in cursor.fetchall():
+        index.add(row_id, question)
+    _indexes.put(website_id, (version, index))
+    return index
+
+
+def match_training_answer(cursor, website_id, message, answers=None):
+    """
+    Find a curated answer for a chat message.
+
+    Tries an exact match on the normalized question first, then the most
+    similar trained question by trigram similarity, if it reaches
+    Config.FAQ_MATCH_THRESHOLD.
+
+    Parameters:
+    - answers: Optional CuratedAnswers of the website; when given, no
+      queries are run.
+
+    Returns:
+    - The answer text, or None when the message should go to the LLM.
+    """
+    if answers is not None:
+        answer = answers.exact(message)
+        if answer:
+            _count('exact_hits')
+            return answer
+        answer = answers.fuzzy(message, Config.FAQ_MATCH_THRESHOLD)
+        if answer:
+            _count('fuzzy_hits')
+            return answer
+        _count('misses')
+        return None
+
+    cursor.execute(f'''
+        SELECT answer FROM training_data
+        WHERE website_id = %s AND normalized_question = {NORMALIZED_QUESTION_SQL.format('%s')}
+    ''', (website_id, message))
+    row = cursor.fetchone()
+    if row and row[0]:
+        _count('exact_hits')
+        return row[0]
+
+    match = _website_index(cursor, website_id).best_match(message, Config.FAQ_MATCH_THRESHOLD)
+    if match:
+        cursor.execute('SELECT answer FROM training_data WHERE id = %s', (match[0],))
+        row = cursor.fetchone()
+        if row and row[0]:
+            _count('fuzzy_hits')
+            return row[0]
+
+    _count('misses')
+    return None
+
+
+def add_training_data(cursor, website_id, question, answer):
+    """
+    Insert (or update the answer of) a curated question. The insert bumps the
+    website's content_version, so the next fuzzy lookup rebuilds its index.
+
+    Returns:
+    - The training_data row ID.
+    """
+    cursor.execute('''
+        INSERT INTO training_data (website_id, question, answer)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (website_id, normalized_question) DO UPDATE SET
+            question = EXCLUDED.question,
+            answer = EXCLUDED.answer
+        RETURNING id
+    ''', (website_id, question, answer))
+    return cursor.fetchone()[0]
+
+
+def faq_match_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = sum(counters.values())
+    counters['llm_fallback_rate'] = counters['misses'] / lookups if lookups else 0.0
+    counters['threshold'] = Config.FAQ_MATCH_THRESHOLD
+    counters['cached_websites'] = len(_indexes)
+    return counters
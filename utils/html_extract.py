@@ -0,0 +1,231 @@
+"""
+Single-pass extraction of text lines and outlinks from crawled HTML.
+
+The body is capped at Config.CRAWL_MAX_PAGE_BYTES, decoded once, and walked
+once by the fastest parser installed: selectolax (lexbor), then lxml, then
+the standard library's html.parser. All engines produce the same text as
+BeautifulSoup's get_text with script, style, meta and link removed; only
+the whitespace between pieces of text differs.
+
+The text comes as one whitespace-normalized line per block: the text of a
+p, li, div, heading, cell... with its inline markup (links, bold) joined in,
+and a whole nav, header or footer as a single line. Boilerplate detection
+compares these lines across pages, so it can drop a repeated paragraph or
+footer but never a link from the middle of a sentence.
+
+selectolax and lxml are optional (`pip install selectolax` or `lxml`);
+Config.HTML_PARSER forces an engine.
+"""
+import codecs
+import re
+from html.parser import HTMLParser
+
+from config import Config
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+
+SKIP_TAGS = ('script', 'style', 'meta', 'link')
+# Elements whose start and end separate lines of text.
+BLOCK_TAGS = frozenset((
+    'address', 'article', 'aside', 'blockquote', 'body', 'br', 'caption', 'dd', 'details', 'div', 'dl', 'dt',
+    'fieldset', 'figcaption', 'figure', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'head', 'hr', 'html', 'li',
+    'main', 'ol', 'option', 'p', 'pre', 'section', 'summary', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead',
+    'title', 'tr', 'ul',
+))
+# Site chrome kept together as one line, blocks inside included.
+SECTION_TAGS = frozenset(('nav', 'header', 'footer'))
+CHARSET_RE = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.IGNORECASE)
+
+
+def decode_html(body, content_type=''):
+    """
+    Decode a page body once: charset from the Content-Type header, else from
+    a <meta> tag near the top of the document, else UTF-8.
+    """
+    encoding = None
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            encoding = value.strip().strip('"\'')
+    if not encoding:
+        match = CHARSET_RE.search(body[:4096])
+        encoding = match.group(1).decode('ascii') if match else 'utf-8'
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = 'utf-8'
+    return body.decode(encoding, errors='replace')
+
+
+class _Blocks:
+    """Collects text into one line per block as an engine walks the document."""
+
+    def __init__(self):
+        self.lines = []
+        self._parts = []
+        self._sections = 0
+
+    def text(self, text):
+        self._parts.append(text)
+
+    def start(self, tag):
+        if tag in SECTION_TAGS:
+            self._boundary()
+            self._sections += 1
+        elif tag in BLOCK_TAGS:
+            self._boundary()
+
+    def end(self, tag):
+        if tag in SECTION_TAGS:
+            self._sections = max(0, self._sections - 1)
+            self._boundary()
+        elif tag in BLOCK_TAGS:
+            self._boundary()
+
+    def _boundary(self):
+        if self._sections:
+            self._parts.append(' ')  # blocks inside a nav/header/footer stay words apart
+        elif self._parts:
+            # Inline markup joins its text as written: 'before <b>March</b>.' -> 'before March.'
+            line = ' '.join(''.join(self._parts).split())
+            if line:
+                self.lines.append(line)
+            self._parts = []
+
+    def finish(self):
+        self._sections = 0
+        self._boundary()
+        return self.lines
+
+
+def _extract_selectolax(html):
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(list(SKIP_TAGS))
+    blocks, hrefs = _Blocks(), []
+    if tree.root is None:
+        return blocks.finish(), hrefs
+    stack = [(tree.root, False)]
+    while stack:
+        node, finished = stack.pop()
+        tag = node.tag
+        if finished:
+            blocks.end(tag)
+            continue
+        if tag == '-text':
+            blocks.text(node.text(deep=False))
+            continue
+        if tag == 'a':
+            attributes = node.attributes
+            if 'href' in attributes:
+                hrefs.append(attributes['href'] or '')
+        blocks.start(tag)
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(list(node.iter(include_text=True))))
+    return blocks.finish(), hrefs
+
+
+def _extract_lxml(html):
+    try:
+        root = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        # Empty documents, or XHTML with an encoding declaration lxml refuses in a str.
+        return _extract_stdlib(html)
+    blocks, hrefs = _Blocks(), []
+    stack = [(root, False)]
+    while stack:
+        element, finished = stack.pop()
+        tag = element.tag
+        if finished:
+            # An element's tail follows the text of its descendants.
+            blocks.end(tag)
+            if element.tail and element is not root:
+                blocks.text(element.tail)
+            continue
+        if isinstance(tag, str):  # not a comment or processing instruction
+            if tag == 'a' and element.get('href') is not None:
+                hrefs.append(element.get('href'))
+            blocks.start(tag)
+            if tag not in SKIP_TAGS and element.text:
+                blocks.text(element.text)
+        stack.append((element, True))
+        stack.extend((child, False) for child in reversed(element))
+    return blocks.finish(), hrefs
+
+
+class _StdlibExtractor(HTMLParser):
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = _Blocks()
+        self.hrefs = []
+        self._skipping = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skipping = tag
+        elif tag == 'a':
+            for name, value in attrs:
+                if name == 'href':
+                    self.hrefs.append(value or '')
+                    break
+        self.blocks.start(tag)
+
+    def handle_endtag(self, tag):
+        if tag == self._skipping:
+            self._skipping = None
+        self.blocks.end(tag)
+
+    def handle_data(self, data):
+        if self._skipping is None:
+            self.blocks.text(data)
+
+
+def _extract_stdlib(html):
+    parser = _StdlibExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.blocks.finish(), parser.hrefs
+
+
+ENGINES = {
+    'selectolax': _extract_selectolax if LexborHTMLParser else None,
+    'lxml': _extract_lxml if lxml else None,
+    'html.parser': _extract_stdlib,
+}
+
+
+def available_engine(name=None):
+    """Return the name of the engine to use: `name`, Config.HTML_PARSER, or the fastest installed."""
+    name = name or Config.HTML_PARSER
+    if name != 'auto':
+        if not ENGINES.get(name):
+            raise ValueError(f"HTML parser '{name}' is not installed")
+        return name
+    return next(engine for engine in ('selectolax', 'lxml', 'html.parser') if ENGINES[engine])
+
+
+def extract_page(body, content_type='', engine=None):
+    """
+    Extract text and links from an HTML body in one pass.
+
+    Parameters:
+    - body: The raw response bytes (only the first Config.CRAWL_MAX_PAGE_BYTES are parsed).
+    - content_type: The response Content-Type header, for its charset.
+    - engine: Optional engine name overriding Config.HTML_PARSER.
+
+    Returns:
+    - A (lines, hrefs) tuple: the page's text, one line per block, and the
+      raw href of every <a> element, in document order.
+    """
+    html = decode_html(body[:Config.CRAWL_MAX_PAGE_BYTES], content_type)
+    return ENGINES[available_engine(engine)](html)
@@ -1,21 +1,102 @@
 import jwt
 import datetime
+import hashlib
+import time
 from config import Config
+from utils.db import get_db_connection
+from utils.lru import LRUCache
 
 def generate_access_token(user_id):
+    now = time.time()
     payload = {
         "exp": datetime.datetime.utcnow() + datetime.timedelta(seconds=Config.JWT_EXPIRATION_SECONDS),
-        "iat": datetime.datetime.utcnow(),
+        "iat": int(now),
+        # Microseconds, so a login right after a password reset is not refused
+        "iat_us": int(now * 1000000),
         "sub": str(user_id)
     }
     return jwt.encode(payload, Config.JWT_SECRET_KEY, algorithm='HS256')
 
 
+# Tokens whose signature was already checked: sha256(token) -> (user_id, exp, iat).
+# The widget sends the same token with every message, so most requests skip jwt.decode.
+_verified = LRUCache(Config.JWT_CACHE_SIZE)
+
+# user_id -> users.tokens_valid_after (0.0 if unset), re-read from the database once an
+# entry is older than Config.JWT_REVOCATION_CHECK_INTERVAL, so a password reset in one
+# worker reaches the others within that interval.
+_valid_after = LRUCache(Config.JWT_CACHE_SIZE, ttl=Config.JWT_REVOCATION_CHECK_INTERVAL)
+
+
+def _tokens_valid_after(user_id):
+    valid_after = _valid_after.get(user_id)
+    if valid_after is not None:
+        return valid_after
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT tokens_valid_after FROM users WHERE id = %s', (int(user_id),))
+            row = cursor.fetchone()
+    except Exception as e:
+        # Not cached: the next request checks again.
+        print(f"Error reading token revocation of user {user_id}: {e}")
+        return 0.0
+    valid_after = row[0] if row and row[0] else 0.0
+    # A revocation older than the token lifetime refuses nothing any more.
+    if valid_after < time.time() - Config.JWT_EXPIRATION_SECONDS:
+        valid_after = 0.0
+    _valid_after.put(user_id, valid_after)
+    return valid_after
+
+
+def _is_revoked(user_id, issued_at):
+    return issued_at < _tokens_valid_after(user_id)
+
+
 def decode_access_token(token):
+    if Config.JWT_CACHE_ENABLED:
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        entry = _verified.get(key)
+        if entry is not None:
+            user_id, expires_at, issued_at = entry
+            if expires_at > time.time() and not _is_revoked(user_id, issued_at):
+                return user_id
+            _verified.pop(key)
+            return None
+
     try:
         payload = jwt.decode(token,Config.JWT_SECRET_KEY, algorithms=['HS256'])
-        return payload['sub']
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
-        return None
\ No newline at end of file
+        return None
+
+    user_id = payload['sub']
+    issued_at = payload['iat_us'] / 1000000 if 'iat_us' in payload else payload.get('iat', 0)
+    if _is_revoked(user_id, issued_at):
+        return None
+    if Config.JWT_CACHE_ENABLED and 'exp' in payload:
+        _verified.put(key, (user_id, payload['exp'], issued_at))
+    return user_id
+
+
+def revoke_user_tokens(cursor, user_id):
+    """
+    Refuse the user's existing tokens (e.g. after a password reset) and drop
+    them from this worker's verified-token cache. Tokens from a new login are
+    accepted. Other workers refuse the old tokens once their cached
+    tokens_valid_after is re-read, within Config.JWT_REVOCATION_CHECK_INTERVAL.
+
+    Parameters:
+    - cursor: Cursor of the transaction that changes the user's credentials.
+    - user_id: The ID of the user.
+    """
+    valid_after = time.time()
+    cursor.execute('UPDATE users SET tokens_valid_after = %s WHERE id = %s', (valid_after, user_id))
+    user_id = str(user_id)
+    _valid_after.put(user_id, valid_after)
+    _verified.evict(lambda entry: entry[0] == user_id)
+
+
+def token_cache_stats():
+    return _verified.stats()
@@ -0,0 +1,135 @@
+import re
+from psycopg2.extras import execute_values
+from config import Config
+from utils.bm25 import build_website_index, load_website_index
+from utils.vector_index import rebuild_dirty_website_vectors, search_website_vectors
+
+
+def chunk_text(text, chunk_size=None, overlap=None):
+    """
+    Split page text into overlapping chunks on word boundaries.
+
+    Returns:
+    - List of (start_offset, end_offset, chunk) tuples, offsets into `text`.
+    """
+    chunk_size = chunk_size or Config.KNOWLEDGE_CHUNK_SIZE
+    overlap = Config.KNOWLEDGE_CHUNK_OVERLAP if overlap is None else overlap
+    words = [match.span() for match in re.finditer(r'\S+', text)]
+    chunks = []
+    first = 0
+    while first < len(words):
+        start = words[first][0]
+        last = first
+        while last + 1 < len(words) and words[last + 1][1] - start <= chunk_size:
+            last += 1
+        end = words[last][1]
+        chunks.append((start, end, text[start:end]))
+        if last + 1 >= len(words):
+            break
+        # Step back so the next chunk repeats roughly `overlap` characters.
+        next_first = last + 1
+        while next_first - 1 > first and end - words[next_first - 1][0] <= overlap:
+            next_first -= 1
+        first = next_first
+    return chunks
+
+
+def save_page_chunks(cursor, website_id, pages, crawled_urls):
+    """
+    Replace the knowledge_chunks of re-summarized pages and drop chunks of pages
+    that are no longer part of the crawl. Unchanged pages keep their chunks.
+    The website's BM25 index is rebuilt whenever its chunks change.
+
+    Parameters:
+    - cursor: Cursor inside the caller's transaction.
+    - website_id: The knowledge_base row the pages belong to.
+    - pages: Crawled pages; those carrying 'content' are (re)chunked.
+    - crawled_urls: Every URL in this crawl, changed or not.
+
+    Returns:
+    - (added, removed_ids): the new (chunk_id, chunk_text) pairs and the ids
+      of deleted chunks, for updating derived indexes after commit.
+    """
+    cursor.execute('''
+        DELETE FROM knowledge_chunks WHERE website_id = %s AND NOT (url = ANY(%s))
+        RETURNING id
+    ''', (website_id, list(crawled_urls)))
+    removed_ids = [row[0] for row in cursor.fetchall()]
+    added = []
+
+    changed = [page for page in pages if page.get('content')]
+    if changed:
+        cursor.execute('''
+            DELETE FROM knowledge_chunks WHERE website_id = %s AND url = ANY(%s)
+            RETURNING id
+        ''', (website_id, [page['url'] for page in changed]))
+        removed_ids.extend(row[0] for row in cursor.fetchall())
+        added = execute_values(cursor, '''
+            INSERT INTO knowledge_chunks (website_id, url, chunk_index, start_offset, end_offset, chunk_text)
+            VALUES %s
+            RETURNING id, chunk_text
+        ''', [
+            (website_id, page['url'], index, start, end, chunk)
+            for page in changed
+            for index, (start, end, chunk) in enumerate(chunk_text(page['content']))
+        ], fetch=True)
+
+    if added or removed_ids:
+        build_website_index(cursor, website_id)
+    return added, removed_ids
+
+
+def _fuse(rankings, limit):
+    """Reciprocal rank fusion of several best-first lists of (chunk_id, score)."""
+    scores = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (60 + rank)
+    return sorted(scores, key=lambda chunk_id: -scores[chunk_id])[:limit]
+
+
+def retrieve_passages(cursor, website_id, message, top_k=None, context=None):
+    """
+    Pick the chunks of a website most relevant to a chat message.
+
+    Chunks are ranked with the website's in-memory BM25 index, its vector
+    index, or both fused by reciprocal rank (Config.KNOWLEDGE_RETRIEVER).
+    Websites crawled before chunking existed (or messages matching nothing)
+    fall back to the combined knowledge_base summary.
+
+    Parameters:
+    - context: Optional cached WebsiteContext (utils.context_cache) whose
+      BM25 index and summary are used instead of querying for them.
+
+    Returns:
+    - Up to `top_k` passages ("[url] chunk text"), most relevant first.
+    """
+    top_k = top_k or Config.KNOWLEDGE_TOP_K
+
+    rankings = []
+    if Config.KNOWLEDGE_RETRIEVER in ('bm25', 'hybrid'):
+        index = context.bm25_index if context is not None else load_website_index(cursor, website_id)
+        if index is not None:
+            rankings.append(index.search(message, k=top_k))
+    if Config.KNOWLEDGE_RETRIEVER in ('vector', 'hybrid'):
+        try:
+            rebuild_dirty_website_vectors(cursor, website_id)
+            rankings.append(search_website_vectors(website_id, message, k=top_k))
+        except Exception as e:
+            print(f"Error searching vector index for website {website_id}: {e}")
+    hits = _fuse(rankings, top_k)
+
+    if hits:
+        cursor.execute('''
+            SELECT id, url, chunk_text FROM knowledge_chunks WHERE id = ANY(%s)
+        ''', (hits,))
+        by_id = {chunk_id: (url, chunk) for chunk_id, url, chunk in cursor.fetchall()}
+        passages = [f"[{by_id[chunk_id][0]}] {by_id[chunk_id][1]}" for chunk_id in hits if chunk_id in by_id]
+        if passages:
+            return passages
+
+    if context is not None:
+        return [context.summary] if context.summary else []
+    cursor.execute('SELECT summary FROM knowledge_base WHERE id = %s', (website_id,))
+    row = cursor.fetchone()
+    return [row[0]] if row and row[0] else []
@@ -0,0 +1,113 @@
+"""
+LLM backends shared by page summarization and the chatbot.
+
+Every backend has `complete(messages, max_tokens)`, returning
+(text, prompt_tokens, completion_tokens), and `stream(messages, max_tokens)`,
+yielding pieces of the answer as they are generated. FakeLLMBackend runs
+offline with simulated latency, for tests and benchmarks.
+"""
+import re
+import threading
+import time
+
+import openai
+
+from config import Config
+
+
+# Batched summarization prompts and answers number their documents [1], [2], ...
+BATCH_MARKER_RE = re.compile(r'^\[(\d+)\][ \t]*\n?', re.MULTILINE)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; good enough for budgeting.
+    return len(text) // 4 + 1
+
+
+class OpenAIBackend:
+    model = "gpt-3.5-turbo"
+
+    def complete(self, messages, max_tokens):
+        """Return (text, prompt_tokens, completion_tokens)."""
+        response = openai.ChatCompletion.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7
+        )
+        usage = response.get('usage', {})
+        prompt_tokens = usage.get('prompt_tokens', sum(estimate_tokens(m['content']) for m in messages))
+        text = response['choices'][0]['message']['content'].strip()
+        return text, prompt_tokens, usage.get('completion_tokens', estimate_tokens(text))
+
+    def stream(self, messages, max_tokens):
+        """Yield the answer's text deltas as OpenAI sends them."""
+        for chunk in openai.ChatCompletion.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            stream=True
+        ):
+            delta = chunk['choices'][0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+
+
+class FakeLLMBackend:
+    """
+    Offline stand-in for the OpenAI backend. "Summarizes" by keeping the first
+    words of each document, answers batched prompts in the same [n] format the
+    real model is asked for, and sleeps to simulate network and generation time.
+    """
+
+    def __init__(self, latency=None, seconds_per_token=None):
+        self.latency = Config.FAKE_LLM_LATENCY if latency is None else latency
+        self.seconds_per_token = Config.FAKE_LLM_SECONDS_PER_TOKEN if seconds_per_token is None else seconds_per_token
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.documents = 0
+
+    def _answer(self, messages, max_tokens):
+        prompt = messages[-1]['content']
+        body = prompt.split('\n\n', 1)[1] if '\n\n' in prompt else prompt
+        parts = BATCH_MARKER_RE.split(body)
+        if len(parts) > 1:
+            documents = list(zip(parts[1::2], parts[2::2]))
+        else:
+            documents = [(None, body)]
+
+        per_document = max(1, max_tokens // len(documents))
+        lines = []
+        for number, document in documents:
+            summary = ' '.join(document.split()[:per_document])[:per_document * 4]
+            lines.append(f'[{number}] {summary}' if number else summary)
+
+        with self._lock:
+            self.requests += 1
+            self.documents += len(documents)
+        return prompt, '\n'.join(lines)
+
+    def complete(self, messages, max_tokens):
+        prompt, text = self._answer(messages, max_tokens)
+        completion_tokens = estimate_tokens(text)
+        time.sleep(self.latency + completion_tokens * self.seconds_per_token)
+        return text, estimate_tokens(prompt), completion_tokens
+
+    def stream(self, messages, max_tokens):
+        _, text = self._answer(messages, max_tokens)
+        time.sleep(self.latency)
+        for index, word in enumerate(text.split(' ')):
+            piece = word if index == 0 else ' ' + word
+            time.sleep(estimate_tokens(piece) * self.seconds_per_token)
+            yield piece
+
+
+_chat_backend = None
+
+
+def get_chat_backend():
+    global _chat_backend
+    if _chat_backend is None:
+        _chat_backend = FakeLLMBackend() if Config.CHAT_BACKEND == 'fake' else OpenAIBackend()
+    return _chat_backend
@@ -0,0 +1,105 @@
+"""
+Near-duplicate page detection with MinHash over word shingles.
+
+Paginated listings, tag pages and locale variants of the same content differ
+in a few words; their shingle sets have a high Jaccard similarity, which the
+fraction of equal MinHash values estimates. Locality-sensitive hashing on
+bands of the signature finds candidate pages without comparing every pair.
+"""
+import threading
+import zlib
+
+import numpy as np
+
+from config import Config
+
+
+_PRIME = (1 << 61) - 1
+
+
+def shingles(text, size=None):
+    """Hashes (uint32) of the distinct `size`-word shingles of a text."""
+    size = size or Config.NEAR_DUPLICATE_SHINGLE_SIZE
+    words = text.lower().split()
+    if len(words) <= size:
+        return np.array([zlib.crc32(' '.join(words).encode('utf-8'))], dtype=np.uint64)
+    return np.unique(np.fromiter(
+        (zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)),
+        dtype=np.uint64
+    ))
+
+
+class MinHasher:
+    """Fixed family of `num_perm` hash functions (a * x + b) mod p."""
+
+    def __init__(self, num_perm=None, seed=1):
+        num_perm = num_perm or Config.NEAR_DUPLICATE_NUM_PERM
+        rng = np.random.default_rng(seed)
+        # a, b < 2**32 and shingle hashes < 2**32, so a * x + b fits in uint64.
+        self.a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = shingles(text)
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0)
+
+
+_hasher = None
+
+
+def page_signature(text):
+    """
+    MinHash signature of a page's cleaned text, or None for pages too short
+    to compare reliably (Config.NEAR_DUPLICATE_MIN_WORDS).
+    """
+    global _hasher
+    if Config.NEAR_DUPLICATE_THRESHOLD <= 0 or len(text.split()) < Config.NEAR_DUPLICATE_MIN_WORDS:
+        return None
+    if _hasher is None:
+        _hasher = MinHasher()
+    return _hasher.signature(text)
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    Signatures of the pages kept so far in a crawl, banded for LSH lookups.
+
+    Parameters:
+    - threshold: Minimum estimated similarity for a near-duplicate.
+    - bands: Number of LSH bands the signature is split into.
+    """
+
+    def __init__(self, threshold=None, bands=None):
+        self.threshold = Config.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        self.bands = bands or Config.NEAR_DUPLICATE_BANDS
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature):
+        return [band.tobytes() for band in np.array_split(signature, self.bands)]
+
+    def find(self, signature):
+        """Return (key, similarity) of the most similar indexed page at or above the threshold, or None."""
+        best = None
+        with self._lock:
+            candidates = set()
+            for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+                candidates.update(buckets.get(band_key, ()))
+            for key in candidates:
+                score = similarity(signature, self._signatures[key])
+                if score >= self.threshold and (best is None or score > best[1] or
+                                                (score == best[1] and key < best[0])):
+                    best = (key, score)
+        return best
+
+    def add(self, key, signature):
+        with self._lock:
+            self._signatures[key] = signature
+            for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+                buckets.setdefault(band_key, []).append(key)
@@ -0,0 +1,208 @@
+"""
+Password hashing off the request threads.
+
+Werkzeug's password hashes are deliberately slow and hold the GIL while they
+run, so a burst of logins used to stall every other route of the worker.
+Hashing and verification now run in a small process pool
+(Config.PASSWORD_HASH_WORKERS) behind a bounded queue: when
+Config.PASSWORD_HASH_QUEUE operations are already pending, new ones fail
+fast with HashingBusy instead of piling up.
+
+Admission control comes before any hashing: every IP and every username
+gets a limited number of attempts per sliding window, so a
+credential-stuffing burst is refused cheaply instead of taking the pool.
+
+Hashes made with older parameters are upgraded on the next successful
+login (Config.PASSWORD_HASH_METHOD).
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from config import Config
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashing operations are already pending."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    try:
+        return check_password_hash(password_hash, password)
+    except ValueError:  # unknown or malformed hash method
+        return False
+
+
+def hash_prefix(method):
+    """
+    The method part Werkzeug writes in front of hashes made with `method`,
+    with its default parameters filled in (e.g. 'scrypt' -> 'scrypt:32768:8:1').
+    Worked out here rather than by hashing, which would take a pool slot.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == 'pbkdf2' and len(args) <= 2:
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Unsupported password hash method '{method}'")
+
+
+class PasswordHasher:
+    """
+    Process pool for password hashing with a bounded number of pending jobs.
+
+    Parameters:
+    - workers: Hashing processes.
+    - max_pending: Operations queued or running before HashingBusy.
+    - method: Werkzeug hash method for new hashes.
+    """
+
+    def __init__(self, workers=None, max_pending=None, method=None):
+        self.method = method or Config.PASSWORD_HASH_METHOD
+        # spawn: forking a multithreaded web worker could copy held locks.
+        self._pool = ProcessPoolExecutor(max_workers=workers or Config.PASSWORD_HASH_WORKERS,
+                                         mp_context=multiprocessing.get_context('spawn'))
+        self._slots = threading.BoundedSemaphore(max_pending or Config.PASSWORD_HASH_QUEUE)
+        self._lock = threading.Lock()
+        self._prefix = hash_prefix(self.method)
+        self._dummy_hash = None
+        self.pid = os.getpid()
+        self.stats = {'hashes': 0, 'verifications': 0, 'rejected': 0}
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise HashingBusy("Too many password operations in progress")
+        try:
+            return self._pool.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        with self._lock:
+            self.stats['hashes'] += 1
+        return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """
+        Check a password against a stored hash. A missing hash (unknown
+        user) is checked against a dummy hash, so it takes as long as a real
+        check and usernames cannot be probed by timing.
+        """
+        with self._lock:
+            self.stats['verifications'] += 1
+        if not password_hash:
+            if self._dummy_hash is None:
+                self._dummy_hash = self._run(_hash, os.urandom(16).hex(), self.method)
+            self._run(_verify, self._dummy_hash, password)
+            return False
+        return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if the hash was made with other parameters than Config.PASSWORD_HASH_METHOD."""
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+class AdmissionControl:
+    """
+    Sliding-window attempt counter per key (an IP or a username).
+
+    Parameters:
+    - limit: Attempts allowed per key within the window.
+    - window: Window length in seconds.
+    - max_keys: Keys tracked; the least recently seen are forgotten first.
+    """
+
+    def __init__(self, limit, window=None, max_keys=100000):
+        self.limit = limit
+        self.window = window or Config.LOGIN_ATTEMPT_WINDOW
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()  # key -> deque of attempt times
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def admit(self, key, now=None):
+        """
+        Record an attempt for `key`.
+
+        Returns:
+        - 0 if the attempt is allowed, else the seconds until it would be.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            attempts = self._attempts.pop(key, None) or deque()
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            self._attempts[key] = attempts
+            while len(self._attempts) > self.max_keys:
+                self._attempts.popitem(last=False)
+            if len(attempts) >= self.limit:
+                self.rejected += 1
+                return attempts[0] + self.window - now
+            attempts.append(now)
+            return 0
+
+
+_ip_attempts = AdmissionControl(Config.LOGIN_ATTEMPTS_PER_IP)
+_username_attempts = AdmissionControl(Config.LOGIN_ATTEMPTS_PER_USERNAME)
+
+
+def admit_password_attempt(ip, username=None):
+    """
+    Count a password attempt against its IP and, for logins, its username.
+
+    Returns:
+    - 0 if it may go ahead, else the seconds to wait before retrying.
+    """
+    retry_after = _ip_attempts.admit(ip)
+    if not retry_after and username is not None:
+        retry_after = _username_attempts.admit(username.lower())
+    return retry_after
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_hasher():
+    """Return this process's hasher, starting its pool on first use (and again after fork)."""
+    global _hasher
+    hasher = _hasher
+    if hasher is not None and hasher.pid == os.getpid():
+        return hasher
+    with _hasher_lock:
+        if _hasher is None or _hasher.pid != os.getpid():
+            _hasher = PasswordHasher()
+        return _hasher
+
+
+def close_hasher():
+    global _hasher
+    with _hasher_lock:
+        if _hasher is not None and _hasher.pid == os.getpid():
+            _hasher.close()
+        _hasher = None
+
+
+def password_stats():
+    hasher = _hasher
+    stats = dict(hasher.stats) if hasher is not None and hasher.pid == os.getpid() else {}
+    stats['rejected_by_ip'] = _ip_attempts.rejected
+    stats['rejected_by_username'] = _username_attempts.rejected
+    return stats
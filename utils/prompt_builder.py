@@ -0,0 +1,243 @@
+"""
+Token-budgeted chat prompts.
+
+The chatbot's prompt has three variable-size sections: retrieved website
+knowledge, curated training Q/A pairs and recent conversation history. Each
+section is guaranteed its share of Config.PROMPT_TOKEN_BUDGET (after the
+system prompt and the user's message); budget one section leaves unused goes
+to the others in Config.PROMPT_PRIORITY order. Within a section the most
+useful items come first: knowledge in retrieval rank, Q/A pairs by
+similarity to the message, history newest first. Only the last knowledge
+passage that fits is ever cut short; Q/A pairs and turns are kept whole.
+
+Tokens are counted with tiktoken when it is installed (`pip install
+tiktoken`), else estimated at ~4 characters per token; counts are cached,
+since the same chunks and Q/A pairs are sent on every message.
+"""
+import threading
+
+from config import Config
+from utils.faq import trigrams
+from utils.llm import estimate_tokens
+from utils.lru import LRUCache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+# Per-message framing tokens of the chat format, and the tokens that prime the reply.
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# A knowledge passage is only cut short if at least this much of it still fits.
+MIN_PASSAGE_TOKENS = 48
+
+KNOWLEDGE_PREFIX = "Website Knowledge: "
+PASSAGE_SEPARATOR = "\n\n"
+
+
+class Tokenizer:
+    """
+    Counts and truncates text in the chat model's tokens.
+
+    Parameters:
+    - model: The OpenAI model whose encoding tiktoken should use.
+    - cache_size: Number of token counts kept.
+    """
+
+    def __init__(self, model=None, cache_size=None):
+        model = model or Config.PROMPT_TOKENIZER_MODEL
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding('cl100k_base')
+        # Keyed on (hash, length) so the cache does not keep the texts alive.
+        self._counts = LRUCache(cache_size or Config.PROMPT_TOKEN_CACHE_SIZE)
+
+    def count(self, text):
+        key = (hash(text), len(text))
+        tokens = self._counts.get(key)
+        if tokens is None:
+            tokens = len(self.encoding.encode(text, disallowed_special=())) if self.encoding else estimate_tokens(text)
+            self._counts.put(key, tokens)
+        return tokens
+
+    def truncate(self, text, max_tokens):
+        """The longest prefix of `text` with at most `max_tokens` tokens (approximately, without tiktoken)."""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding:
+            return self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:max_tokens])
+        return text[:max(0, max_tokens - 1) * 4]
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """Return the process-wide tokenizer; loading a tiktoken encoding is slow, so it is done once."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                _tokenizer = Tokenizer()
+    return _tokenizer
+
+
+class _Section:
+    """
+    Candidate items of one prompt section as (tokens, item) pairs, best first.
+
+    Parameters:
+    - header: Tokens paid once if any item is chosen.
+    - contiguous: Stop at the first item that does not fit instead of
+      looking for smaller ones further down (keeps history gap-free).
+    - truncate: Optional function (item, max_tokens) -> (tokens, item) used
+      to cut the first item that does not fit in the final pass.
+    """
+
+    def __init__(self, candidates, header=0, contiguous=False, truncate=None):
+        self.pending = candidates
+        self.header = header
+        self.contiguous = contiguous
+        self.truncate = truncate
+        self.chosen = []
+        self.tokens = 0
+
+    def fill(self, room, final=False):
+        """Choose pending items fitting in `room` tokens; returns the tokens used."""
+        used = 0
+        left = []
+        for index, (tokens, item) in enumerate(self.pending):
+            header = 0 if self.chosen else self.header
+            if used + header + tokens <= room:
+                self.chosen.append(item)
+                used += header + tokens
+                continue
+            if final and self.truncate and room - used - header >= MIN_PASSAGE_TOKENS:
+                tokens, item = self.truncate(item, room - used - header)
+                self.chosen.append(item)
+                used += header + tokens
+                left.extend(self.pending[index + 1:])
+                break
+            if self.contiguous:
+                left.extend(self.pending[index:])
+                break
+            left.append((tokens, item))
+        self.pending = left
+        self.tokens += used
+        return used
+
+
+class PromptBuilder:
+    """
+    Assembles chat prompts within a token budget.
+
+    Parameters:
+    - budget: Most prompt tokens per request.
+    - priority: Section names ('knowledge', 'training', 'history'), most
+      important first.
+    - shares: Section name -> fraction of the budget reserved for it.
+    - tokenizer: Defaults to the shared get_tokenizer().
+    """
+
+    def __init__(self, budget=None, priority=None, shares=None, tokenizer=None):
+        self.budget = budget or Config.PROMPT_TOKEN_BUDGET
+        self.priority = priority or [name.strip() for name in Config.PROMPT_PRIORITY.split(',')]
+        self.shares = shares or {
+            'knowledge': Config.PROMPT_KNOWLEDGE_SHARE,
+            'training': Config.PROMPT_TRAINING_SHARE,
+            'history': Config.PROMPT_HISTORY_SHARE,
+        }
+        self.tokenizer = tokenizer or get_tokenizer()
+
+    def _message_tokens(self, content):
+        return self.tokenizer.count(content) + MESSAGE_OVERHEAD
+
+    def build(self, system, message, passages, training_data, history):
+        """
+        Build the messages for one chat request.
+
+        Parameters:
+        - system: The system prompt.
+        - message: The user's message (cut to half the budget if longer).
+        - passages: Knowledge passages, most relevant first.
+        - training_data: (question, answer) pairs.
+        - history: (user_message, assistant_response) turns, newest first.
+
+        Returns:
+        - A (messages, breakdown) tuple; breakdown maps each part of the
+          prompt to its tokens (counted per item, so the total is a slight
+          overestimate) and counts what had to be left out.
+        """
+        count = self.tokenizer.count
+        message = self.tokenizer.truncate(message, self.budget // 2)
+        question = f"User asked: {message}"
+        fixed = {
+            'system': self._message_tokens(system),
+            'message': self._message_tokens(question) + REPLY_OVERHEAD,
+        }
+        available = max(0, self.budget - sum(fixed.values()))
+
+        def truncate_passage(passage, max_tokens):
+            passage = self.tokenizer.truncate(passage, max_tokens - count(PASSAGE_SEPARATOR))
+            return count(passage) + count(PASSAGE_SEPARATOR), passage
+
+        message_grams = trigrams(message)
+
+        def relevance(pair):
+            grams = trigrams(pair[0])
+            return len(grams & message_grams) / len(grams | message_grams) if grams | message_grams else 0.0
+
+        sections = {
+            'knowledge': _Section(
+                [(count(passage) + count(PASSAGE_SEPARATOR), passage) for passage in passages],
+                header=self._message_tokens(KNOWLEDGE_PREFIX), truncate=truncate_passage),
+            'training': _Section([
+                (self._message_tokens(f"Question: {q}") + self._message_tokens(f"Answer: {a}"), (q, a))
+                for q, a in sorted(training_data, key=relevance, reverse=True)
+            ]),
+            'history': _Section([
+                (self._message_tokens(user_msg) + self._message_tokens(assistant_resp), (user_msg, assistant_resp))
+                for user_msg, assistant_resp in history
+            ], contiguous=True),
+        }
+
+        # First every section gets its reserved share, then what is left over
+        # goes to the sections in priority order.
+        used = 0
+        for name in self.priority:
+            used += sections[name].fill(min(int(available * self.shares.get(name, 0)), available - used))
+        for name in self.priority:
+            used += sections[name].fill(available - used, final=True)
+
+        messages = [{"role": "system", "content": system}]
+        knowledge = sections['knowledge'].chosen
+        if knowledge:
+            messages.append({"role": "assistant", "content": KNOWLEDGE_PREFIX + PASSAGE_SEPARATOR.join(knowledge)})
+        for q, a in sections['training'].chosen:
+            messages.append({"role": "user", "content": f"Question: {q}"})
+            messages.append({"role": "assistant", "content": f"Answer: {a}"})
+        for user_msg, assistant_resp in reversed(sections['history'].chosen):
+            messages.append({"role": "user", "content": user_msg})
+            messages.append({"role": "assistant", "content": assistant_resp})
+        messages.append({"role": "user", "content": question})
+
+        breakdown = dict(fixed)
+        breakdown.update({name: section.tokens for name, section in sections.items()})
+        breakdown['total'] = sum(fixed.values()) + used
+        breakdown['budget'] = self.budget
+        breakdown['dropped'] = {name: len(section.pending) for name, section in sections.items()}
+        return messages, breakdown
+
+
+def format_breakdown(breakdown):
+    dropped = ', '.join(f"{count} {name}" for name, count in breakdown['dropped'].items() if count)
+    return (f"{breakdown['total']}/{breakdown['budget']} tokens (knowledge {breakdown['knowledge']}, "
+            f"training {breakdown['training']}, history {breakdown['history']}, "
+            f"system {breakdown['system']}, message {breakdown['message']})"
+            + (f", dropped {dropped}" if dropped else ''))
@@ -0,0 +1,102 @@
+"""
+Two-tier cache of LLM chat answers.
+
+Entries are keyed on the website, the normalized message and the website's
+knowledge_base.content_version. The version is bumped by every re-crawl
+(save_summary_to_db) and, through a trigger, by every training_data write,
+so a changed site simply stops matching its old entries. Lookups try the
+in-process LRU first, then the chat_response_cache table shared by all workers.
+"""
+import hashlib
+import threading
+
+from psycopg2.extras import execute_values
+
+from config import Config
+from utils.faq import clean_question
+from utils.lru import LRUCache
+
+
+_local = LRUCache(Config.RESPONSE_CACHE_SIZE, ttl=Config.RESPONSE_CACHE_TTL)
+
+_counters_lock = threading.Lock()
+_counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def message_key(message):
+    normalized = ' '.join(clean_question(message).split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def get_cached_response(cursor, website_id, content_version, message):
+    """
+    Return a cached answer for this message and website version, or None.
+    """
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return None
+
+    key = message_key(message)
+    response = _local.get((website_id, content_version, key))
+    if response is not None:
+        _count('local_hits')
+        return response
+
+    cursor.execute('''
+        SELECT response FROM chat_response_cache
+        WHERE website_id = %s AND message_key = %s AND content_version = %s AND expires_at > NOW()
+    ''', (website_id, key, content_version))
+    row = cursor.fetchone()
+    if row:
+        _local.put((website_id, content_version, key), row[0])
+        _count('shared_hits')
+        return row[0]
+
+    _count('misses')
+    return None
+
+
+def cache_response(website_id, content_version, message, response):
+    """
+    Cache an LLM answer in this worker right away.
+
+    Returns:
+    - The row to pass to store_responses for the shared tier, or None when
+      caching is disabled.
+    """
+    if not Config.RESPONSE_CACHE_ENABLED:
+        return None
+
+    key = message_key(message)
+    _local.put((website_id, content_version, key), response)
+    return website_id, key, content_version, response
+
+
+def store_responses(cursor, rows):
+    """Upsert cache_response rows into the shared tier in one statement."""
+    # One row per key: ON CONFLICT cannot update the same row twice in a statement.
+    latest = {(row[0], row[1]): row for row in rows if row}
+    if not latest:
+        return
+    execute_values(cursor, '''
+        INSERT INTO chat_response_cache (website_id, message_key, content_version, response, expires_at)
+        VALUES %s
+        ON CONFLICT (website_id, message_key) DO UPDATE SET
+            content_version = EXCLUDED.content_version,
+            response = EXCLUDED.response,
+            expires_at = EXCLUDED.expires_at
+    ''', list(latest.values()),
+        template=f"(%s, %s, %s, %s, NOW() + make_interval(secs => {int(Config.RESPONSE_CACHE_TTL)}))")
+
+
+def response_cache_stats():
+    with _counters_lock:
+        counters = dict(_counters)
+    lookups = sum(counters.values())
+    counters['hit_rate'] = (counters['local_hits'] + counters['shared_hits']) / lookups if lookups else 0.0
+    counters['local_entries'] = len(_local)
+    return counters
@@ -1,17 +1,268 @@
+"""
+Summarization pipeline for crawled pages.
+
+Small pages are packed several to a request, oversized pages are split into
+chunks that are summarized separately and then merged (map-reduce), and every
+request goes through a process-wide limiter that bounds concurrent LLM calls
+and tokens per minute, with retries and exponential backoff on errors.
+
+The LLM itself is a pluggable backend: OpenAI in production, or a local fake
+(Config.SUMMARY_BACKEND = 'fake') for offline throughput and cost benchmarks.
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import openai
 
-def summarize_text(text, max_tokens=100):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a summarization assistant."},
-                {"role": "user", "content": f"Summarize the following text:\n\n{text}"}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7
+from config import Config
+from utils.knowledge import chunk_text
+from utils.llm import BATCH_MARKER_RE, FakeLLMBackend, OpenAIBackend, estimate_tokens
+
+
+SYSTEM_PROMPT = "You are a summarization assistant."
+
+
+class FallbackSummary(str):
+    """Truncated page text returned when summarization failed; never cached."""
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = FakeLLMBackend() if Config.SUMMARY_BACKEND == 'fake' else OpenAIBackend()
+    return _backend
+
+
+class TokenRateLimiter:
+    """
+    Bounds concurrent LLM requests and tokens sent per rolling minute.
+
+    Callers reserve their estimated tokens before a request and settle the
+    reservation with the real usage afterwards.
+    """
+
+    def __init__(self, tokens_per_minute, max_concurrency):
+        self.tokens_per_minute = tokens_per_minute
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._window = deque()  # [timestamp, tokens] reservations from the last minute
+
+    def _used(self, now):
+        while self._window and now - self._window[0][0] >= 60:
+            self._window.popleft()
+        return sum(entry[1] for entry in self._window)
+
+    def reserve(self, tokens):
+        self._slots.acquire()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # A single request larger than the budget still runs, alone.
+                if not self._window or self._used(now) + tokens <= self.tokens_per_minute:
+                    entry = [now, tokens]
+                    self._window.append(entry)
+                    return entry
+                wait = 60 - (now - self._window[0][0])
+            time.sleep(min(max(wait, 0.01), 1.0))
+
+    def settle(self, entry, actual_tokens):
+        with self._lock:
+            entry[1] = actual_tokens
+        self._slots.release()
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = TokenRateLimiter(Config.LLM_TOKENS_PER_MINUTE, Config.LLM_MAX_CONCURRENCY)
+        return _limiter
+
+
+def _retryable(error):
+    return not isinstance(error, openai.error.InvalidRequestError)
+
+
+class BatchSummarizer:
+    """
+    Summarizes pages submitted from many threads, returning a Future per page.
+
+    Pages up to Config.SUMMARY_BATCH_PAGE_TOKENS are queued and packed up to
+    Config.SUMMARY_BATCH_SIZE pages per request; a partial batch is sent after
+    Config.SUMMARY_BATCH_WAIT seconds or on flush(). Use as a context manager.
+    """
+
+    def __init__(self, max_tokens=100, backend=None, limiter=None, concurrency=None):
+        self.max_tokens = max_tokens
+        self.backend = backend or get_backend()
+        self.limiter = limiter or get_limiter()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency or Config.CRAWL_SUMMARY_CONCURRENCY)
+        self._pending = []  # (text, future) waiting to be packed
+        self._pending_since = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'pages': 0, 'requests': 0, 'batched_pages': 0, 'split_pages': 0,
+            'prompt_tokens': 0, 'completion_tokens': 0, 'retries': 0, 'failures': 0,
+        }
+        self._batcher = threading.Thread(target=self._batch_loop, name='summary-batcher', daemon=True)
+        self._batcher.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def _add_stats(self, **values):
+        with self._stats_lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def submit(self, text):
+        future = Future()
+        self._add_stats(pages=1)
+        tokens = estimate_tokens(text)
+        if tokens > Config.SUMMARY_MAX_INPUT_TOKENS:
+            self._add_stats(split_pages=1)
+            self._executor.submit(self._run, future, self._summarize_large, text)
+        elif tokens > Config.SUMMARY_BATCH_PAGE_TOKENS or Config.SUMMARY_BATCH_SIZE <= 1:
+            self._executor.submit(self._run, future, self._summarize_one, text)
+        else:
+            with self._cond:
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                self._pending.append((text, future))
+                self._cond.notify()
+        return future
+
+    def flush(self):
+        """Send any partially filled batch now instead of waiting for it to fill."""
+        with self._cond:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), Config.SUMMARY_BATCH_SIZE):
+            self._executor.submit(self._run_batch, pending[start:start + Config.SUMMARY_BATCH_SIZE])
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._batcher.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+    def cost_estimate(self):
+        return (self.stats['prompt_tokens'] * Config.LLM_COST_PER_1K_PROMPT_TOKENS +
+                self.stats['completion_tokens'] * Config.LLM_COST_PER_1K_COMPLETION_TOKENS) / 1000
+
+    def _batch_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._pending) >= Config.SUMMARY_BATCH_SIZE:
+                        break
+                    if self._pending:
+                        remaining = self._pending_since + Config.SUMMARY_BATCH_WAIT - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+                batch = self._pending[:Config.SUMMARY_BATCH_SIZE]
+                self._pending = self._pending[Config.SUMMARY_BATCH_SIZE:]
+                self._pending_since = time.monotonic() if self._pending else None
+            self._executor.submit(self._run_batch, batch)
+
+    @staticmethod
+    def _run(future, function, *args):
+        try:
+            future.set_result(function(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _complete(self, prompt, max_tokens):
+        """One LLM request through the rate limiter, retried with backoff."""
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+        estimate = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + max_tokens
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            reservation = self.limiter.reserve(estimate)
+            used = estimate
+            try:
+                text, prompt_tokens, completion_tokens = self.backend.complete(messages, max_tokens)
+                used = prompt_tokens + completion_tokens
+                self._add_stats(requests=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+                return text
+            except Exception as e:
+                if attempt == Config.LLM_MAX_RETRIES or not _retryable(e):
+                    raise
+                self._add_stats(retries=1)
+            finally:
+                self.limiter.settle(reservation, used)
+            # Back off after settling, so the wait holds no concurrency slot; the next attempt reserves again.
+            delay = min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_BASE_DELAY * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def _summarize_one(self, text, max_tokens=None):
+        try:
+            return self._complete(f"Summarize the following text:\n\n{text}", max_tokens or self.max_tokens)
+        except Exception as e:
+            print(f"Error summarizing text, falling back to truncation: {e}")
+            self._add_stats(failures=1)
+            return FallbackSummary(text[:self.max_tokens])  # Fallback to truncation if summarization fails
+
+    def _summarize_large(self, text):
+        # Map: summarize each piece; reduce: summarize the joined partial summaries.
+        piece_chars = Config.SUMMARY_MAX_INPUT_TOKENS * 4
+        pieces = [piece for _, _, piece in chunk_text(text, chunk_size=piece_chars, overlap=0)]
+        partials = [self._summarize_one(piece) for piece in pieces]
+        return self._summarize_one("\n".join(partials))
+
+    def _run_batch(self, batch):
+        if len(batch) == 1:
+            text, future = batch[0]
+            self._run(future, self._summarize_one, text)
+            return
+
+        self._add_stats(batched_pages=len(batch))
+        documents = "\n\n".join(f"[{number}]\n{text}" for number, (text, _) in enumerate(batch, 1))
+        prompt = (
+            "Summarize each of the following documents separately. Start each summary on a new "
+            "line with the number of its document in brackets, e.g. [1].\n\n" + documents
         )
-        return response['choices'][0]['message']['content'].strip()
-    except Exception as e:
-        print(f"Error summarizing text: {e}")
-        return text[:max_tokens]  # Fallback to truncation if summarization fails
+        try:
+            reply = self._complete(prompt, self.max_tokens * len(batch))
+            parts = BATCH_MARKER_RE.split(reply)
+            summaries = {int(number): summary.strip() for number, summary in zip(parts[1::2], parts[2::2])}
+        except Exception as e:
+            print(f"Error summarizing batch of {len(batch)} pages, retrying one by one: {e}")
+            summaries = {}
+
+        for number, (text, future) in enumerate(batch, 1):
+            if summaries.get(number):
+                future.set_result(summaries[number])
+            else:
+                # The model skipped or merged this document: summarize it alone.
+                self._run(future, self._summarize_one, text)
+
+
+def summarize_text(text, max_tokens=100):
+    """Summarize a single text right away, with rate limiting and retries."""
+    with BatchSummarizer(max_tokens=max_tokens, concurrency=1) as summarizer:
+        return summarizer._summarize_one(text)
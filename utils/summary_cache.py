@@ -0,0 +1,126 @@
+"""
+Content-addressed page summaries.
+
+A page summary depends only on the cleaned page text, so summaries are keyed
+on its hash (web_crawler.content_hash) and shared across URLs, crawls and
+users: the same body served under several URLs is summarized exactly once.
+Lookups go through an in-process LRU, then the summary_cache table.
+"""
+import threading
+from concurrent.futures import Future
+
+from psycopg2.extras import execute_values
+
+from config import Config
+from utils.db import get_db_connection
+from utils.lru import LRUCache
+from utils.summarization import FallbackSummary
+
+
+# content hash -> summary, per worker
+_local = LRUCache(Config.SUMMARY_CACHE_SIZE)
+
+
+def lookup_summary(cursor, digest):
+    cursor.execute('SELECT summary FROM summary_cache WHERE content_hash = %s', (digest,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def store_summaries(cursor, summaries):
+    """Insert (content hash, summary) pairs the table does not have yet."""
+    execute_values(cursor, '''
+        INSERT INTO summary_cache (content_hash, summary) VALUES %s
+        ON CONFLICT (content_hash) DO NOTHING
+    ''', summaries)
+
+
+class CrawlSummaryCache:
+    """
+    Front of the summary cache for one crawl.
+
+    submit() returns a Future for a page summary: shared with an identical
+    body already seen in this crawl, resolved from the in-process or Postgres
+    cache, or handed to the summarizer. Summaries produced by the crawl are
+    written to Postgres in one statement by save().
+    """
+
+    def __init__(self, summarizer, shared=None):
+        self.summarizer = summarizer
+        self.shared = Config.SUMMARY_CACHE_SHARED if shared is None else shared
+        self._futures = {}  # content hash -> Future, for this crawl
+        self._new = {}  # content hash -> summary to store
+        self._lock = threading.Lock()
+        self.stats = {'pages': 0, 'crawl_hits': 0, 'local_hits': 0, 'shared_hits': 0, 'summarized': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def submit(self, text, digest):
+        with self._lock:
+            self.stats['pages'] += 1
+            future = self._futures.get(digest)
+            if future is not None:
+                self.stats['crawl_hits'] += 1
+                return future
+            future = self._futures[digest] = Future()
+
+        summary = _local.get(digest)
+        if summary is not None:
+            self._count('local_hits')
+            future.set_result(summary)
+            return future
+
+        summary = self._lookup_shared(digest)
+        if summary is not None:
+            _local.put(digest, summary)
+            self._count('shared_hits')
+            future.set_result(summary)
+            return future
+
+        self._count('summarized')
+        self.summarizer.submit(text).add_done_callback(lambda done: self._summarized(digest, future, done))
+        return future
+
+    def _lookup_shared(self, digest):
+        if not self.shared:
+            return None
+        try:
+            with get_db_connection() as conn:
+                return lookup_summary(conn.cursor(), digest)
+        except Exception as e:
+            print(f"Error reading the shared summary cache, using local cache only: {e}")
+            self.shared = False
+            return None
+
+    def _summarized(self, digest, future, done):
+        try:
+            summary = done.result()
+        except Exception as e:
+            future.set_exception(e)
+            return
+        # Truncation fallbacks are not real summaries; let the next crawl retry.
+        if not isinstance(summary, FallbackSummary):
+            _local.put(digest, summary)
+            with self._lock:
+                self._new[digest] = summary
+        future.set_result(summary)
+
+    def save(self):
+        """Write this crawl's new summaries to the shared cache."""
+        with self._lock:
+            summaries = list(self._new.items())
+            self._new.clear()
+        if not summaries or not self.shared:
+            return
+        try:
+            with get_db_connection() as conn:
+                store_summaries(conn.cursor(), summaries)
+        except Exception as e:
+            print(f"Error saving summaries to the shared cache: {e}")
+
+    def dedupe_ratio(self):
+        """Share of pages needing a summary that were served without an LLM call."""
+        pages = self.stats['pages']
+        return (pages - self.stats['summarized']) / pages if pages else 0.0
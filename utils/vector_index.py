@@ -0,0 +1,268 @@
+"""
+Semantic retrieval over knowledge chunks with NumPy.
+
+Each website gets a directory under Config.VECTOR_INDEX_DIR holding
+`vectors.npy` (float32, one L2-normalised row per chunk) and `ids.npy`
+(int64 knowledge_chunks ids, -1 for deleted rows). Workers open
+`vectors.npy` memory-mapped, so every process on the host shares the same
+pages through the OS cache instead of holding its own copy. A `.dirty`
+marker means the index missed an update and is rebuilt before its next use.
+"""
+import fcntl
+import importlib
+import io
+import math
+import os
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+
+from config import Config
+from utils.bm25 import tokenize
+from utils.lru import LRUCache
+
+
+class HashingEmbedder:
+    """
+    Local, stateless embedder: signed feature hashing of unigrams and bigrams
+    with sublinear term frequency. Needs no training data or network, and a
+    chunk's vector never changes when other chunks are added.
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim or Config.EMBEDDING_DIM
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f'{first} {second}' for first, second in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = {}
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode('utf-8'))
+                column = digest % self.dim
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                counts[column] = counts.get(column, 0.0) + sign
+            for column, value in counts.items():
+                if value:
+                    vectors[row, column] = math.copysign(1.0 + math.log(abs(value)), value)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+_embedder = None
+
+
+def get_embedder():
+    """
+    Return the configured embedder. Config.EMBEDDER is either 'hashing' or a
+    'module:ClassName' path to any class with `dim` and `embed(texts)`.
+    """
+    global _embedder
+    if _embedder is None:
+        if Config.EMBEDDER == 'hashing':
+            _embedder = HashingEmbedder()
+        else:
+            module_name, class_name = Config.EMBEDDER.split(':')
+            _embedder = getattr(importlib.import_module(module_name), class_name)()
+    return _embedder
+
+
+class VectorIndex:
+    """On-disk vector store for one website."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.vectors_path = os.path.join(directory, 'vectors.npy')
+        self.ids_path = os.path.join(directory, 'ids.npy')
+        self.dirty_path = os.path.join(directory, '.dirty')
+
+    @contextmanager
+    def _locked(self):
+        # Writers may be web workers or separate crawl-worker processes.
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def exists(self):
+        return os.path.exists(self.vectors_path) and os.path.exists(self.ids_path)
+
+    def is_dirty(self):
+        return os.path.exists(self.dirty_path)
+
+    def mark_dirty(self):
+        """Flag the index as out of step with knowledge_chunks; the next write() clears it."""
+        os.makedirs(self.directory, exist_ok=True)
+        open(self.dirty_path, 'a').close()
+
+    def version(self):
+        return os.stat(self.ids_path).st_mtime_ns
+
+    def load(self):
+        """Return (ids, vectors) with vectors memory-mapped read-only."""
+        ids = np.load(self.ids_path)
+        vectors = np.load(self.vectors_path, mmap_mode='r')
+        # Vectors are written before ids, so a concurrent append can only
+        # make `vectors` longer than `ids`; the common prefix is consistent.
+        count = min(len(ids), len(vectors))
+        return ids[:count], vectors[:count]
+
+    def _replace(self, path, array):
+        tmp_path = f'{path}.tmp{os.getpid()}'
+        np.save(tmp_path, array)
+        os.replace(tmp_path + '.npy', path)
+
+    def write(self, ids, vectors):
+        """Rewrite the whole index atomically."""
+        with self._locked():
+            self._replace(self.vectors_path, np.ascontiguousarray(vectors, dtype=np.float32))
+            self._replace(self.ids_path, np.asarray(ids, dtype=np.int64))
+            try:
+                os.remove(self.dirty_path)
+            except FileNotFoundError:
+                pass
+
+    def update(self, added_ids, added_vectors, removed_ids=()):
+        """
+        Incremental update: tombstone removed chunk ids and append new rows at
+        the end of vectors.npy, rewriting only its header in place. Compacts
+        the file when more than half of the rows are tombstones.
+        """
+        with self._locked():
+            ids = np.load(self.ids_path)
+            if len(removed_ids):
+                ids[np.isin(ids, np.asarray(removed_ids, dtype=np.int64))] = -1
+
+            live = int((ids >= 0).sum()) + len(added_ids)
+            if live < (len(ids) + len(added_ids)) / 2:
+                vectors = np.load(self.vectors_path)[:len(ids)]
+                keep = ids >= 0
+                ids = np.concatenate([ids[keep], np.asarray(added_ids, dtype=np.int64)])
+                vectors = np.concatenate([vectors[keep], added_vectors.astype(np.float32)])
+                self._replace(self.vectors_path, vectors)
+                self._replace(self.ids_path, ids)
+                return
+
+            if len(added_ids):
+                self._append_rows(added_vectors.astype(np.float32), len(ids))
+                ids = np.concatenate([ids, np.asarray(added_ids, dtype=np.int64)])
+            self._replace(self.ids_path, ids)
+
+    def _append_rows(self, rows, expected_count):
+        with open(self.vectors_path, 'r+b') as fp:
+            version = np.lib.format.read_magic(fp)
+            if version == (1, 0):
+                read_header, write_header = np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0
+            else:
+                read_header, write_header = np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0
+            shape, fortran_order, dtype = read_header(fp)
+            data_offset = fp.tell()
+            if shape[0] != expected_count or shape[1] != rows.shape[1]:
+                raise ValueError(f'{self.vectors_path} does not match ids.npy')
+
+            header = io.BytesIO()
+            write_header(header, {
+                'descr': np.lib.format.dtype_to_descr(dtype),
+                'fortran_order': fortran_order,
+                'shape': (shape[0] + len(rows), shape[1]),
+            })
+            if header.tell() != data_offset:
+                # Header would change size: fall back to a full rewrite.
+                fp.close()
+                vectors = np.concatenate([np.load(self.vectors_path), rows])
+                self._replace(self.vectors_path, vectors)
+                return
+
+            fp.seek(data_offset + shape[0] * shape[1] * dtype.itemsize)
+            fp.write(rows.tobytes())
+            fp.flush()
+            os.fsync(fp.fileno())
+            fp.seek(0)
+            fp.write(header.getvalue())
+
+    def search(self, query_vector, k=10, ids=None, vectors=None):
+        """
+        Return up to `k` (chunk_id, cosine similarity) pairs, best first.
+        """
+        if ids is None:
+            ids, vectors = self.load()
+        if not len(ids):
+            return []
+        scores = np.asarray(vectors @ query_vector, dtype=np.float32)
+        scores[ids < 0] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(int(ids[row]), float(scores[row])) for row in top if np.isfinite(scores[row]) and scores[row] > 0]
+
+
+def website_vector_index(website_id):
+    return VectorIndex(os.path.join(Config.VECTOR_INDEX_DIR, str(int(website_id))))
+
+
+# website_id -> (version, ids, memory-mapped vectors)
+_mapped_cache = LRUCache(Config.VECTOR_INDEX_CACHE_SIZE)
+
+
+def search_website_vectors(website_id, query, k=10):
+    """
+    Semantic top-k over a website's chunks, or [] if it has no vector index.
+    """
+    index = website_vector_index(website_id)
+    try:
+        version = index.version()
+    except FileNotFoundError:
+        return []
+
+    cached = _mapped_cache.get(website_id)
+    if cached is None or cached[0] != version:
+        ids, vectors = index.load()
+        cached = (version, ids, vectors)
+        _mapped_cache.put(website_id, cached)
+
+    query_vector = get_embedder().embed([query])[0]
+    return index.search(query_vector, k=k, ids=cached[1], vectors=cached[2])
+
+
+def rebuild_website_vectors(cursor, website_id):
+    """Embed every chunk of a website and rewrite its vector index."""
+    cursor.execute('''
+        SELECT id, chunk_text FROM knowledge_chunks WHERE website_id = %s ORDER BY id
+    ''', (website_id,))
+    rows = cursor.fetchall()
+    embedder = get_embedder()
+    vectors = embedder.embed([text for _, text in rows]) if rows else np.zeros((0, embedder.dim), np.float32)
+    website_vector_index(website_id).write([chunk_id for chunk_id, _ in rows], vectors)
+
+
+def update_website_vectors(cursor, website_id, added, removed_ids):
+    """
+    Apply a crawl's chunk changes to the website's vector index: embed only
+    the `added` (chunk_id, text) pairs and tombstone `removed_ids`. Falls back
+    to a full rebuild when the index does not exist yet, has another dim or
+    is marked dirty.
+    """
+    index = website_vector_index(website_id)
+    embedder = get_embedder()
+    if index.exists() and not index.is_dirty():
+        vectors = embedder.embed([text for _, text in added])
+        try:
+            index.update([chunk_id for chunk_id, _ in added], vectors, removed_ids)
+            return
+        except ValueError as e:
+            print(f"Rebuilding vector index for website {website_id}: {e}")
+    rebuild_website_vectors(cursor, website_id)
+
+
+def rebuild_dirty_website_vectors(cursor, website_id):
+    """Rebuild the website's vector index if an earlier update of it failed."""
+    if website_vector_index(website_id).is_dirty():
+        rebuild_website_vectors(cursor, website_id)
@@ -1,11 +1,28 @@
+import hashlib
+import json
 import requests
-import re
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse, urljoin
-from utils.db import get_db_connection
-import openai
-from flask import jsonify, request
-from psycopg2.extras import RealDictCursor
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlencode, urlparse, urljoin
+from config import Config
+from utils.db import PoolTimeout, get_db_connection, get_export_connection
+from utils.faq import add_training_data, match_training_answer
+from utils.response_cache import cache_response, get_cached_response
+from utils.conversation_log import get_writer, recent_history
+from utils.context_cache import get_website_context, invalidate_website_context
+from utils.summarization import BatchSummarizer, FallbackSummary
+from utils.summary_cache import CrawlSummaryCache
+from utils.near_duplicates import NearDuplicateIndex, page_signature
+from utils.boilerplate import BoilerplateDetector
+from utils.html_extract import extract_page
+from utils.knowledge import retrieve_passages, save_page_chunks
+from utils.llm import get_chat_backend
+from utils.prompt_builder import PromptBuilder, format_breakdown
+from utils.vector_index import update_website_vectors, website_vector_index
+from flask import Response, jsonify, request
+from psycopg2.extras import RealDictCursor, execute_values
 
 
 
@@ -23,180 +40,753 @@ def is_valid_url(url, base_domain):
         return False
     return True
 
-def clean_text(soup):
-    for script_or_style in soup(['script', 'style', 'meta', 'link']):
-        script_or_style.decompose()
-    text = soup.get_text(separator=' ', strip=True)
-    return ' '.join(text.split())
+class HostLimiter:
+    """
+    Per-host politeness limiter shared by the fetch workers of one crawl.
 
-def summarize_text(text, max_tokens=100):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a summarization assistant."},
-                {"role": "user", "content": f"Summarize the following text:\n\n{text}"}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7
-        )
-        return response['choices'][0]['message']['content'].strip()
-    except Exception as e:
-        print(f"Error summarizing text: {e}")
-        return text[:max_tokens]  # Fallback to truncation if summarization fails
+    At most `max_per_host` requests are in flight against the same host, and
+    consecutive requests to a host start at least `min_interval` seconds apart.
+    """
+
+    def __init__(self, max_per_host, min_interval=0.0):
+        self.max_per_host = max(1, max_per_host)
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    @contextmanager
+    def slot(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            semaphore = self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_per_host))
+        with semaphore:
+            if self.min_interval:
+                with self._lock:
+                    now = time.monotonic()
+                    start = max(now, self._next_start.get(host, now))
+                    self._next_start[host] = start + self.min_interval
+                if start > now:
+                    time.sleep(start - now)
+            yield
+
+
+_thread_local = threading.local()
+
+
+def _http_session():
+    # requests.Session is not thread-safe; keep one keep-alive session per worker thread.
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _thread_local.session = requests.Session()
+    return session
+
+
+def extract_links(hrefs, base_url, base_domain):
+    """Return crawlable outlinks of a page in document order."""
+    links = []
+    for href in hrefs:
+        next_url = urljoin(base_url, href)  # Resolve relative URLs
+        if is_valid_url(next_url, base_domain):
+            links.append(next_url.split('#')[0])  # Remove fragment identifiers
+    return links
+
+
+def _read_capped(response, max_bytes):
+    """Download at most `max_bytes` of a streamed response body."""
+    chunks, size = [], 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    return b''.join(chunks)[:max_bytes]
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
 
-def crawl_major_pages(base_url, max_pages=5):
+def _resolved(value):
+    future = Future()
+    future.set_result(value)
+    return future
+
+
+def _fetch_page(url, base_url, base_domain, limiter, previous=None):
+    """
+    Fetch stage: download and parse one page.
+
+    When `previous` crawl state is given, the request is conditional and an
+    unchanged page (304, or identical cleaned text) reuses the stored summary
+    and outlinks instead of being summarized again.
+
+    Returns a (page or None, outlinks) tuple, where page holds the validators
+    and content hash to store for the next crawl, the text 'lines' used for
+    boilerplate and near-duplicate detection (the stored ones on a 304) and,
+    for unchanged pages, a resolved summary future.
+    """
+    headers = {}
+    if previous:
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+    try:
+        with limiter.slot(url):
+            with _http_session().get(url, timeout=Config.CRAWL_REQUEST_TIMEOUT, headers=headers,
+                                     stream=True) as response:
+                if response.status_code == 304 and previous:
+                    page = dict(previous, summary=_resolved(previous['summary']), changed=False, content=None)
+                    return page, previous['links']
+                response.raise_for_status()  # Raise an error for non-200 responses
+
+                # Ensure the response contains HTML content
+                content_type = response.headers.get('Content-Type', '')
+                if 'text/html' not in content_type:
+                    return None, []
+                body = _read_capped(response, Config.CRAWL_MAX_PAGE_BYTES)
+    except requests.exceptions.RequestException as e:
+        print(f"Error crawling {url}: {e}")
+        return None, []
+
+    lines, hrefs = extract_page(body, content_type)  # Clean text content and links in one pass
+    links = extract_links(hrefs, base_url, base_domain)
+    content = ' '.join(lines)
+    if not content:
+        return None, links
+
+    page = {
+        'content': content,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_hash': content_hash(content),
+        'links': links,
+        'lines': lines,
+    }
+    if previous and previous['content_hash'] == page['content_hash']:
+        page.update(summary=_resolved(previous['summary']), changed=False, content=None)
+    else:
+        page['changed'] = True
+    return page, links
+
+
+def crawl_major_pages(base_url, max_pages=5, concurrency=None, per_host_limit=None, progress=None,
+                      page_state=None, stats=None):
     """
     Crawl a website, extract content, and summarize it.
 
+    Pages are fetched concurrently and summarized by a BatchSummarizer
+    (utils.summarization), which packs small pages into shared requests, so
+    summarization overlaps network I/O. Links are merged into the frontier in
+    the same breadth-first order as a one-at-a-time crawl, so the crawled page
+    set and the order of the results only depend on `max_pages`.
+
+    Pages whose text is a near-duplicate of a page already kept (pagination,
+    tag pages, locale variants; see utils.near_duplicates) are dropped before
+    summarization, do not count towards `max_pages`, and their outlinks are
+    only followed once the rest of the frontier is exhausted. Text lines that
+    repeat across pages (navigation, footers, banners; see utils.boilerplate)
+    are stripped before near-duplicate checks, summarization and chunking.
+
     Parameters:
     - base_url: The root URL to start crawling from.
-    - max_pages: Maximum number of pages to crawl.
+    - max_pages: Maximum number of pages to crawl, not counting near-duplicates
+      (at most max_pages * Config.CRAWL_MAX_FETCH_FACTOR pages are fetched).
+    - concurrency: Number of pages fetched in parallel (defaults to Config.CRAWL_CONCURRENCY).
+    - per_host_limit: Maximum in-flight requests per host (defaults to Config.CRAWL_PER_HOST_LIMIT).
+    - progress: Optional callable invoked with the number of pages crawled so far.
+    - page_state: Optional per-URL state from a previous crawl (see load_crawl_state);
+      unchanged pages are then skipped instead of re-summarized.
+    - stats: Optional dict filled with crawl statistics: pages crawled, skipped as
+      near-duplicates and unchanged, LLM requests and tokens, and the summary cache 'dedupe_ratio'.
 
     Returns:
-    - List of dictionaries with 'url' and 'summary' keys.
+    - List of dictionaries with 'url' and 'summary' keys, plus the 'etag',
+      'last_modified', 'content_hash', 'links', 'lines' and 'changed' crawl state of each page
+      and, for changed pages, the cleaned page 'content' without boilerplate and
+      the number of 'boilerplate_bytes' removed from it.
     """
-    visited = set()  # To track visited URLs
-    to_visit = [base_url]  # Queue of URLs to visit
+    page_state = page_state or {}
+    concurrency = concurrency or Config.CRAWL_CONCURRENCY
+    limiter = HostLimiter(per_host_limit or Config.CRAWL_PER_HOST_LIMIT, Config.CRAWL_PER_HOST_DELAY)
     base_domain = urlparse(base_url).netloc  # Extract base domain
-    all_summaries = []  # Store results as dictionaries
-
-    while to_visit and len(visited) < max_pages:
-        current_url = to_visit.pop(0)  # Get the next URL to crawl
-        if current_url in visited:  # Skip if already visited
-            continue
-        visited.add(current_url)
+    max_fetches = max_pages * Config.CRAWL_MAX_FETCH_FACTOR
+
+    # Every URL in `frontier` is crawled in discovery order until `max_pages`
+    # pages that are not near-duplicates have been merged. Entry i is needed
+    # whenever i < max_pages + (near-duplicates merged so far), so those
+    # entries can be fetched ahead of time without changing which pages are
+    # visited. Outlinks of near-duplicates wait in `deferred` and are only
+    # crawled once the regular frontier runs out.
+    frontier = [base_url]
+    seen = {base_url}
+    deferred = []
+    fetches = []
+    pages = {}  # frontier index -> page (with a summary future)
+    near_duplicates = NearDuplicateIndex()
+    dropped = []
+    # Changed pages are summarized once the first few pages have shown which
+    # lines are site-wide boilerplate (navigation, footer, banners).
+    boilerplate = BoilerplateDetector()
+    waiting = []
+
+    with ThreadPoolExecutor(max_workers=concurrency) as fetch_pool, \
+            BatchSummarizer(max_tokens=100) as summarizer:
+        # Pages with identical bodies (tracking params, print views, ...) and
+        # bodies summarized by earlier crawls share one summary.
+        summaries = CrawlSummaryCache(summarizer)
+
+        def schedule():
+            while len(fetches) < min(len(frontier), max_pages + len(dropped), max_fetches):
+                url = frontier[len(fetches)]
+                fetches.append(fetch_pool.submit(
+                    _fetch_page, url, base_url, base_domain, limiter, page_state.get(url)
+                ))
+
+        def enqueue(urls):
+            for next_url in urls:
+                if next_url not in seen:
+                    seen.add(next_url)
+                    frontier.append(next_url)
+
+        def submit_summary(index):
+            # Summarize the page without the boilerplate learned so far.
+            page = pages[index]
+            content = ' '.join(boilerplate.strip(frontier[index], page['lines']))
+            page['boilerplate_bytes'] = len(page['content'].encode('utf-8')) - len(content.encode('utf-8'))
+            page['content'] = content
+            # Keyed on the stripped text: the same page can lose more or less boilerplate per crawl
+            page['summary'] = summaries.submit(content, content_hash(content)) if content else _resolved('')
+
+        schedule()
+        merged = 0
+        while merged < len(fetches):
+            page, links = fetches[merged].result()
+            url = frontier[merged]
+            signature = match = None
+            if page is not None and page.get('lines'):
+                boilerplate.observe(url, page['lines'])
+                signature = page_signature(' '.join(boilerplate.strip(url, page['lines'])))
+                match = near_duplicates.find(signature) if signature is not None else None
+            if match:
+                dropped.append(url)
+                deferred.extend(links)
+                print(f"Skipping {url}: near-duplicate of {match[0]} ({match[1]:.0%} similar)")
+            else:
+                if page is not None:
+                    if signature is not None:
+                        near_duplicates.add(url, signature)
+                    pages[merged] = page
+                    if page['changed']:
+                        waiting.append(merged)
+                enqueue(links)
+            merged += 1
+            if progress:
+                progress(merged)
+            if boilerplate.pages >= Config.BOILERPLATE_WARMUP_PAGES:
+                for index in waiting:
+                    submit_summary(index)
+                waiting = []
+            if len(fetches) == len(frontier) == merged and deferred:
+                enqueue(deferred)
+                deferred = []
+            schedule()
+
+        for index in waiting:
+            submit_summary(index)
+        summarizer.flush()  # No more pages are coming: send the last partial batch
+        results = [
+            dict(pages[index], url=frontier[index], summary=pages[index]['summary'].result())
+            for index in sorted(pages)
+        ]
+
+    summaries.save()
+
+    llm = summarizer.stats
+    stripped = [page['boilerplate_bytes'] for page in results if 'boilerplate_bytes' in page]
+    crawl_stats = {
+        'pages': len(results),
+        'near_duplicates': len(dropped),
+        'boilerplate_bytes_removed': sum(stripped),
+        'boilerplate_bytes_per_page': sum(stripped) // len(stripped) if stripped else 0,
+        'unchanged_pages': sum(1 for page in results if not page['changed']),
+        'summary_cache_hits': summaries.stats['pages'] - summaries.stats['summarized'],
+        'dedupe_ratio': round(summaries.dedupe_ratio(), 4),
+        'llm_requests': llm['requests'],
+        'llm_tokens': llm['prompt_tokens'] + llm['completion_tokens'],
+        'llm_cost_estimate': round(summarizer.cost_estimate(), 6),
+    }
+    if stats is not None:
+        stats.update(crawl_stats)
+
+    if llm['pages']:
+        print(f"Summarized {llm['pages']} pages of {base_url} in {llm['requests']} requests "
+              f"({crawl_stats['llm_tokens']} tokens, ~${crawl_stats['llm_cost_estimate']:.4f}, "
+              f"{llm['retries']} retries, {llm['failures']} failures)")
+    if summaries.stats['pages']:
+        print(f"Summary cache for {base_url}: {crawl_stats['summary_cache_hits']} of "
+              f"{summaries.stats['pages']} changed pages reused a summary "
+              f"(dedupe ratio {crawl_stats['dedupe_ratio']:.0%})")
+    if stripped:
+        print(f"Removed {crawl_stats['boilerplate_bytes_removed']} bytes of boilerplate from {len(stripped)} "
+              f"pages of {base_url} ({crawl_stats['boilerplate_bytes_per_page']} bytes per page)")
+    if dropped:
+        print(f"Skipped {len(dropped)} near-duplicate pages of {base_url}")
+    if page_state:
+        print(f"Re-crawled {base_url}: {crawl_stats['unchanged_pages']} of {len(results)} pages unchanged")
+    return results
+
+
+
+def _find_website_id(cursor, base_url, user_id):
+    cursor.execute('''
+        SELECT id FROM knowledge_base
+        WHERE user_id = %s AND website_url = %s
+        ORDER BY id DESC LIMIT 1
+    ''', (user_id, base_url))
+    row = cursor.fetchone()
+    return row[0] if row else None
 
-        try:
-            response = requests.get(current_url, timeout=10)
-            response.raise_for_status()  # Raise an error for non-200 responses
 
-            # Ensure the response contains HTML content
-            if 'text/html' in response.headers.get('Content-Type', ''):
-                soup = BeautifulSoup(response.text, 'html.parser')
-                content = clean_text(soup)  # Clean text content from the page
-                if content:
-                    summary = summarize_text(content, max_tokens=100)
-                    all_summaries.append({'url': current_url, 'summary': summary})
+def load_crawl_state(base_url, user_id):
+    """
+    Load the per-page state stored by the last crawl of this site.
 
-                # Extract valid links for further crawling
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    next_url = urljoin(base_url, href)  # Resolve relative URLs
-                    if is_valid_url(next_url, base_domain):
-                        next_url = next_url.split('#')[0]  # Remove fragment identifiers
-                        if next_url not in visited:
-                            to_visit.append(next_url)
-        except requests.exceptions.RequestException as e:
-            print(f"Error crawling {current_url}: {e}")
+    Returns:
+    - Dictionary mapping URL to its 'etag', 'last_modified', 'content_hash',
+      'summary', 'links' and 'lines', suitable for crawl_major_pages(page_state=...).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        website_id = _find_website_id(cursor, base_url, user_id)
+        if website_id is None:
+            return {}
+        cursor.execute('''
+            SELECT url, etag, last_modified, content_hash, summary, links, lines
+            FROM crawl_pages WHERE website_id = %s
+        ''', (website_id,))
+        return {row['url']: dict(row) for row in cursor.fetchall()}
 
-    return all_summaries
 
+def _page_validators(page):
+    """
+    The (etag, last_modified, content_hash) to store for a crawled page. A
+    truncation fallback is stored without them, so the next crawl fetches and
+    summarizes the page again instead of reusing it.
+    """
+    if isinstance(page['summary'], FallbackSummary):
+        return None, None, None
+    return page.get('etag'), page.get('last_modified'), page['content_hash']
 
 
 def save_summary_to_db(base_url, summaries, user_id):
     """
     Save crawled summaries combined into a single string to the database.
 
+    Re-crawling a site the user already has updates that knowledge_base row in
+    place. Per-page crawl state (validators, content hash, summary, outlinks,
+    text lines) is stored in crawl_pages so the next crawl can skip unchanged
+    pages (but not pages whose summarization failed), and the text of changed
+    pages is split into knowledge_chunks for retrieval.
+
     Parameters:
     - base_url: The root URL that was crawled.
     - summaries: A list of dictionaries with 'url' and 'summary'.
     - user_id: The ID of the user requesting the crawl.
+
+    Returns:
+    - The ID of the knowledge_base row, or None if saving failed.
     """
     # Combine all summaries into one single string
     combined_summary = " ".join([summary['summary'] for summary in summaries])
 
     # Save the combined summary to the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
     try:
-        cursor.execute('''
-            INSERT INTO knowledge_base (website_url, summary, user_id)
-            VALUES (%s, %s, %s)
-        ''', (base_url, combined_summary, user_id))
-
-        conn.commit()  # Commit the transaction after the insert
+        with get_db_connection() as conn:  # Commits on success, rolls back on error
+            cursor = conn.cursor()
+            website_id = _find_website_id(cursor, base_url, user_id)
+            if website_id is None:
+                cursor.execute('''
+                    INSERT INTO knowledge_base (website_url, summary, user_id)
+                    VALUES (%s, %s, %s)
+                    RETURNING id
+                ''', (base_url, combined_summary, user_id))
+                website_id = cursor.fetchone()[0]
+            else:
+                cursor.execute('''
+                    UPDATE knowledge_base SET summary = %s, content_version = content_version + 1 WHERE id = %s
+                ''', (combined_summary, website_id))
+
+            pages = [page for page in summaries if page.get('content_hash')]
+            cursor.execute('''
+                DELETE FROM crawl_pages WHERE website_id = %s AND NOT (url = ANY(%s))
+            ''', (website_id, [page['url'] for page in pages]))
+            execute_values(cursor, '''
+                INSERT INTO crawl_pages (website_id, url, etag, last_modified, content_hash, summary, links, lines)
+                VALUES %s
+                ON CONFLICT (website_id, url) DO UPDATE SET
+                    etag = EXCLUDED.etag,
+                    last_modified = EXCLUDED.last_modified,
+                    content_hash = EXCLUDED.content_hash,
+                    summary = EXCLUDED.summary,
+                    links = EXCLUDED.links,
+                    lines = EXCLUDED.lines,
+                    updated_at = NOW()
+            ''', [(website_id, page['url']) + _page_validators(page) +
+                  (page['summary'], page.get('links', []), page.get('lines'))
+                  for page in pages])
+            added, removed_ids = save_page_chunks(cursor, website_id, summaries, [page['url'] for page in summaries])
     except Exception as e:
         print(f"Error saving combined summary to the database: {e}")
-        conn.rollback()  # Rollback the transaction on error
+        return None
+    invalidate_website_context(website_id)
+
+    # The vector index lives on disk, so only touch it once the chunks are committed
+    if added or removed_ids:
+        try:
+            with get_db_connection() as conn:
+                update_website_vectors(conn.cursor(), website_id, added, removed_ids)
+        except Exception as e:
+            print(f"Error updating the vector index for website {website_id}, marking it for a rebuild: {e}")
+            try:
+                website_vector_index(website_id).mark_dirty()
+            except OSError as e:
+                print(f"Error marking the vector index of website {website_id} dirty: {e}")
+    return website_id
+
+
+SUMMARY_FIELDS = ('id', 'website_url', 'summary', 'user_id', 'content_version')
+
+
+def _parse_summaries_args(args):
+    """
+    Validate the query parameters of GET /summaries.
+
+    Returns:
+    - (after_id, limit, columns, ndjson), or an error message string.
+    """
+    try:
+        after_id = int(args.get('after_id', 0))
+        limit = int(args['limit']) if 'limit' in args else None
+    except ValueError:
+        return 'after_id and limit must be integers'
+    if limit is not None and not 1 <= limit <= Config.SUMMARIES_MAX_LIMIT:
+        return f'limit must be between 1 and {Config.SUMMARIES_MAX_LIMIT}'
+
+    columns = ['id']
+    for field in args.get('fields', ','.join(SUMMARY_FIELDS)).split(','):
+        field = field.strip()
+        if field not in SUMMARY_FIELDS:
+            return f"Unknown field '{field}'; choose from {', '.join(SUMMARY_FIELDS)}"
+        if field not in columns:
+            columns.append(field)
+
+    response_format = args.get('format')
+    if response_format is None:
+        response_format = 'ndjson' if 'application/x-ndjson' in request.headers.get('Accept', '') else 'json'
+    if response_format not in ('json', 'ndjson'):
+        return "format must be 'json' or 'ndjson'"
+    return after_id, limit, columns, response_format == 'ndjson'
 
 
 def get_summaries(user_id):
     """
-    Retrieve all summaries for the authenticated user from the knowledge base.
+    Stream the authenticated user's summaries from the knowledge base.
+
+    Rows come from a server-side (named) cursor, Config.SUMMARIES_FETCH_SIZE
+    at a time, and are written out as they arrive, so the worker never holds
+    every summary at once, however many websites the user has. The connection
+    is held until the client has read the body, so it comes from the small
+    export pool (Config.DB_EXPORT_POOL_SIZE), never the main one; when every
+    export connection is busy the request gets a 503.
+
+    The ETag is computed from the IDs and content_versions of the rows, read
+    in the same snapshot as the rows themselves. A poll whose If-None-Match
+    still matches gets a 304 from that query alone.
+
+    Query parameters:
+    - after_id: Only websites with a larger ID (keyset pagination).
+    - limit: Page size, up to Config.SUMMARIES_MAX_LIMIT. Without it every
+      remaining row is returned (an export). When more rows follow, a
+      `Link: <...>; rel="next"` header points at the next page.
+    - fields: Comma-separated columns to return, e.g. 'id,website_url' to
+      leave out the summary text. 'id' is always included.
+    - format: 'ndjson' for one JSON object per line instead of a JSON array;
+      `Accept: application/x-ndjson` does the same.
 
     Parameters:
     - user_id: The ID of the authenticated user.
 
     Returns:
-    - JSON response containing the summaries.
+    - Streamed JSON response containing the summaries, 304 Not Modified, or
+      503 when the export pool is exhausted.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    parsed = _parse_summaries_args(request.args)
+    if isinstance(parsed, str):
+        return jsonify({'error': parsed}), 400
+    after_id, limit, columns, ndjson = parsed
 
     try:
-        # Fetch all summaries for the authenticated user
+        conn = get_export_connection()
+    except PoolTimeout:
+        response = jsonify({'error': 'Too many summary exports in progress, please try again'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    try:
+        cursor = conn.cursor()
+        # One snapshot for the version query and the rows, so the ETag matches the body
+        cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        # IDs and versions only (an index-only scan): the ETag, and where this page ends
         cursor.execute('''
-            SELECT * FROM knowledge_base WHERE user_id = %s
-        ''', (user_id,))
-        
-        # Fetch all rows from the query
-        rows = cursor.fetchall()
-
-        # Check if there are any rows
-        if not rows:
-            return jsonify({'message': 'No summaries found for this user.'}), 404
+            SELECT id, content_version FROM knowledge_base WHERE user_id = %s AND id > %s ORDER BY id LIMIT %s
+        ''', (user_id, after_id, None if limit is None else limit + 1))
+        versions = [tuple(row) for row in cursor.fetchall()]
 
-        # Return the summaries as a JSON response
-        return jsonify(rows), 200
+        if not versions and not after_id:
+            conn.close()
+            return jsonify({'message': 'No summaries found for this user.'}), 404
 
+        etag = _etag('summaries', user_id, columns, ndjson, limit, versions)
+        if request.if_none_match.contains_weak(etag):
+            conn.close()
+            return _with_cache_headers(Response(status=304), etag)
+
+        conditions, params = ['user_id = %s', 'id > %s'], [user_id, after_id]
+        next_after_id = None
+        if limit is not None and len(versions) > limit:
+            next_after_id = versions[limit - 1][0]
+            conditions.append('id <= %s')
+            params.append(next_after_id)
+
+        # A named cursor stays on the server; fetchmany() pulls one batch at a time
+        cursor = conn.cursor('summaries', cursor_factory=RealDictCursor)
+        cursor.execute(f'''
+            SELECT {', '.join(columns)} FROM knowledge_base
+            WHERE {' AND '.join(conditions)}
+            ORDER BY id
+        ''', params)
+        rows = cursor.fetchmany(Config.SUMMARIES_FETCH_SIZE)
     except Exception as e:
+        conn.close()
         # Handle any errors and return a 500 response
         return jsonify({'error': str(e)}), 500
 
+    def generate(rows):
+        try:
+            if not ndjson:
+                yield '['
+            separator = ''
+            while rows:
+                for row in rows:
+                    if ndjson:
+                        yield json.dumps(row) + '\n'
+                    else:
+                        yield separator + json.dumps(row)
+                        separator = ','
+                rows = cursor.fetchmany(Config.SUMMARIES_FETCH_SIZE)
+            if not ndjson:
+                yield ']'
+        except Exception as e:
+            # The status line is already sent; the client sees a truncated body.
+            print(f"Error streaming summaries: {e}")
+        finally:
+            conn.close()
+
+    response = Response(generate(rows), mimetype='application/x-ndjson' if ndjson else 'application/json')
+    # Also returns the connection if the client goes away before the body is read
+    response.call_on_close(conn.close)
+    _with_cache_headers(response, etag)
+    if next_after_id is not None:
+        query = urlencode({'after_id': next_after_id, 'limit': limit, 'fields': ','.join(columns)})
+        response.headers['Link'] = f'</summaries?{query}>; rel="next"'
+    return response
+
 
 def get_summary_by_website_id(user_id, website_id):
     """
     Retrieve a specific summary by website ID for the authenticated user.
 
+    The response carries an ETag derived from the row's content_version.
+    A request whose If-None-Match still matches gets a 304 after a version
+    lookup, without the summary text being read.
+
     Parameters:
     - user_id: The ID of the authenticated user.
     - website_id: The ID of the website summary to retrieve.
 
     Returns:
-    - JSON response containing the website summary.
+    - JSON response containing the website summary, or 304 Not Modified.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-
     try:
-        # Fetch the summary for the given website_id and user_id
-        cursor.execute('''
-            SELECT * FROM knowledge_base
-            WHERE id = %s AND user_id = %s
-        ''', (website_id, user_id))
-
-        # Fetch the single row (summary) from the query
-        row = cursor.fetchone()
+        with get_db_connection() as conn:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+
+            if request.if_none_match:
+                cursor.execute('''
+                    SELECT content_version FROM knowledge_base
+                    WHERE id = %s AND user_id = %s
+                ''', (website_id, user_id))
+                version = cursor.fetchone()
+                if version:
+                    etag = _etag('summary', user_id, website_id, version['content_version'])
+                    if request.if_none_match.contains_weak(etag):
+                        return _with_cache_headers(Response(status=304), etag)
+
+            # Fetch the summary for the given website_id and user_id
+            cursor.execute('''
+                SELECT * FROM knowledge_base
+                WHERE id = %s AND user_id = %s
+            ''', (website_id, user_id))
+
+            # Fetch the single row (summary) from the query
+            row = cursor.fetchone()
 
         # Check if a summary was found
         if not row:
             return jsonify({'message': 'Summary not found for this website.'}), 404
 
         # Return the summary as a JSON response
-        return jsonify(row), 200
+        etag = _etag('summary', user_id, website_id, row['content_version'])
+        return _with_cache_headers(jsonify(row), etag), 200
 
     except Exception as e:
         # Handle any errors and return a 500 response
         return jsonify({'error': str(e)}), 500
 
-def clean_question(question):
-    # Remove question mark and normalize whitespace
-    question = question.strip().lower()
-    question = re.sub(r'[^\w\s]', '', question)  # Remove punctuation (except spaces)
-    return question
+
+def _etag(*parts):
+    """Strong ETag for a representation determined entirely by `parts`."""
+    return hashlib.sha1(json.dumps(parts, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def _with_cache_headers(response, etag):
+    """
+    Let clients keep a summary response, but revalidate it (If-None-Match)
+    on every use. It is per user, so shared caches must not store it.
+    """
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = Config.SUMMARIES_CACHE_CONTROL
+    response.vary.update(('Authorization', 'Accept'))
+    return response
+
+
+def add_training_data_route(user_id, website_id):
+    """
+    Add curated question/answer pairs for one of the user's websites.
+
+    Parameters:
+    - user_id: The authenticated user ID.
+    - website_id: The ID of the website in the knowledge base.
+    - question, answer: A single pair, or 'pairs': a list of them.
+
+    Returns:
+    - JSON response with the IDs of the stored training_data rows.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "A JSON object is required"}), 400
+    pairs = data.get('pairs') or [{'question': data.get('question'), 'answer': data.get('answer')}]
+    if not isinstance(pairs, list) or not all(isinstance(pair, dict) for pair in pairs):
+        return jsonify({"error": "pairs must be a list of objects"}), 400
+    if not all(isinstance(pair.get('question'), str) and pair['question'].strip() and
+               isinstance(pair.get('answer'), str) and pair['answer'].strip() for pair in pairs):
+        return jsonify({"error": "question and answer are required"}), 400
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM knowledge_base WHERE id = %s AND user_id = %s', (website_id, user_id))
+            if not cursor.fetchone():
+                return jsonify({'message': 'Summary not found for this website.'}), 404
+
+            ids = [add_training_data(cursor, website_id, pair['question'], pair['answer']) for pair in pairs]
+        invalidate_website_context(website_id)
+        return jsonify({"message": "Training data saved", "ids": ids}), 201
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def _prepare_chat(website_id, user_message):
+    """
+    Do everything the chatbot needs before asking the LLM.
+
+    Parameters:
+    - website_id: The ID of the website from the knowledge base.
+    - user_message: The user's query message.
+
+    Returns:
+    - None if the website has no knowledge base, else an
+      (answer, context, content_version) tuple. `answer` is a cached or curated
+      answer that needs no LLM call; otherwise it is None and `context` holds
+      the messages to send to the LLM.
+    """
+    # Retrieve knowledge base (summarized website content)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        # The same question against unchanged content gets the earlier answer.
+        # A hit costs one primary-key lookup of the content_version, which changes
+        # on every re-crawl and training-data write: no context is loaded and
+        # OpenAI is not called, whether or not the context cache is warm.
+        if Config.RESPONSE_CACHE_ENABLED:
+            cursor.execute('SELECT content_version FROM knowledge_base WHERE id = %s', (website_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cached_response = get_cached_response(cursor, website_id, row[0], user_message)
+            if cached_response is not None:
+                get_writer().append(website_id, user_message, cached_response)
+                return cached_response, None, row[0]
+
+        # On a miss, the summary, training data and BM25 index come from this
+        # worker's context cache; the answer is cached under the version they were loaded at.
+        website = get_website_context(cursor, website_id)
+        if website is None:
+            return None
+        content_version = website.content_version
+
+        # Check if the user message matches (exactly or closely) one of the
+        # trained questions; if so, answer with the curated response
+        matched_answer = match_training_answer(cursor, website_id, user_message, website.answers)
+        if matched_answer:
+            return matched_answer, None, content_version
+
+        # Only the chunks relevant to this message go into the prompt
+        passages = retrieve_passages(cursor, website_id, user_message, context=website)
+
+        # Training data (questions & answers) for the specific website
+        training_data = website.training_data
+
+        # Retrieve the last 4 conversations from the conversation history,
+        # including turns still waiting to be written
+        conversation_history = recent_history(cursor, website_id, 4)
+
+    # Create context for OpenAI from the website knowledge, training data and
+    # history, fitted into the prompt token budget
+    context, breakdown = PromptBuilder().build(
+        "You are a helpful chatbot that answers user queries based on the provided website knowledge.",
+        user_message, passages, training_data, conversation_history
+    )
+    if Config.PROMPT_LOG_TOKENS:
+        print(f"Chat prompt for website {website_id}: {format_breakdown(breakdown)}")
+    return None, context, content_version
+
+
+def _save_chat_turn(website_id, content_version, user_message, assistant_response):
+    # Save this new conversation: cached in this worker now, written to the
+    # conversation_history and shared cache tables in the next batch
+    cache_row = cache_response(website_id, content_version, user_message, assistant_response)
+    get_writer().append(website_id, user_message, assistant_response, cache_row)
+
+
+def wants_event_stream():
+    return 'text/event-stream' in request.headers.get('Accept', '')
 
 
 def chatbot(user_id):
@@ -204,6 +794,9 @@ def chatbot(user_id):
     Handles user queries, retrieves website knowledge and training data, 
     and generates a response using OpenAI's GPT model.
 
+    Requests sent with `Accept: text/event-stream` get a streamed answer
+    instead (see chatbot_stream).
+
     Parameters:
     - user_id: The authenticated user ID.
     - website_id: The ID of the website from the knowledge base.
@@ -212,92 +805,82 @@ def chatbot(user_id):
     Returns:
     - JSON response with the chatbot's answer or an error message.
     """
+    if wants_event_stream():
+        return chatbot_stream(user_id)
+
     user_message = request.json.get('message')
     website_id = request.json.get('website_id')
 
     if not user_message:
         return jsonify({"error": "Message is required"}), 400
 
-    # Retrieve knowledge base (summarized website content)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Fetch the website summary from the knowledge base table
-    cursor.execute('SELECT summary FROM knowledge_base WHERE id = %s', (website_id,))
-    knowledge_base = cursor.fetchone()
-
-    if not knowledge_base:
-        conn.close()
+    prepared = _prepare_chat(website_id, user_message)
+    if prepared is None:
         return jsonify({"error": "No knowledge base found for the given website."}), 404
+    answer, context, content_version = prepared
+    if answer is not None:
+        return jsonify({"response": answer})
 
-    # Retrieve training data (questions & answers) for the specific website
-    cursor.execute('SELECT question, answer FROM training_data WHERE website_id = %s', (website_id,))
-    training_data = cursor.fetchall()
+    # Generate response using OpenAI API
+    assistant_response, _, _ = get_chat_backend().complete(context, Config.CHAT_MAX_TOKENS)
 
-    # Retrieve the last 4 conversations from the conversation history
-    cursor.execute('''
-        SELECT user_message, assistant_response 
-        FROM conversation_history 
-        WHERE website_id = %s 
-        ORDER BY id DESC LIMIT 4
-    ''', (website_id,))
-    conversation_history = cursor.fetchall()
-
-    conn.close()
-
-    # Clean the user input (optional function for preprocessing)
-    cleaned_user_message = clean_question(user_message)
-
-    # Check if the user message matches any of the questions in the training data
-    matched_answer = None
-    for question, answer in training_data:
-        cleaned_question = clean_question(question)
-        if cleaned_question == cleaned_user_message:  # Case-insensitive match
-            matched_answer = answer
-            break
+    _save_chat_turn(website_id, content_version, user_message, assistant_response)
+    return jsonify({"response": assistant_response})
 
-    # If there's a matched answer in training data, use that as the response
-    if matched_answer:
-        return jsonify({"response": matched_answer})
 
-    # Create context for OpenAI based on website summary and training data
-    context = [{"role": "system", "content": 
-                "You are a helpful chatbot that answers user queries based on the provided website knowledge."}]
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    # Add website knowledge summary to the context
-    context.append({"role": "assistant", "content": f"Website Knowledge: {knowledge_base[0]}"})
 
-    # Add training data to the context (questions and answers)
-    for question, answer in training_data:
-        context.append({"role": "user", "content": f"Question: {question}"})
-        context.append({"role": "assistant", "content": f"Answer: {answer}"})
+def chatbot_stream(user_id):
+    """
+    Streaming variant of chatbot(): the answer is sent as Server-Sent Events
+    while the LLM generates it, so the widget can show it word by word.
 
-    # Add the last 4 conversations to the context
-    for user_msg, assistant_resp in reversed(conversation_history):
-        context.append({"role": "user", "content": user_msg})
-        context.append({"role": "assistant", "content": assistant_resp})
+    Events:
+    - token: {"token": "..."} for each piece of the answer.
+    - done: {"response": "..."} with the full answer, once it is saved to
+      the conversation history.
+    - error: {"error": "..."} if generation fails midway.
 
-    # Add the current user message to the context
-    context.append({"role": "user", "content": f"User asked: {user_message}"})
+    Returns:
+    - A text/event-stream response, or a JSON error before streaming starts.
+    """
+    user_message = request.json.get('message')
+    website_id = request.json.get('website_id')
 
-    # Generate response using OpenAI API
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=context,
-        max_tokens=150,
-        temperature=0.7
-    )
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
 
-    # Save this new conversation in the database
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    prepared = _prepare_chat(website_id, user_message)
+    if prepared is None:
+        return jsonify({"error": "No knowledge base found for the given website."}), 404
+    answer, context, content_version = prepared
 
-    # Insert the conversation into the conversation_history table
-    cursor.execute('''
-        INSERT INTO conversation_history (website_id, user_message, assistant_response) 
-        VALUES (%s, %s, %s)
-    ''', (website_id, user_message, response['choices'][0]['message']['content'].strip()))
-    conn.commit()
-    conn.close()
+    def generate():
+        if answer is not None:
+            yield _sse('token', {'token': answer})
+            yield _sse('done', {'response': answer})
+            return
+
+        pieces = []
+        try:
+            for piece in get_chat_backend().stream(context, Config.CHAT_MAX_TOKENS):
+                pieces.append(piece)
+                yield _sse('token', {'token': piece})
+        except Exception as e:
+            print(f"Error streaming chat response: {e}")
+            yield _sse('error', {'error': 'The response could not be completed.'})
+            return
+
+        # Only a completed answer is kept; a client that disconnects midway
+        # closes this generator before it gets here.
+        assistant_response = ''.join(pieces).strip()
+        try:
+            _save_chat_turn(website_id, content_version, user_message, assistant_response)
+        except Exception as e:
+            print(f"Error saving streamed chat response: {e}")
+        yield _sse('done', {'response': assistant_response})
 
-    return jsonify({"response": response['choices'][0]['message']['content'].strip()})
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})